@@ -0,0 +1,369 @@
+# reverie/audio_pipeline.py
+
+import math
+import queue
+import threading
+import time
+import wave
+from typing import Callable, Optional
+
+import numpy as np
+
+
+class FrameRingBuffer:
+    """
+    A bounded, preallocated FIFO of audio frames between the capture thread and the VAD.
+
+    `put` never blocks, so the capture thread always gets back to reading the device in
+    time. When the buffer is full the oldest frame is overwritten and counted in
+    `dropped_frames`. `get` blocks until a frame arrives, and returns None once the
+    buffer is closed and drained.
+    """
+
+    def __init__(self, capacity: int, frame_bytes: int):
+        self.capacity = capacity
+        self.frame_bytes = frame_bytes
+        self.buffer = bytearray(capacity * frame_bytes)
+        self.lengths = [0] * capacity  # The last frame of a recording may be short
+        self.read_count = 0
+        self.write_count = 0
+        self.dropped_frames = 0
+        self.high_water = 0  # Most frames ever waiting at once
+        self.closed = False
+        self._condition = threading.Condition()
+
+    def __len__(self):
+        with self._condition:
+            return self.write_count - self.read_count
+
+    def put(self, frame: bytes):
+        if len(frame) > self.frame_bytes:
+            raise ValueError(f"Frame of {len(frame)} bytes exceeds the ring's {self.frame_bytes}-byte slots")
+        with self._condition:
+            if self.write_count - self.read_count == self.capacity:
+                self.read_count += 1
+                self.dropped_frames += 1
+            slot = self.write_count % self.capacity
+            start = slot * self.frame_bytes
+            self.buffer[start:start + len(frame)] = frame
+            self.lengths[slot] = len(frame)
+            self.write_count += 1
+            self.high_water = max(self.high_water, self.write_count - self.read_count)
+            self._condition.notify()
+
+    def get(self) -> Optional[bytes]:
+        with self._condition:
+            while self.read_count == self.write_count:
+                if self.closed:
+                    return None
+                self._condition.wait()
+            slot = self.read_count % self.capacity
+            start = slot * self.frame_bytes
+            self.read_count += 1
+            return bytes(self.buffer[start:start + self.lengths[slot]])
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify_all()
+
+class VadSegmenter:
+    """
+    Turns a stream of fixed-size frames into utterances.
+
+    Speech starts once at least `start_ratio` of the last `start_frames` frames are
+    voiced, and ends once at most `end_ratio` of the last `end_frames` are. Both ratios
+    come from running counts over one circular history, so each frame costs O(1) and a
+    stray voiced or unvoiced frame doesn't start or end anything on its own. While idle,
+    the latest `start_frames + pre_roll_frames` frames are kept, and they open every
+    utterance so quiet word onsets before the trigger aren't clipped. Only frames heard
+    since the previous utterance ended count, so the lead-in never reaches back past it.
+
+    Audio is copied into one of `buffers` preallocated segment buffers, and push()
+    returns the finished utterance as a memoryview of it. Nothing is allocated per frame.
+    A view stays valid until `buffers - 1` more utterances have been returned; an
+    utterance longer than `max_segment_frames` is cut there.
+    `on_speech_start()`, if given, is called as soon as speech starts (e.g. for barge-in).
+    """
+
+    def __init__(
+        self,
+        is_speech: Callable[[bytes], bool],
+        frame_bytes: int,
+        start_frames: int = 30,
+        start_ratio: float = 0.8,
+        end_frames: int = 60,
+        end_ratio: float = 0.1,
+        pre_roll_frames: int = 20,
+        max_segment_frames: int = 3000,
+        buffers: int = 2,
+        on_speech_start: Optional[Callable[[], None]] = None
+    ):
+        self.is_speech = is_speech
+        self.frame_bytes = frame_bytes
+        self.start_frames = start_frames
+        self.end_frames = end_frames
+        self.start_threshold = max(1, math.ceil(start_ratio * start_frames))
+        self.end_threshold = math.floor(end_ratio * end_frames)
+        self.on_speech_start = on_speech_start
+
+        self.history = bytearray(max(start_frames, end_frames))  # 1 per voiced frame, circular
+        self.frames_seen = 0
+        self.start_voiced = 0  # Voiced frames among the last start_frames
+        self.end_voiced = 0    # Voiced frames among the last end_frames
+
+        self.lead_frames = start_frames + pre_roll_frames
+        self.lead = bytearray(self.lead_frames * frame_bytes)  # Circular; the latest frames while idle
+        self.lead_since = 0  # First frame of the current idle stretch; older lead frames are stale
+        self.segment_buffers = [bytearray((self.lead_frames + max_segment_frames) * frame_bytes)
+                                for _ in range(buffers)]
+        self.current = 0
+        self.length = 0  # Bytes of the utterance in progress
+        self.is_speaking = False
+        self.segments_truncated = 0
+
+    def push(self, frame: bytes) -> Optional[memoryview]:
+        """
+        Feeds one frame and returns the finished utterance when speech ends.
+        """
+        if len(frame) != self.frame_bytes:
+            raise ValueError(f"Expected {self.frame_bytes}-byte frames, got {len(frame)} bytes")
+        voiced = 1 if self.is_speech(frame) else 0
+
+        history, position = self.history, self.frames_seen
+        size = len(history)
+        self.start_voiced += voiced - (history[(position - self.start_frames) % size]
+                                       if position >= self.start_frames else 0)
+        self.end_voiced += voiced - (history[(position - self.end_frames) % size]
+                                     if position >= self.end_frames else 0)
+        history[position % size] = voiced
+        self.frames_seen = position + 1
+
+        if not self.is_speaking:
+            offset = (position % self.lead_frames) * self.frame_bytes
+            self.lead[offset:offset + self.frame_bytes] = frame
+            if self.start_voiced >= self.start_threshold:
+                self._start()
+            return None
+
+        buffer = self.segment_buffers[self.current]
+        buffer[self.length:self.length + self.frame_bytes] = frame
+        self.length += self.frame_bytes
+        if self.end_voiced <= self.end_threshold:
+            print("Speech ended.")
+            return self._finish()
+        if self.length == len(buffer):
+            print("Speech segment reached its maximum length; cutting it here.")
+            self.segments_truncated += 1
+            return self._finish()
+        return None
+
+    def flush(self) -> Optional[memoryview]:
+        """
+        Returns the utterance in progress, if any, e.g. when the source runs out.
+        """
+        return self._finish() if self.is_speaking else None
+
+    def _start(self):
+        # Open the utterance with the buffered lead-in, oldest frame first
+        buffer = self.segment_buffers[self.current]
+        frames = min(self.frames_seen - self.lead_since, self.lead_frames)
+        oldest = (self.frames_seen - frames) % self.lead_frames
+        first_part = min(frames, self.lead_frames - oldest) * self.frame_bytes
+        start = oldest * self.frame_bytes
+        buffer[:first_part] = self.lead[start:start + first_part]
+        buffer[first_part:frames * self.frame_bytes] = self.lead[:frames * self.frame_bytes - first_part]
+        self.length = frames * self.frame_bytes
+        self.is_speaking = True
+        print("Speech started...")
+        if self.on_speech_start is not None:
+            self.on_speech_start()
+
+    def _finish(self) -> memoryview:
+        segment = memoryview(self.segment_buffers[self.current])[:self.length]
+        self.current = (self.current + 1) % len(self.segment_buffers)
+        self.length = 0
+        self.is_speaking = False
+        self.lead_since = self.frames_seen
+        return segment
+
+def energy_vad(threshold: float = 500.0) -> Callable[[bytes], bool]:
+    """
+    A crude voice activity detector for offline runs: a frame is speech when the RMS
+    of its 16-bit samples exceeds `threshold`.
+    """
+    def is_speech(frame: bytes) -> bool:
+        samples = np.frombuffer(frame, dtype="<i2").astype(np.float32)
+        return bool(len(samples)) and float(np.sqrt(np.mean(samples * samples))) > threshold
+
+    return is_speech
+
+class WavFileSource:
+    """
+    Plays a 16-bit WAV file as a stream of `frame_ms` frames, standing in for the
+    microphone in tests and benchmarks. With `realtime`, frames are paced like a live
+    device; otherwise they are returned as fast as they are read. A short final frame is
+    padded with silence, and `read` returns None at the end of the file.
+    """
+
+    def __init__(self, path: str, frame_ms: int = 10, realtime: bool = False):
+        with wave.open(path, "rb") as wav:
+            self.sample_rate = wav.getframerate()
+            self.channels = wav.getnchannels()
+            self.data = wav.readframes(wav.getnframes())
+        self.frame_bytes = self.sample_rate * frame_ms // 1000 * self.channels * 2
+        self.frame_seconds = frame_ms / 1000
+        self.realtime = realtime
+        self.position = 0
+        self.started = None
+
+    def read(self) -> Optional[bytes]:
+        if self.position >= len(self.data):
+            return None
+        if self.realtime:
+            if self.started is None:
+                self.started = time.monotonic()
+            due = self.started + (self.position // self.frame_bytes) * self.frame_seconds
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+        frame = self.data[self.position:self.position + self.frame_bytes]
+        self.position += self.frame_bytes
+        return frame.ljust(self.frame_bytes, b"\0")
+
+    def close(self):
+        pass
+
+class AudioPipeline:
+    """
+    Captures, segments and handles speech on three threads, so the audio source is read
+    continuously while earlier utterances are still being transcribed and answered.
+
+    capture:   source.read() -> FrameRingBuffer (never blocks; overflow drops the oldest frames)
+    segmenter: ring -> VadSegmenter -> segment queue (blocks when `max_pending_segments` are waiting)
+    worker:    segment queue -> handle_segment(audio, sample_rate, channels)
+
+    `audio` is a memoryview of the utterance's 16-bit PCM. The segmenter reuses its
+    buffers, so handle_segment must copy anything it keeps after returning.
+
+    A slow worker therefore backs up into the segment queue, then into the ring, and only
+    loses audio once `ring_seconds` of it are waiting. Both are counted in stats().
+
+    `source` needs read() (returning None at the end), close(), and sample_rate,
+    channels and frame_bytes attributes. `on_speech_start()` runs on the segmenter
+    thread whenever new speech is detected.
+    """
+
+    def __init__(
+        self,
+        source,
+        is_speech: Callable[[bytes], bool],
+        handle_segment: Callable[[memoryview, int, int], None],
+        ring_seconds: float = 10.0,
+        max_pending_segments: int = 4,
+        start_frames: int = 30,
+        end_frames: int = 60,
+        pre_roll_frames: int = 20,
+        on_speech_start: Optional[Callable[[], None]] = None
+    ):
+        self.source = source
+        self.handle_segment = handle_segment
+        # One buffer being filled, one being handled and one per queued segment
+        self.segmenter = VadSegmenter(is_speech, source.frame_bytes, start_frames=start_frames, end_frames=end_frames,
+                                      pre_roll_frames=pre_roll_frames, buffers=max_pending_segments + 2,
+                                      on_speech_start=on_speech_start)
+        frame_seconds = source.frame_bytes / (source.sample_rate * source.channels * 2)
+        self.ring = FrameRingBuffer(max(1, int(ring_seconds / frame_seconds)), source.frame_bytes)
+        self.segments = queue.Queue(maxsize=max_pending_segments)
+
+        self.frames_captured = 0
+        self.segments_queued = 0
+        self.segments_processed = 0
+        self.segments_failed = 0
+        self.segment_queue_high_water = 0
+        self.backpressure_seconds = 0.0  # Time the segmenter spent waiting for room in the segment queue
+
+        self._stopping = threading.Event()
+        self._threads = [
+            threading.Thread(target=self._capture, name="audio-capture", daemon=True),
+            threading.Thread(target=self._segment, name="audio-segmenter", daemon=True),
+            threading.Thread(target=self._work, name="audio-worker", daemon=True),
+        ]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """
+        Waits for the source to run out and every utterance to be handled.
+        Returns False if `timeout` expired first.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+            if thread.is_alive():
+                return False
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> bool:
+        """
+        Stops capturing and waits for already-captured utterances to be handled.
+        """
+        self._stopping.set()
+        return self.wait(timeout)
+
+    def _capture(self):
+        try:
+            while not self._stopping.is_set():
+                frame = self.source.read()
+                if frame is None:
+                    break
+                self.frames_captured += 1
+                self.ring.put(frame)
+        except Exception as e:
+            print(f"Error capturing audio: {e}")
+        finally:
+            self.source.close()
+            self.ring.close()
+
+    def _segment(self):
+        while True:
+            frame = self.ring.get()
+            segment = self.segmenter.flush() if frame is None else self.segmenter.push(frame)
+            if segment is not None:
+                waited = time.monotonic()
+                self.segments.put(segment)
+                self.backpressure_seconds += time.monotonic() - waited
+                self.segments_queued += 1
+                self.segment_queue_high_water = max(self.segment_queue_high_water, self.segments.qsize())
+            if frame is None:
+                self.segments.put(None)
+                return
+
+    def _work(self):
+        while True:
+            segment = self.segments.get()
+            if segment is None:
+                return
+            try:
+                self.handle_segment(segment, self.source.sample_rate, self.source.channels)
+                self.segments_processed += 1
+            except Exception as e:
+                print(f"Error handling speech segment: {e}")
+                self.segments_failed += 1
+
+    def stats(self) -> dict:
+        return {
+            "frames_captured": self.frames_captured,
+            "frames_dropped": self.ring.dropped_frames,
+            "ring_high_water": self.ring.high_water,
+            "ring_capacity": self.ring.capacity,
+            "segments_queued": self.segments_queued,
+            "segments_processed": self.segments_processed,
+            "segments_failed": self.segments_failed,
+            "segments_truncated": self.segmenter.segments_truncated,
+            "segment_queue_high_water": self.segment_queue_high_water,
+            "backpressure_seconds": self.backpressure_seconds,
+        }
@@ -0,0 +1,1228 @@
+# reverie/benchmarks.py
+"""
+Offline benchmarks for Reverie. Run with `python -m reverie.benchmarks <name>`.
+Nothing here talks to the real OpenAI API; completions come from reverie.fake_openai.
+End-to-end runs of the CLI, Discord, tagging and voice paths are in reverie.e2e_benchmarks.
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+from datetime import datetime, timezone
+
+import openai
+
+from reverie import gpt_utils
+from reverie.fake_openai import FakeOpenAIServer, tagging_reply
+from reverie.synthetic_audio import (
+    read_wav_frames, synthetic_session, write_synthetic_wake_fixtures, write_synthetic_wav_fixtures
+)
+
+
+def use_fake_server(server: FakeOpenAIServer):
+    """
+    Points gpt_utils' sync and async clients at a local fake server.
+    """
+    openai.api_key = "fake-key"
+    openai.base_url = server.base_url
+
+def bench_async_concurrency(concurrency_levels=(1, 4, 16, 64), messages: int = 64, latency: float = 0.1):
+    """
+    Sends `messages` chat turns through query_gpt_async at each concurrency level and
+    reports throughput. With a non-blocking path, throughput should scale roughly
+    linearly with concurrency until the fake server's latency stops dominating.
+    """
+    results = []
+    with FakeOpenAIServer(latency=latency) as server:
+        use_fake_server(server)
+
+        async def run(concurrency: int):
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def one_turn(n: int):
+                async with semaphore:
+                    conversation = [{"role": "user", "content": f"Message {n}"}]
+                    return await gpt_utils.query_gpt_async(conversation)
+
+            start = time.perf_counter()
+            replies = await asyncio.gather(*(one_turn(n) for n in range(messages)))
+            elapsed = time.perf_counter() - start
+            assert all(replies), "fake server returned an empty reply"
+
+            # The async client is bound to this event loop, so close it before asyncio.run() returns
+            await gpt_utils.get_async_client().close()
+            gpt_utils.async_client = None
+            return elapsed
+
+        for concurrency in concurrency_levels:
+            elapsed = asyncio.run(run(concurrency))
+            results.append({
+                "concurrency": concurrency,
+                "messages": messages,
+                "seconds": elapsed,
+                "messages_per_second": messages / elapsed,
+            })
+            print(f"concurrency={concurrency:>3}  {messages} messages in {elapsed:.2f}s  "
+                  f"({messages / elapsed:.1f} msg/s)")
+    return results
+
+def synthetic_conversations(conversations: int, messages_each: int):
+    for c in range(conversations):
+        yield f"conversation-{c}", {
+            f"message-{c}-{m}": f"Message {m} of conversation {c}: what do you think about tide pools and the moon?"
+            for m in range(messages_each)
+        }
+
+def bench_tagging_batch(messages: int = 1000, messages_per_conversation: int = 50, concurrency: int = 8,
+                        latency: float = 0.05, batch_token_budget: int = 4000, count_tokens=None):
+    """
+    Tags `messages` synthetic messages once with one request per message and once with
+    batched prompts, and reports requests, estimated tokens and wall-clock per 1,000 messages.
+    """
+    from reverie.tagging_engine import TaggingEngine
+
+    results = []
+    for mode, budget in (("single", None), ("batched", batch_token_budget)):
+        sent_tokens = []
+
+        def reply(body):
+            sent_tokens.append(gpt_utils.estimate_request_tokens(body["messages"], body.get("max_tokens", 0)))
+            return tagging_reply(body)
+
+        with FakeOpenAIServer(latency=latency, reply=reply) as server:
+            use_fake_server(server)
+            original_scheduler = gpt_utils.scheduler
+            gpt_utils.scheduler = gpt_utils.RequestScheduler(1_000_000, 1_000_000_000)  # The fake server has no quota
+            engine_args = {"count_tokens": count_tokens} if count_tokens else {}
+            engine = TaggingEngine(lambda conversation_id, tags: None, concurrency=concurrency,
+                                   report_interval=3600, batch_token_budget=budget, **engine_args)
+            try:
+                start = time.perf_counter()
+                progress = engine.run(synthetic_conversations(messages // messages_per_conversation,
+                                                              messages_per_conversation))
+                elapsed = time.perf_counter() - start
+            finally:
+                gpt_utils.scheduler = original_scheduler
+
+        tagged = progress.messages_tagged
+        results.append({
+            "mode": mode,
+            "messages": tagged,
+            "requests": server.request_count,
+            "seconds_per_1000_messages": elapsed / tagged * 1000,
+            "estimated_tokens_per_message": sum(sent_tokens) / tagged,
+        })
+        print(f"{mode:>8}: {server.request_count} requests, {elapsed / tagged * 1000:.2f}s per 1,000 messages, "
+              f"~{sum(sent_tokens) / tagged:.0f} tokens per message")
+    return results
+
+def bench_context_window(turns: int = 1000, token_budget: int = 4000, count_tokens=None):
+    """
+    Simulates a `turns`-turn session and compares sending the full history with the
+    token-budgeted ContextWindow. Per-turn cost is the time to add the new messages,
+    assemble the prompt and serialize it as the HTTP client would. Prompt size and cost
+    should stay flat for the window and grow linearly for the full history.
+    """
+    from reverie.context_window import ContextWindow
+
+    count_tokens = count_tokens or gpt_utils.count_tokens
+    system_prompt = gpt_utils.initialize_cli_log()[0]["content"]
+    user_text = "Tell me more about how tide pools change between the spring and neap tides. " * 3
+    assistant_text = "Tide pools are shaped by the range between high and low water, which varies. " * 8
+
+    def simulate(add, prompt):
+        timings = []
+        for _ in range(turns):
+            start = time.perf_counter()
+            add("user", user_text)
+            add("assistant", assistant_text)
+            messages = prompt()
+            json.dumps(messages)
+            timings.append(time.perf_counter() - start)
+        return timings
+
+    full_history = [{"role": "system", "content": system_prompt}]
+    full_tokens = [count_tokens(system_prompt)]
+
+    def add_full(role, content):
+        full_history.append({"role": role, "content": content})
+        full_tokens.append(count_tokens(content))
+
+    full_timings = simulate(add_full, lambda: full_history)
+    full_prompt_tokens = [sum(full_tokens[:2 * turn + 3]) for turn in range(turns)]
+
+    window = ContextWindow(system_prompt, count_tokens(system_prompt), token_budget)
+    window_prompt_tokens = []
+
+    def add_window(role, content):
+        window.add(role, content, count_tokens(content))
+        if role == "assistant":
+            window_prompt_tokens.append(window.token_count)
+
+    window_timings = simulate(add_window, window.messages)
+
+    results = []
+    for mode, timings, prompt_tokens in (("full-history", full_timings, full_prompt_tokens),
+                                         ("context-window", window_timings, window_prompt_tokens)):
+        result = {
+            "mode": mode,
+            "first_100_turns_ms": statistics.mean(timings[:100]) * 1000,
+            "last_100_turns_ms": statistics.mean(timings[-100:]) * 1000,
+            "first_prompt_tokens": prompt_tokens[0],
+            "last_prompt_tokens": prompt_tokens[-1],
+        }
+        results.append(result)
+        print(f"{mode:>14}: per-turn {result['first_100_turns_ms']:.3f}ms -> {result['last_100_turns_ms']:.3f}ms, "
+              f"prompt {result['first_prompt_tokens']} -> {result['last_prompt_tokens']} tokens")
+    return results
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+def synthetic_vocabulary(size: int = 20_000):
+    return [f"word{n}" for n in range(size)]
+
+def bench_memory_recall(messages: int = 1_000_000, queries: int = 200, words_per_message: int = 20, k: int = 5):
+    """
+    Builds a BM25 index over `messages` synthetic messages with a Zipf-like vocabulary,
+    then reports incremental add latency and query latency percentiles.
+    """
+    from reverie.memory_index import BM25Index
+
+    rng = random.Random(0)
+    vocabulary = synthetic_vocabulary()
+    weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+    index = BM25Index()
+    start = time.perf_counter()
+    batch = 10_000
+    for offset in range(0, messages, batch):
+        words = rng.choices(vocabulary, weights, k=batch * words_per_message)
+        for n in range(min(batch, messages - offset)):
+            content = " ".join(words[n * words_per_message:(n + 1) * words_per_message])
+            index.add(f"conversation-{(offset + n) // 50}", "user", content)
+    build_seconds = time.perf_counter() - start
+
+    add_timings = []
+    for n in range(1000):
+        content = " ".join(rng.choices(vocabulary, weights, k=words_per_message))
+        start = time.perf_counter()
+        index.add("conversation-new", "user", content)
+        add_timings.append(time.perf_counter() - start)
+
+    query_timings = []
+    for _ in range(queries):
+        query = " ".join(rng.choices(vocabulary, weights, k=6))
+        start = time.perf_counter()
+        index.search(query, k)
+        query_timings.append(time.perf_counter() - start)
+
+    result = {
+        "messages": len(index),
+        "build_seconds": build_seconds,
+        "add_p50_us": percentile(add_timings, 0.5) * 1e6,
+        "query_p50_ms": percentile(query_timings, 0.5) * 1000,
+        "query_p95_ms": percentile(query_timings, 0.95) * 1000,
+        "query_p99_ms": percentile(query_timings, 0.99) * 1000,
+    }
+    print(f"{result['messages']} messages indexed in {build_seconds:.1f}s; add p50 {result['add_p50_us']:.1f}us; "
+          f"query p50 {result['query_p50_ms']:.2f}ms p95 {result['query_p95_ms']:.2f}ms p99 {result['query_p99_ms']:.2f}ms")
+    return result
+
+def bench_streaming(turns: int = 10, latency: float = 0.2, token_interval: float = 0.02, words: int = 80):
+    """
+    Compares time-to-first-visible-token for query_gpt (the whole reply must arrive
+    before anything is shown) and stream_gpt (the first delta can be shown at once),
+    against a fake server that "generates" one word every `token_interval` seconds.
+    """
+    reply_text = " ".join(f"word{n}" for n in range(words))
+    results = []
+    with FakeOpenAIServer(latency=latency, token_interval=token_interval, reply=lambda body: reply_text) as server:
+        use_fake_server(server)
+        conversation = [{"role": "user", "content": "Tell me a story."}]
+
+        blocking_first, stream_first, stream_total = [], [], []
+        for _ in range(turns):
+            start = time.perf_counter()
+            assert gpt_utils.query_gpt(conversation) == reply_text
+            blocking_first.append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            first = None
+            parts = []
+            for delta in gpt_utils.stream_gpt(conversation):
+                if first is None:
+                    first = time.perf_counter() - start
+                parts.append(delta)
+            stream_total.append(time.perf_counter() - start)
+            stream_first.append(first)
+            assert "".join(parts) == reply_text
+
+    for mode, first, total in (("blocking", blocking_first, blocking_first), ("streaming", stream_first, stream_total)):
+        result = {
+            "mode": mode,
+            "first_token_p50_ms": percentile(first, 0.5) * 1000,
+            "complete_p50_ms": percentile(total, 0.5) * 1000,
+        }
+        results.append(result)
+        print(f"{mode:>9}: first visible token p50 {result['first_token_p50_ms']:.0f}ms, "
+              f"complete p50 {result['complete_p50_ms']:.0f}ms")
+    return results
+
+def bench_streaming_tts(turns: int = 5, latency: float = 0.2, token_interval: float = 0.02, sentences: int = 6,
+                        seconds_per_word: float = 0.02):
+    """
+    Compares time-to-first-audio for speaking a reply only once query_gpt has returned
+    (the old voice.py path) against SentenceSpeaker, which speaks each sentence of a
+    streamed reply as soon as it is complete. Speech goes to a sink that takes
+    `seconds_per_word` per word instead of a real TTS engine.
+    """
+    from reverie.speech_output import SentenceSpeaker
+
+    class TimedSink:
+        def say(self, text):
+            time.sleep(seconds_per_word * len(text.split()))
+
+    reply_text = " ".join(f"This is sentence number {n} of the reply." for n in range(sentences))
+    timings = {"blocking": ([], []), "streaming": ([], [])}
+    with FakeOpenAIServer(latency=latency, token_interval=token_interval, reply=lambda body: reply_text) as server:
+        use_fake_server(server)
+        conversation = [{"role": "user", "content": "Tell me about the lighthouse."}]
+        sink = TimedSink()
+        speaker = SentenceSpeaker(sink)
+
+        for _ in range(turns):
+            start = time.perf_counter()
+            reply = gpt_utils.query_gpt(conversation)
+            timings["blocking"][0].append(time.perf_counter() - start)
+            sink.say(reply)
+            timings["blocking"][1].append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            speaker.speak_stream(gpt_utils.stream_gpt(conversation), started_at=time.monotonic())
+            speaker.wait()
+            timings["streaming"][1].append(time.perf_counter() - start)
+        timings["streaming"][0].extend(speaker.first_audio_latencies)
+        speaker.close()
+
+    results = []
+    for mode, (first, done) in timings.items():
+        result = {
+            "mode": mode,
+            "first_audio_p50_ms": percentile(first, 0.5) * 1000,
+            "spoken_p50_ms": percentile(done, 0.5) * 1000,
+        }
+        results.append(result)
+        print(f"{mode:>9}: first audio p50 {result['first_audio_p50_ms']:.0f}ms, "
+              f"reply fully spoken p50 {result['spoken_p50_ms']:.0f}ms")
+    return results
+
+def bench_discord_sessions(channels: int = 10_000, messages_per_channel: int = 6, max_sessions: int = 1000,
+                           token_budget: int = 4000, count_tokens=None):
+    """
+    Load test for the Discord session registry: drives `channels` channels through a
+    SessionRegistry and samples traced memory every 1,000 channels. Resident memory
+    should grow until `max_sessions` sessions are live and then stay flat.
+    Sessions are created in memory rather than loaded from the database.
+    """
+    import tracemalloc
+    from reverie.context_window import ContextWindow
+    from reverie.sessions import Session, SessionRegistry
+
+    count_tokens = count_tokens or gpt_utils.count_tokens
+    system_prompt = gpt_utils.initialize_cli_log()[0]["content"]
+    system_tokens = count_tokens(system_prompt)
+    user_text = "What do you remember about the lighthouse we talked about last week? " * 4
+    user_tokens = count_tokens(user_text)
+
+    async def load_session(key):
+        return Session(key, f"conversation-{key}", ContextWindow(system_prompt, system_tokens, token_budget))
+
+    async def run():
+        registry = SessionRegistry(load_session, max_sessions=max_sessions)
+        samples = []
+        for channel in range(channels):
+            for n in range(messages_per_channel):
+                session = await registry.get(f"discord:{channel}")
+                text = f"[{channel}.{n}] {user_text}"  # A distinct string per message, as real traffic would be
+                session.window.add("user", text, user_tokens)
+                session.window.add("assistant", text, user_tokens)
+            if (channel + 1) % 1000 == 0:
+                current, _ = tracemalloc.get_traced_memory()
+                samples.append({"channels": channel + 1, "live_sessions": len(registry), "traced_mb": current / 1e6})
+        return samples
+
+    tracemalloc.start()
+    try:
+        samples = asyncio.run(run())
+    finally:
+        tracemalloc.stop()
+
+    for sample in samples:
+        print(f"{sample['channels']:>6} channels served, {sample['live_sessions']} live sessions, "
+              f"{sample['traced_mb']:.1f} MB traced")
+    return samples
+
+def bench_voice_wav(fixtures_dir: str = None, rounds: int = 5):
+    """
+    Times the capture-to-transcript path for every WAV fixture in `fixtures_dir`
+    (synthetic ones are generated if none is given): the old path writes the utterance
+    to disk and reopens it for upload, the new one builds the WAV in memory. Audio is
+    fed as 10ms frames and transcribed by the fake server, so only the local overhead
+    differs between the two.
+    """
+    import glob
+    import os
+    import tempfile
+    from reverie import voice
+
+    with tempfile.TemporaryDirectory() as scratch:
+        if fixtures_dir is None:
+            fixtures_dir = os.path.join(scratch, "fixtures")
+            os.makedirs(fixtures_dir)
+            write_synthetic_wav_fixtures(fixtures_dir)
+        fixtures = [read_wav_frames(path) for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.wav")))]
+        if not fixtures:
+            raise SystemExit(f"No WAV fixtures found in {fixtures_dir}")
+
+        timings = {"disk": [], "memory": []}
+        with FakeOpenAIServer() as server:
+            use_fake_server(server)
+            for round_number in range(rounds):
+                for n, (frames, sample_rate, channels) in enumerate(fixtures):
+                    start = time.perf_counter()
+                    path = os.path.join(scratch, f"speech_{round_number}_{n}.wav")
+                    voice.save_wav(path, frames, sample_rate=sample_rate, channels=channels)
+                    assert voice.transcribe_audio(path)
+                    timings["disk"].append(time.perf_counter() - start)
+
+                    start = time.perf_counter()
+                    wav_bytes = voice.build_wav_bytes(frames, sample_rate=sample_rate, channels=channels)
+                    assert voice.transcribe_audio(wav_bytes)
+                    timings["memory"].append(time.perf_counter() - start)
+
+    results = []
+    for mode, values in timings.items():
+        result = {
+            "mode": mode,
+            "utterances": len(values),
+            "p50_ms": percentile(values, 0.5) * 1000,
+            "p95_ms": percentile(values, 0.95) * 1000,
+        }
+        results.append(result)
+        print(f"{mode:>6}: {result['utterances']} utterances, capture-to-transcript p50 {result['p50_ms']:.2f}ms, "
+              f"p95 {result['p95_ms']:.2f}ms")
+    return results
+
+def bench_wake_word(fixtures_dir: str = None, thresholds=(0.15, 0.2, 0.25, 0.3, 0.35, 0.4, 0.45)):
+    """
+    Offline evaluation of the local wake-phrase gate. `fixtures_dir` holds templates/
+    (recordings of the wake phrase), positive/ (utterances starting with it) and
+    negative/ (anything else heard while IDLE); synthetic ones are generated if it is
+    not given. Reports false accepts, false rejects and the share of IDLE uploads to
+    Whisper avoided at each threshold, plus the gate's CPU time per segment.
+    """
+    import glob
+    import os
+    import tempfile
+    from reverie.wake_word import WakePhraseDetector, read_wav_samples
+
+    def clips(directory, name):
+        return [read_wav_samples(path)[0] for path in sorted(glob.glob(os.path.join(directory, name, "*.wav")))]
+
+    with tempfile.TemporaryDirectory() as scratch:
+        if fixtures_dir is None:
+            fixtures_dir = scratch
+            write_synthetic_wake_fixtures(fixtures_dir)
+        detector = WakePhraseDetector.from_wav_files(sorted(glob.glob(os.path.join(fixtures_dir, "templates", "*.wav"))))
+        positives, negatives = clips(fixtures_dir, "positive"), clips(fixtures_dir, "negative")
+    if not positives or not negatives:
+        raise SystemExit(f"{fixtures_dir} needs WAV clips in both positive/ and negative/")
+
+    start = time.process_time()
+    positive_scores = [detector.score(samples) for samples in positives]
+    negative_scores = [detector.score(samples) for samples in negatives]
+    cpu_ms = (time.process_time() - start) * 1000 / (len(positives) + len(negatives))
+
+    results = []
+    print(f"{len(positives)} wake phrase clips, {len(negatives)} other clips; gate CPU {cpu_ms:.1f}ms per segment")
+    for threshold in thresholds:
+        false_rejects = sum(score > threshold for score in positive_scores)
+        false_accepts = sum(score <= threshold for score in negative_scores)
+        uploads = len(positives) - false_rejects + false_accepts
+        result = {
+            "threshold": threshold,
+            "false_reject_rate": false_rejects / len(positives),
+            "false_accept_rate": false_accepts / len(negatives),
+            "uploads_avoided": 1 - uploads / (len(positives) + len(negatives)),
+            "cpu_ms_per_segment": cpu_ms,
+        }
+        results.append(result)
+        print(f"threshold {threshold:.2f}: false rejects {result['false_reject_rate']:.1%}, "
+              f"false accepts {result['false_accept_rate']:.1%}, IDLE uploads avoided {result['uploads_avoided']:.1%}")
+    return results
+
+def legacy_vad_segments(frames, decisions, min_speech_frames: int = 30, min_silence_frames: int = 60):
+    """
+    The segmentation loop voice.py used before VadSegmenter, as (first frame, last frame)
+    index pairs. It kept every voiced frame, and its speech counter was only reset when an
+    utterance ended.
+    """
+    segments, speech_frames = [], []
+    is_speaking, speech_counter, silence_counter, first = False, 0, 0, None
+    for n, (frame, is_speech) in enumerate(zip(frames, decisions)):
+        if is_speech:
+            speech_counter += 1
+            silence_counter = 0
+            speech_frames.append(frame)
+            first = n if first is None else first
+            if not is_speaking and speech_counter >= min_speech_frames:
+                is_speaking = True
+        elif is_speaking:
+            silence_counter += 1
+            speech_frames.append(frame)
+            if silence_counter >= min_silence_frames:
+                segments.append((first, n))
+                is_speaking, speech_frames, speech_counter, silence_counter, first = False, [], 0, 0, None
+    return segments
+
+def bench_vad_segmenter(minutes: float = 10.0, frame_ms: int = 10):
+    """
+    Replays a long synthetic recording through the old segmentation loop and VadSegmenter.
+    VAD decisions (frame energy) are computed up front so only segmentation is timed.
+    Reports CPU time per frame, peak traced memory, and onset accuracy: how far before
+    each utterance's true onset its segment starts (negative means the onset was clipped).
+    """
+    import tracemalloc
+    import numpy as np
+    from reverie.audio_pipeline import VadSegmenter
+
+    sample_rate = 16000
+    samples, utterances = synthetic_session(minutes, np.random.default_rng(0), sample_rate)
+    frame_samples = sample_rate * frame_ms // 1000
+    frame_count = len(samples) // frame_samples
+    data = samples[:frame_count * frame_samples].tobytes()
+    energy = np.sqrt(np.mean(samples[:frame_count * frame_samples].astype(np.float64).reshape(frame_count, -1) ** 2,
+                             axis=1))
+    decisions = (energy > 500).tolist()
+    frame_bytes = frame_samples * 2
+
+    def fresh_frames():
+        # New bytes objects per frame, as the capture ring hands them out
+        return (data[i:i + frame_bytes] for i in range(0, len(data), frame_bytes))
+
+    def run_legacy():
+        return legacy_vad_segments(fresh_frames(), decisions)
+
+    def run_segmenter():
+        verdicts = iter(decisions)
+        segmenter = VadSegmenter(lambda frame: next(verdicts), frame_bytes)
+        segments, start = [], None
+        for n, frame in enumerate(fresh_frames()):
+            was_speaking = segmenter.is_speaking
+            segment = segmenter.push(frame)
+            if not was_speaking and segmenter.is_speaking:
+                start = n + 1 - min(n + 1, segmenter.lead_frames)
+            if segment is not None:
+                segments.append((start, n))
+                if segmenter.is_speaking:
+                    start = n + 1
+        return segments
+
+    import contextlib
+    import io
+
+    results = []
+    for mode, run in (("legacy", run_legacy), ("segmenter", run_segmenter)):
+        with contextlib.redirect_stdout(io.StringIO()):  # Both print as speech starts and ends
+            start = time.process_time()
+            segments = run()
+            cpu = time.process_time() - start
+            tracemalloc.start()
+            run()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+
+        leads, missed = [], 0
+        for onset, end in utterances:
+            onset_frame, end_frame = onset // frame_samples, end // frame_samples
+            overlapping = [first for first, last in segments if first <= end_frame and last >= onset_frame]
+            if overlapping:
+                leads.append((onset_frame - min(overlapping)) * frame_ms)
+            else:
+                missed += 1
+        result = {
+            "mode": mode,
+            "frames": frame_count,
+            "cpu_us_per_frame": cpu / frame_count * 1e6,
+            "peak_traced_mb": peak / 1e6,
+            "segments": len(segments),
+            "utterances": len(utterances),
+            "missed": missed,
+            "clipped": sum(lead < 0 for lead in leads),
+            "onset_lead_p50_ms": percentile(leads, 0.5) if leads else None,
+            "onset_lead_max_ms": max(leads) if leads else None,
+        }
+        results.append(result)
+        print(f"{mode:>9}: {result['cpu_us_per_frame']:.2f}us CPU/frame, peak {result['peak_traced_mb']:.1f}MB traced, "
+              f"{result['segments']} segments for {result['utterances']} utterances ({missed} missed), "
+              f"{result['clipped']} onsets clipped, onset lead p50 {result['onset_lead_p50_ms']}ms "
+              f"max {result['onset_lead_max_ms']}ms")
+    return results
+
+def bench_db_pool(thread_counts=(1, 4, 16, 64), max_connections: int = 10, checkouts_per_thread: int = 200,
+                  query_ms: float = 2.0):
+    """
+    Contention on the connection pool: each thread repeatedly checks out a connection
+    and holds it for `query_ms` (a stand-in for a query; no database is needed), and
+    the time spent waiting for a connection is recorded per checkout. Also reports how
+    long a fresh interpreter takes to import reverie.db_utils.
+    """
+    import subprocess
+    import sys
+    import threading
+    from reverie.db_pool import ConnectionPool
+
+    class StandInConnection:
+        closed = 0
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    results = []
+    for thread_count in thread_counts:
+        pool = ConnectionPool(StandInConnection, min_connections=1, max_connections=max_connections)
+        waits = [[] for _ in range(thread_count)]
+
+        def worker(samples):
+            for _ in range(checkouts_per_thread):
+                start = time.perf_counter()
+                with pool.connection():
+                    samples.append(time.perf_counter() - start)
+                    time.sleep(query_ms / 1000)
+
+        threads = [threading.Thread(target=worker, args=(samples,)) for samples in waits]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        all_waits = [wait for samples in waits for wait in samples]
+        result = {
+            "threads": thread_count,
+            "checkouts_per_second": len(all_waits) / elapsed,
+            "wait_p50_ms": percentile(all_waits, 0.5) * 1000,
+            "wait_p95_ms": percentile(all_waits, 0.95) * 1000,
+            "wait_max_ms": max(all_waits) * 1000,
+            "connections_opened": pool.connections_opened,
+        }
+        results.append(result)
+        print(f"{thread_count:>3} threads: {result['checkouts_per_second']:.0f} checkouts/s, "
+              f"wait p50 {result['wait_p50_ms']:.2f}ms p95 {result['wait_p95_ms']:.2f}ms max {result['wait_max_ms']:.1f}ms, "
+              f"{result['connections_opened']} connections opened")
+
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "import reverie.db_utils"], check=True)
+    print(f"import reverie.db_utils in a fresh interpreter: {(time.perf_counter() - start) * 1000:.0f}ms, "
+          f"no database needed")
+    return results
+
+class RoundTripConnection:
+    """
+    A stand-in psycopg2 connection that sleeps `round_trip` seconds for every message
+    exchanged with the server the way psycopg2 does it: an implicit BEGIN before the
+    first statement outside autocommit, each statement, and COMMIT/ROLLBACK of an open
+    transaction. Counts round trips across all instances.
+    """
+
+    round_trips = 0
+    _lock = None
+
+    def __init__(self, round_trip: float):
+        import threading
+        if RoundTripConnection._lock is None:
+            RoundTripConnection._lock = threading.Lock()
+        self.round_trip = round_trip
+        self.autocommit = False
+        self.in_transaction = False
+        self.closed = 0
+
+    def _exchange(self):
+        with RoundTripConnection._lock:
+            RoundTripConnection.round_trips += 1
+        time.sleep(self.round_trip)
+
+    def cursor(self, name=None):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                pass
+
+            def execute(self, query, params=None):
+                if not connection.autocommit and not connection.in_transaction:
+                    connection._exchange()  # BEGIN
+                    connection.in_transaction = True
+                connection._exchange()
+
+            def fetchone(self):
+                import uuid
+                return (str(uuid.uuid4()),)
+
+        return Cursor()
+
+    def commit(self):
+        if self.in_transaction:
+            self._exchange()
+            self.in_transaction = False
+
+    def rollback(self):
+        self.commit()
+
+    def close(self):
+        self.closed = 1
+
+def bench_conversation_start(concurrency_levels=(1, 8, 32), starts: int = 256, round_trip_ms: float = 1.0):
+    """
+    Latency of starting a conversation from `concurrency` threads at once, through the
+    real db_utils code and connection pool but with RoundTripConnection standing in for
+    PostgreSQL (so query execution time, including the old full-table sort, is not counted).
+    Compares the old sequence (insert, SELECT latest id, insert, each on its own checkout)
+    with initialize_conversation's single INSERT ... RETURNING statement.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from reverie import db_utils
+    from reverie.db_pool import ConnectionPool
+
+    system_prompt = "You are Makiyo, an AI agent and conversationalist."
+
+    def legacy_start():
+        for query in ("INSERT INTO Conversations ...", "SELECT conversation_id FROM Conversations ORDER BY start_time DESC LIMIT 1;",
+                      "INSERT INTO Messages ..."):
+            with db_utils.checkout() as connection, connection.cursor() as cursor:
+                cursor.execute(query)
+
+    def single_statement_start():
+        assert db_utils.create_conversation(
+            db_utils.generate_conversation_data(),
+            db_utils.generate_message_data(None, "system", system_prompt, 12)
+        )
+
+    results = []
+    original_pool = db_utils.connection_pool
+    try:
+        for concurrency in concurrency_levels:
+            for mode, start_conversation in (("legacy", legacy_start), ("single-statement", single_statement_start)):
+                db_utils.connection_pool = ConnectionPool(lambda: RoundTripConnection(round_trip_ms / 1000),
+                                                          max_connections=db_utils.POOL_MAX_CONNECTIONS)
+                RoundTripConnection.round_trips = 0
+
+                def timed_start(_):
+                    start = time.perf_counter()
+                    start_conversation()
+                    return time.perf_counter() - start
+
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    latencies = list(executor.map(timed_start, range(starts)))
+                result = {
+                    "mode": mode,
+                    "concurrency": concurrency,
+                    "p50_ms": percentile(latencies, 0.5) * 1000,
+                    "p95_ms": percentile(latencies, 0.95) * 1000,
+                    "round_trips_per_start": RoundTripConnection.round_trips / starts,
+                }
+                results.append(result)
+                print(f"{mode:>16} x{concurrency:<3}: session start p50 {result['p50_ms']:.1f}ms "
+                      f"p95 {result['p95_ms']:.1f}ms, {result['round_trips_per_start']:.0f} round trips each")
+    finally:
+        db_utils.connection_pool = original_pool
+    return results
+
+def bench_schema(messages: int = 10_000_000, messages_per_conversation: int = 100, repeats: int = 5):
+    """
+    Needs a PostgreSQL server (REVERIE_DB_* settings). Seeds `messages` messages into a
+    scratch schema, then times every hot db_utils query against the bare tables
+    (schema version 1) and again after the index migrations. The scratch schema is
+    dropped afterwards.
+    """
+    from reverie import schema
+    from reverie.db_utils import checkout, close_connection_pool
+
+    conversations = max(1, messages // messages_per_conversation)
+    results = []
+    try:
+        with checkout() as connection:
+            with connection.cursor() as cursor:
+                cursor.execute("DROP SCHEMA IF EXISTS reverie_bench CASCADE")
+                cursor.execute("CREATE SCHEMA reverie_bench")
+                cursor.execute("SET search_path TO reverie_bench")
+            connection.commit()
+            try:
+                schema.migrate(connection, target=1)
+                start = time.perf_counter()
+                with connection.cursor() as cursor:
+                    cursor.execute(
+                        "INSERT INTO conversations (user_id, interface, start_time, end_time, summary, tags) "
+                        "SELECT 'Rewind', 'discord:' || (g %% 500), now() - g * interval '1 minute', "
+                        "now() - g * interval '1 minute' + interval '30 minutes', "
+                        "CASE WHEN g %% 20 = 0 THEN NULL ELSE 'seeded' END, "
+                        "CASE WHEN g %% 10 = 0 THEN NULL ELSE '[\"seed\"]'::jsonb END "
+                        "FROM generate_series(1, %s) g",
+                        (conversations,)
+                    )
+                    cursor.execute(
+                        "INSERT INTO messages (conversation_id, role, content, timestamp, token_count, tags) "
+                        "SELECT c.conversation_id, "
+                        "CASE WHEN m = 1 THEN 'system' WHEN m %% 2 = 0 THEN 'user' ELSE 'assistant' END, "
+                        "'seeded message ' || m, c.start_time + m * interval '1 second', 20, "
+                        "CASE WHEN m %% 20 = 0 THEN NULL ELSE '[\"seed\"]'::jsonb END "
+                        "FROM conversations c CROSS JOIN generate_series(1, %s) m",
+                        (messages_per_conversation,)
+                    )
+                    cursor.execute("ANALYZE")
+                    cursor.execute("SELECT conversation_id FROM conversations ORDER BY random() LIMIT 1")
+                    samples = {"conversation_id": cursor.fetchone()[0], "interface": "discord:7",
+                               "now": datetime.now(timezone.utc)}
+                connection.commit()
+                print(f"Seeded {conversations * messages_per_conversation} messages in "
+                      f"{conversations} conversations in {time.perf_counter() - start:.0f}s")
+
+                def time_queries():
+                    timings = {}
+                    for query in schema.HOT_QUERIES:
+                        if query.get("full_scan"):
+                            continue
+                        runs = []
+                        for _ in range(repeats):
+                            start = time.perf_counter()
+                            with connection.cursor() as cursor:
+                                cursor.execute(query["sql"], schema.query_params(query, samples))
+                                cursor.fetchall()
+                            runs.append(time.perf_counter() - start)
+                        connection.rollback()
+                        timings[query["name"]] = statistics.median(runs) * 1000
+                    return timings
+
+                before = time_queries()
+                start = time.perf_counter()
+                schema.migrate(connection)
+                with connection.cursor() as cursor:
+                    cursor.execute("ANALYZE")
+                connection.commit()
+                print(f"Built indexes in {time.perf_counter() - start:.0f}s")
+                after = time_queries()
+
+                for name in before:
+                    result = {"query": name, "unindexed_ms": before[name], "indexed_ms": after[name]}
+                    results.append(result)
+                    print(f"{name:>36}: {before[name]:9.1f}ms -> {after[name]:7.2f}ms")
+                problems = schema.check_indexes(connection, samples)
+                print("Every hot query is index-backed." if not problems else f"Not index-backed: {problems}")
+            finally:
+                connection.rollback()
+                with connection.cursor() as cursor:
+                    cursor.execute("DROP SCHEMA IF EXISTS reverie_bench CASCADE")
+                    cursor.execute("SET search_path TO DEFAULT")
+                connection.commit()
+    finally:
+        close_connection_pool()
+    return results
+
+def bench_history_export(sizes=(200_000, 1_000_000), messages_per_conversation: int = 100):
+    """
+    Throughput and memory of the export file format, without a database: synthetic rows
+    are streamed through write_export into a gzip file, then read back and encoded into
+    COPY chunks the way import_history loads them. The process's peak resident memory
+    should stay flat as the number of messages grows.
+    """
+    import gzip
+    import os
+    import resource
+    import tempfile
+    import uuid
+    from datetime import datetime, timedelta, timezone
+
+    from reverie.history_export import CONVERSATION_COLUMNS, copy_chunks, read_export, write_export
+
+    start_time = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    words = "the of and to in is you that it he was for on are as with his they at be this have from".split()
+    rng = random.Random(0)
+    contents = [" ".join(rng.choices(words, k=rng.randint(5, 40))) for _ in range(1000)]
+
+    def conversation_ids(messages):
+        # Sorted, like ORDER BY conversation_id
+        return [str(uuid.UUID(int=i + 1)) for i in range(max(1, messages // messages_per_conversation))]
+
+    def conversations(ids):
+        for conversation_id in ids:
+            row = dict.fromkeys(CONVERSATION_COLUMNS)
+            row.update(conversation_id=conversation_id, user_id="Rewind", interface="cli", start_time=start_time,
+                       message_count=messages_per_conversation, tags=["seed"])
+            yield tuple(row[column] for column in CONVERSATION_COLUMNS)
+
+    def messages(ids):
+        n = 0
+        for conversation_id in ids:
+            for i in range(messages_per_conversation):
+                n += 1
+                content = contents[n % len(contents)]
+                yield (str(uuid.UUID(int=n)), conversation_id, "user" if i % 2 else "assistant", content,
+                       start_time + timedelta(seconds=i), len(content) // 4, None, None, ["seed"])
+
+    def peak_rss_mb():
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "history.jsonl.gz")
+        for size in sizes:
+            ids = conversation_ids(size)
+            start = time.perf_counter()
+            with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as fileobj:
+                counts = write_export(fileobj, conversations(ids), messages(ids))
+            export_seconds = time.perf_counter() - start
+
+            start = time.perf_counter()
+            imported = 0
+            with gzip.open(path, "rt", encoding="utf-8") as fileobj:
+                for _, message_lines in copy_chunks(read_export(fileobj)):
+                    imported += len(message_lines)
+            import_seconds = time.perf_counter() - start
+
+            result = {
+                "messages": counts["messages"],
+                "file_mb": os.path.getsize(path) / 1e6,
+                "export_messages_per_minute": counts["messages"] / export_seconds * 60,
+                "import_messages_per_minute": imported / import_seconds * 60,
+                "peak_rss_mb": peak_rss_mb(),
+            }
+            results.append(result)
+            print(f"{result['messages']:>9} messages, {result['file_mb']:.1f}MB file: "
+                  f"export {result['export_messages_per_minute'] / 1e6:.1f}M/min, "
+                  f"import encoding {result['import_messages_per_minute'] / 1e6:.1f}M/min, "
+                  f"peak RSS {result['peak_rss_mb']:.0f}MB")
+    return results
+
+def bench_completion_cache(distinct_queries: int = 50, repeats: int = 20, latency: float = 0.2):
+    """
+    Repeated yes/no classifications through query_gpt_binary with the completion cache:
+    the first call for each query goes to the fake server, the rest are answered from
+    memory. Disk-tier latency is measured by reopening the cache.
+    """
+    import os
+    import tempfile
+    from reverie.cache_utils import PersistentLRUCache
+
+    queries = [f"Is statement number {i} about music?" for i in range(distinct_queries)]
+    original_cache = gpt_utils.completion_cache
+    with FakeOpenAIServer(latency=latency, reply=lambda body: "No.") as server, \
+            tempfile.TemporaryDirectory() as directory:
+        use_fake_server(server)
+        path = os.path.join(directory, "completions.sqlite3")
+        try:
+            gpt_utils.completion_cache = PersistentLRUCache(path, table="completions", ttl=3600, max_disk_entries=10_000)
+            gpt_utils.completion_cache_saved_seconds = 0.0
+            miss_latencies, hit_latencies = [], []
+            for round_number in range(repeats):
+                for query in queries:
+                    start = time.perf_counter()
+                    gpt_utils.query_gpt_binary(query)
+                    (hit_latencies if round_number else miss_latencies).append(time.perf_counter() - start)
+            stats = gpt_utils.completion_cache_stats()
+            gpt_utils.completion_cache.close()
+
+            gpt_utils.completion_cache = PersistentLRUCache(path, table="completions", ttl=3600, max_disk_entries=10_000)
+            disk_latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                gpt_utils.query_gpt_binary(query)
+                disk_latencies.append(time.perf_counter() - start)
+            gpt_utils.completion_cache.close()
+        finally:
+            gpt_utils.completion_cache = original_cache
+
+    result = {
+        "api_requests": server.request_count,
+        "calls": distinct_queries * (repeats + 1),
+        "hit_rate": stats["hit_rate"],
+        "miss_p50_ms": percentile(miss_latencies, 0.5) * 1000,
+        "memory_hit_p50_us": percentile(hit_latencies, 0.5) * 1e6,
+        "disk_hit_p50_us": percentile(disk_latencies, 0.5) * 1e6,
+        "saved_seconds": stats["saved_seconds"],
+    }
+    print(f"{result['calls']} classifications, {result['api_requests']} API requests, "
+          f"hit rate {result['hit_rate']:.0%}, {result['saved_seconds']:.1f}s of API latency saved")
+    print(f"p50: API {result['miss_p50_ms']:.0f}ms, memory hit {result['memory_hit_p50_us']:.0f}us, "
+          f"disk hit {result['disk_hit_p50_us']:.0f}us")
+    return result
+
+def bench_request_scheduler(duration: float = 20.0, warmup: float = 6.0, requests_per_minute: float = 600,
+                            backfill_threads: int = 16, chat_interval: float = 0.5, latency: float = 0.1):
+    """
+    Chat latency while a tagging backfill saturates the quota of a fake server that
+    enforces `requests_per_minute` with 429s. "direct" sends everything straight through
+    an SDK client (with its default retries) like the old code; "scheduled" sends the
+    backfill on the scheduler's batch lane and chat on the interactive lane. Chat
+    latencies are sampled after `warmup`, once the backfill has used up the burst allowance.
+    """
+    import threading
+    from reverie.gpt_utils import BATCH, RequestScheduler, message_tags_prompt, query_gpt
+
+    chat_messages = [{"role": "user", "content": "How was your day?"}]
+    results = []
+    for mode in ("direct", "scheduled"):
+        with FakeOpenAIServer(latency=latency, reply=tagging_reply, requests_per_minute=requests_per_minute) as server:
+            use_fake_server(server)
+            original_scheduler = gpt_utils.scheduler
+            gpt_utils.scheduler = RequestScheduler(requests_per_minute * 0.95, 1_000_000_000)
+            direct_client = openai.OpenAI(api_key="fake-key", base_url=server.base_url)
+            stop = threading.Event()
+            completed = {"batch": 0, "chat_failed": 0}
+            lock = threading.Lock()
+
+            def send(messages, lane):
+                if mode == "direct":
+                    try:
+                        return direct_client.chat.completions.create(model="gpt-4o-mini", messages=messages,
+                                                                     max_tokens=50).choices[0].message.content
+                    except openai.OpenAIError:
+                        return ""
+                return query_gpt(messages, max_tokens=50, lane=lane, cache=False)
+
+            def backfill(worker):
+                n = 0
+                while not stop.is_set():
+                    n += 1
+                    if send(message_tags_prompt(f"Backfill message {worker}-{n}"), BATCH):
+                        with lock:
+                            completed["batch"] += 1
+
+            threads = [threading.Thread(target=backfill, args=(i,), daemon=True) for i in range(backfill_threads)]
+            start = time.monotonic()
+            for thread in threads:
+                thread.start()
+
+            chat_latencies = []
+            while time.monotonic() - start < duration:
+                sent = time.monotonic()
+                reply = send(chat_messages, gpt_utils.INTERACTIVE)
+                if sent - start >= warmup:
+                    if reply:
+                        chat_latencies.append(time.monotonic() - sent)
+                    else:
+                        completed["chat_failed"] += 1
+                time.sleep(max(0.0, chat_interval - (time.monotonic() - sent)))
+            stop.set()
+            for thread in threads:
+                thread.join()
+            elapsed = time.monotonic() - start
+            scheduler_stats = gpt_utils.scheduler.stats()
+            gpt_utils.scheduler = original_scheduler
+            direct_client.close()
+
+        result = {
+            "mode": mode,
+            "chat_p50_ms": percentile(chat_latencies, 0.5) * 1000,
+            "chat_p95_ms": percentile(chat_latencies, 0.95) * 1000,
+            "chat_p99_ms": percentile(chat_latencies, 0.99) * 1000,
+            "chat_failed": completed["chat_failed"],
+            "batch_per_second": completed["batch"] / elapsed,
+            "server_429s": server.quota_rejections,
+        }
+        if mode == "scheduled":
+            result["lanes"] = scheduler_stats
+        results.append(result)
+        print(f"{mode:>9}: chat p50 {result['chat_p50_ms']:.0f}ms p95 {result['chat_p95_ms']:.0f}ms "
+              f"p99 {result['chat_p99_ms']:.0f}ms ({result['chat_failed']} failed), backfill "
+              f"{result['batch_per_second']:.1f} req/s, {result['server_429s']} 429s from the server")
+    lanes = results[-1]["lanes"]
+    print(f"scheduled lanes: batch max queue {lanes['batch']['max_waiting']}, "
+          f"interactive queue wait p99 {lanes['interactive']['queue_wait_p99_ms']:.0f}ms")
+    return results
+
+def bench_tracing(spans: int = 1_000_000, turns: int = 50, latency: float = 0.05, count_tokens=None):
+    """
+    Cost per span of reverie.tracing with tracing off (the shared no-op span), with
+    histograms only, and with every span also written to a JSONL trace file, next to
+    an empty loop. Then runs `turns` chat turns against the fake server with tracing on
+    and prints each stage's latency histogram summary.
+    """
+    import os
+    import tempfile
+    from reverie import tracing
+    from reverie.gpt_utils import query_gpt
+
+    count_tokens = count_tokens or gpt_utils.count_tokens
+    original = tracing.tracer
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        trace_file = os.path.join(directory, "trace.jsonl")
+        modes = [
+            ("off", tracing.Tracer(enabled=False)),
+            ("histograms", tracing.Tracer(enabled=True, trace_file=None, metrics_file=None)),
+            ("jsonl", tracing.Tracer(enabled=True, trace_file=trace_file, metrics_file=None)),
+        ]
+
+        @tracing.traced("bench.decorated")
+        def decorated():
+            pass
+
+        start = time.perf_counter()
+        for _ in range(spans):
+            pass
+        empty = (time.perf_counter() - start) / spans
+
+        for mode, tracer in modes:
+            tracing.tracer = tracer
+            span = tracing.span
+            start = time.perf_counter()
+            for _ in range(spans):
+                with span("bench.span"):
+                    pass
+            per_span = (time.perf_counter() - start) / spans - empty
+            start = time.perf_counter()
+            for _ in range(spans):
+                decorated()
+            per_call = (time.perf_counter() - start) / spans - empty
+            tracer.flush()
+            results.append({"mode": mode, "span_ns": per_span * 1e9, "decorator_ns": per_call * 1e9})
+            print(f"{mode:>10}: {per_span * 1e9:7.0f} ns per span, {per_call * 1e9:7.0f} ns per decorated call")
+
+    tracer = tracing.Tracer(enabled=True, trace_file=None, metrics_file=None)
+    tracing.tracer = tracer
+    try:
+        with FakeOpenAIServer(latency=latency) as server:
+            use_fake_server(server)
+            for i in range(turns):
+                tracing.new_turn()
+                with tracing.span("bench.turn"):
+                    question = f"Tell me about turn {i}."
+                    count_tokens(question)
+                    reply = query_gpt([{"role": "user", "content": question}], cache=False)
+                    count_tokens(reply)
+    finally:
+        tracing.tracer = original
+
+    stages = tracer.summary()
+    for name, stage in stages.items():
+        print(f"{name:>24}: {stage['count']:4d} spans, p50 {stage['p50_ms']:8.3f}ms "
+              f"p95 {stage['p95_ms']:8.3f}ms p99 {stage['p99_ms']:8.3f}ms")
+    return {"overhead": results, "stages": stages}
+
+def bench_storage_insert(inserts: int = 2_000, batch_size: int = 100, conversations: int = 200):
+    """
+    Per-insert latency (p50/p95/p99) of each storage backend: single message inserts,
+    insert_many_into_table batches of `batch_size` (reported per message) and
+    create_conversation. SQLite runs on a temporary file; PostgreSQL runs if the
+    REVERIE_DB_* server is reachable, and the conversations it creates are deleted after.
+    """
+    import os
+    import tempfile
+    from reverie import db_utils
+    from reverie.gpt_utils import percentile
+    from reverie.storage import PostgresStorage, SQLiteStorage, generate_conversation_data, generate_message_data
+
+    def time_backend(storage):
+        created = []
+
+        def timed(func, *args):
+            start = time.perf_counter()
+            result = func(*args)
+            return result, time.perf_counter() - start
+
+        latencies = {"create_conversation": [], "insert": [], "insert_many": []}
+        for _ in range(conversations):
+            conversation_id, seconds = timed(storage.create_conversation, generate_conversation_data("bench"),
+                                             generate_message_data(None, "system", "Be kind.", 3))
+            created.append(conversation_id)
+            latencies["create_conversation"].append(seconds)
+        for i in range(inserts):
+            _, seconds = timed(storage.insert_into_table, "Messages",
+                               generate_message_data(created[i % len(created)], "user", f"Message {i}", 4))
+            latencies["insert"].append(seconds)
+        for i in range(0, inserts, batch_size):
+            rows = [generate_message_data(created[i % len(created)], "assistant", f"Reply {i + n}", 4)
+                    for n in range(batch_size)]
+            _, seconds = timed(storage.insert_many_into_table, "Messages", rows)
+            latencies["insert_many"].append(seconds / batch_size)
+        return latencies, created
+
+    def report(backend, latencies):
+        for operation, values in latencies.items():
+            result = {"backend": backend, "operation": operation, "count": len(values),
+                      **{f"p{q}_ms": percentile(values, q / 100) * 1000 for q in (50, 95, 99)}}
+            results.append(result)
+            print(f"{backend:>8} {operation:>20}: p50 {result['p50_ms']:7.3f}ms p95 {result['p95_ms']:7.3f}ms "
+                  f"p99 {result['p99_ms']:7.3f}ms")
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(os.path.join(directory, "bench.sqlite3"))
+        try:
+            report("sqlite", time_backend(storage)[0])
+        finally:
+            storage.close()
+
+    try:
+        with db_utils.checkout():
+            pass
+    except Exception as e:
+        print(f"  postgres: skipped, server not reachable ({str(e).splitlines()[0] if str(e) else e!r})")
+        db_utils.close_connection_pool()
+        return results
+    storage = PostgresStorage()
+    latencies, created = time_backend(storage)
+    try:
+        with db_utils.transaction() as cursor:
+            cursor.execute("DELETE FROM conversations WHERE conversation_id = ANY(%s::uuid[])",
+                           ([c for c in created if c],))
+    finally:
+        storage.close()
+    report("postgres", latencies)
+    return results
+
+BENCHMARKS = {
+    "async-concurrency": bench_async_concurrency,
+    "tagging-batch": bench_tagging_batch,
+    "context-window": bench_context_window,
+    "memory-recall": bench_memory_recall,
+    "streaming": bench_streaming,
+    "streaming-tts": bench_streaming_tts,
+    "discord-sessions": bench_discord_sessions,
+    "voice-wav": bench_voice_wav,
+    "wake-word": bench_wake_word,
+    "vad-segmenter": bench_vad_segmenter,
+    "db-pool": bench_db_pool,
+    "conversation-start": bench_conversation_start,
+    "schema": bench_schema,
+    "history-export": bench_history_export,
+    "completion-cache": bench_completion_cache,
+    "request-scheduler": bench_request_scheduler,
+    "tracing": bench_tracing,
+    "storage-insert": bench_storage_insert,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Reverie's offline benchmarks.")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--fixtures", help="Directory of recorded WAV fixtures, for benchmarks that take them")
+    args = parser.parse_args()
+    if args.fixtures:
+        BENCHMARKS[args.benchmark](fixtures_dir=args.fixtures)
+    else:
+        BENCHMARKS[args.benchmark]()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+# reverie/cache_utils.py
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+
+def content_hash(*parts: str) -> str:
+    """
+    Stable SHA-256 key for a sequence of strings.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+class PersistentLRUCache:
+    """
+    A bounded in-memory LRU in front of a SQLite key/value table.
+
+    Values must be JSON-serializable. Lookups try memory first, then disk (promoting
+    the entry back into memory); writes go to both. Pass ":memory:" as the path for
+    a cache that only lives as long as the process. Safe to share between threads.
+
+    With `ttl`, entries older than that many seconds count as misses and are deleted.
+    With `max_disk_entries`, the table is pruned back to that size on write, dropping
+    the entries least recently read from disk or written (memory hits don't touch the
+    table, so they don't count as uses).
+    """
+
+    def __init__(self, path: str, max_memory_entries: int = 10_000, table: str = "cache",
+                 ttl: Optional[float] = None, max_disk_entries: Optional[int] = None):
+        self.path = path
+        self.max_memory_entries = max_memory_entries
+        self.table = table
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self.evictions = 0
+
+        self._memory = OrderedDict()  # key -> (value, stored_at)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+        columns = {row[1] for row in self._db.execute(f"PRAGMA table_info({table})")}
+        for column in ("stored_at", "used_at"):
+            if column not in columns:  # Tables created before entries expired
+                self._db.execute(f"ALTER TABLE {table} ADD COLUMN {column} REAL NOT NULL DEFAULT 0")
+        self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_used_at ON {table} (used_at)")
+        self._db.commit()
+        self._disk_entries = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+    @property
+    def hits(self) -> int:
+        return self.memory_hits + self.disk_hits
+
+    def _expired(self, stored_at: float, now: float) -> bool:
+        return self.ttl is not None and now - stored_at > self.ttl
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            now = time.time()
+            entry = self._memory.get(key)
+            if entry is not None:
+                if not self._expired(entry[1], now):
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    return entry[0]
+                del self._memory[key]
+
+            row = self._db.execute(f"SELECT value, stored_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return default
+            if self._expired(row[1], now):
+                self._db.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                self._db.commit()
+                self._disk_entries -= 1
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            if self.max_disk_entries is not None:
+                self._db.execute(f"UPDATE {self.table} SET used_at = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            self.disk_hits += 1
+            value = json.loads(row[0])
+            self._remember(key, value, row[1])
+            return value
+
+    def set(self, key: str, value: Any):
+        with self._lock:
+            now = time.time()
+            replaced = self._db.execute(f"SELECT 1 FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            self._db.execute(f"INSERT OR REPLACE INTO {self.table} (key, value, stored_at, used_at) VALUES (?, ?, ?, ?)",
+                             (key, json.dumps(value), now, now))
+            if not replaced:
+                self._disk_entries += 1
+            if self.max_disk_entries is not None and self._disk_entries > self.max_disk_entries:
+                self._prune()
+            self._db.commit()
+            self._remember(key, value, now)
+
+    def _prune(self):
+        """
+        Deletes expired entries, then the least recently used ones beyond max_disk_entries,
+        leaving 10% headroom so pruning doesn't run on every write. Call with the lock held.
+        """
+        if self.ttl is not None:
+            expired = self._db.execute(f"DELETE FROM {self.table} WHERE stored_at < ?", (time.time() - self.ttl,))
+            self.expirations += expired.rowcount
+            self._disk_entries -= expired.rowcount
+        excess = self._disk_entries - int(self.max_disk_entries * 0.9)
+        if excess > 0:
+            evicted = [row[0] for row in self._db.execute(
+                f"SELECT key FROM {self.table} ORDER BY used_at ASC LIMIT ?", (excess,)
+            )]
+            self._db.executemany(f"DELETE FROM {self.table} WHERE key = ?", [(key,) for key in evicted])
+            for key in evicted:
+                self._memory.pop(key, None)
+            self.evictions += len(evicted)
+            self._disk_entries -= len(evicted)
+
+    def _remember(self, key: str, value: Any, stored_at: float):
+        self._memory[key] = (value, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def __len__(self):
+        return self._disk_entries
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "expirations": self.expirations,
+            "evictions": self.evictions,
+        }
+
+    def close(self):
+        with self._lock:
+            self._db.close()
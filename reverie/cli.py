@@ -1,9 +1,16 @@
 # reverie/cli.py
 
-import atexit
-from reverie.conversation_manager import initialize_conversation, append_message
-from reverie.gpt_utils import query_gpt, query_gpt_binary
-from db_utils import close_connection_pool
+from concurrent.futures import ThreadPoolExecutor
+
+from reverie.conversation_manager import (
+    initialize_conversation, initialize_context_window, append_message, build_prompt,
+    enable_write_behind, disable_write_behind, finalize_conversation
+)
+from reverie.gpt_utils import stream_gpt, query_gpt_binary
+from reverie.memory_index import start_memory_index
+from reverie.summarizer import update_rolling_summary_in_background
+from reverie.storage import close_storage, get_storage
+from reverie.tracing import new_turn
 
 def initialize_cli_log():
     return [
@@ -19,8 +26,12 @@ def initialize_cli_log():
     ]
 
 def run_cli():
-    conversation = initialize_cli_log()  # Create a new conversation array
-    conversation_id = initialize_conversation(conversation[0]["content"]) # Pass the system prompt and fetch conv. ID
+    system_prompt = initialize_cli_log()[0]["content"]
+    conversation = initialize_context_window(system_prompt)  # Token-budgeted window of recent turns
+    conversation_id = initialize_conversation(system_prompt) # Pass the system prompt and fetch conv. ID
+    enable_write_behind() # Persist messages in the background so turns don't wait on the database
+    start_memory_index(get_storage()) # Past messages searchable for recall once built in the background; kept current by append_message
+    summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer") # Summaries off the turn loop
 
     print("Welcome to Reverie (CLI Mode). Type 'exit' to quit.")
 
@@ -28,19 +39,35 @@ def run_cli():
         user_input = input("\nUser > ")
         if user_input.lower().strip() in ["exit", "quit"]:
             print("\nGoodbye!")
-            atexit.register(close_connection_pool())
+            summary_executor.shutdown(wait=True) # Let an in-flight summary update finish storing
+            finalize_conversation(conversation_id) # Message count, token usage and end time onto the conversation row
+            disable_write_behind() # Flush buffered messages before the pool goes away
+            close_storage()
             break
 
+        new_turn() # Correlates this turn's spans when REVERIE_TRACING is on
+
         # 1. Append user's message
         append_message(conversation_id, conversation, "user", user_input)
 
-        # 2. Query GPT with the *entire* conversation
-        #    (Make sure your query_gpt can handle a conversation list of messages)
-        assistant_reply = query_gpt(conversation)
+        # 2. Stream GPT's reply to the system prompt, recalled memories and the recent turns
+        #    that fit the token budget, printing each piece as it arrives
+        print("\nReverie > ", end="", flush=True)
+        reply_parts = []
+        for delta in stream_gpt(build_prompt(conversation_id, conversation, user_input)):
+            print(delta, end="", flush=True)
+            reply_parts.append(delta)
+        assistant_reply = "".join(reply_parts)
+        if not assistant_reply.strip():
+            print("(No reply this time. Please try again.)")
+            continue # Don't store or index an empty assistant turn
+        print()
 
         # 3. Append assistant's message to conversation
         append_message(conversation_id, conversation, "assistant", assistant_reply)
-        print(f"\nReverie > {assistant_reply}")
+
+        # 4. Fold turns that no longer fit the window into the rolling summary, on the worker thread
+        update_rolling_summary_in_background(conversation_id, conversation, summary_executor)
 
 if __name__ == "__main__":
     run_cli()
\ No newline at end of file
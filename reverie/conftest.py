@@ -0,0 +1,30 @@
+import openai
+import pytest
+
+from reverie import gpt_utils
+from reverie.cache_utils import PersistentLRUCache
+from reverie.fake_openai import FakeOpenAIServer
+
+
+@pytest.fixture
+def fake_server(monkeypatch):
+    """
+    fake_server(**server_args) starts a FakeOpenAIServer and points openai and gpt_utils at
+    it for the rest of the test. Each test also gets its own request scheduler (with fast
+    429 retries) and an empty in-memory completion cache, so no state leaks between tests.
+    """
+    monkeypatch.setattr(gpt_utils, "scheduler", gpt_utils.RequestScheduler(base_delay=0.01))
+    monkeypatch.setattr(gpt_utils, "completion_cache", PersistentLRUCache(":memory:", table="completions", ttl=60))
+    monkeypatch.setattr(gpt_utils, "completion_cache_saved_seconds", 0.0)
+    servers = []
+
+    def use(**server_args):
+        server = FakeOpenAIServer(**server_args).start()
+        servers.append(server)
+        monkeypatch.setattr(openai, "api_key", "fake-key")
+        monkeypatch.setattr(openai, "base_url", server.base_url)
+        return server
+
+    yield use
+    for server in servers:
+        server.stop()
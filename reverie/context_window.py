@@ -0,0 +1,100 @@
+# reverie/context_window.py
+
+import os
+import threading
+from collections import deque
+from typing import Callable, Dict, Iterable, List
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("REVERIE_CONTEXT_TOKENS", "4000"))
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separator tokens the chat format adds to every message
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+SUMMARY_PREFIX_TOKENS = 6
+
+
+class ContextWindow:
+    """
+    The messages sent to the model each turn: the system prompt, always pinned, plus
+    the most recent turns that fit in `token_budget`.
+
+    Token counts are kept per message as turns are added, so older turns are dropped
+    from the front in O(1) and no turn is ever re-encoded. The newest turn is always
+    kept, even if it alone exceeds the budget.
+
+    A rolling summary of older turns, when set, is sent right after the system prompt
+    and counts against the budget. With `keep_evicted`, dropped turns are collected in
+    `evicted` until the summarizer folds them into the summary. Updates are locked, so a
+    summary can be folded in on a worker thread while the conversation carries on.
+    """
+
+    def __init__(self, system_prompt: str, system_tokens: int, token_budget: int = CONTEXT_TOKEN_BUDGET,
+                 keep_evicted: bool = False):
+        self.system_message = {"role": "system", "content": system_prompt}
+        self.system_tokens = system_tokens + MESSAGE_OVERHEAD_TOKENS
+        self.token_budget = token_budget
+        self.turns = deque()  # (message, token_count) pairs, oldest first
+        self.turn_tokens = 0
+
+        self.summary = None
+        self.summary_tokens = 0
+        self.keep_evicted = keep_evicted
+        self.evicted = []  # Dropped turns not yet folded into the summary, oldest first
+        self.evicted_tokens = 0
+        self.summarizing = False  # Set while a summary update is in flight
+        self._lock = threading.RLock()
+
+    def add(self, role: str, content: str, token_count: int):
+        message_tokens = token_count + MESSAGE_OVERHEAD_TOKENS
+        with self._lock:
+            self.turns.append(({"role": role, "content": content}, message_tokens))
+            self.turn_tokens += message_tokens
+            self._trim()
+
+    def extend(self, messages: Iterable[Dict], count_tokens: Callable[[str], int]):
+        """
+        Adds already-stored messages (e.g. loaded from the database), counting their tokens.
+        """
+        for message in messages:
+            self.add(message["role"], message["content"], count_tokens(message["content"]))
+
+    def set_summary(self, summary: str, token_count: int):
+        with self._lock:
+            self.summary = summary or None
+            self.summary_tokens = token_count + SUMMARY_PREFIX_TOKENS + MESSAGE_OVERHEAD_TOKENS if summary else 0
+            self._trim()
+
+    def evicted_messages(self) -> List[Dict]:
+        with self._lock:
+            return [message for message, _ in self.evicted]
+
+    def clear_evicted(self, count: int):
+        """
+        Forgets the oldest `count` evicted turns once they have been folded into the summary.
+        """
+        with self._lock:
+            folded, self.evicted = self.evicted[:count], self.evicted[count:]
+            self.evicted_tokens -= sum(message_tokens for _, message_tokens in folded)
+
+    def _trim(self):
+        while len(self.turns) > 1 and self.token_count > self.token_budget:
+            evicted = self.turns.popleft()
+            self.turn_tokens -= evicted[1]
+            if self.keep_evicted:
+                self.evicted.append(evicted)
+                self.evicted_tokens += evicted[1]
+
+    @property
+    def token_count(self) -> int:
+        return self.system_tokens + self.summary_tokens + self.turn_tokens
+
+    def messages(self) -> List[Dict]:
+        """
+        Returns the prompt for the next completion: system prompt, summary, then recent turns.
+        """
+        with self._lock:
+            prompt = [self.system_message]
+            if self.summary:
+                prompt.append({"role": "system", "content": SUMMARY_PREFIX + self.summary})
+            return prompt + [message for message, _ in self.turns]
+
+    def __len__(self):
+        return len(self.turns) + (2 if self.summary else 1)
@@ -1,10 +1,22 @@
-from typing import List, Dict
-import tiktoken
+import asyncio
+import contextvars
+import functools
+from typing import List, Dict, Tuple, Union
 
-from db_utils import insert_into_table, generate_conversation_data, get_latest_conversation_id
-from reverie.db_utils import generate_message_data, get_recent_messages
+from reverie.storage import generate_conversation_data, generate_message_data, get_storage, run_in_storage_executor
+from reverie.conversation_stats import StatsAccumulator
+from reverie.write_buffer import WriteBehindBuffer
+from reverie.context_window import ContextWindow, CONTEXT_TOKEN_BUDGET
+from reverie.gpt_utils import count_tokens
+from reverie.memory_index import index_message, search_memory
+from reverie.tracing import span, traced
 
-encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+RECALL_K = 5  # Past messages recalled into the prompt each turn
+RECALL_MAX_CHARS = 500  # Recalled messages are truncated to this length
+
+message_buffer = None  # Set by enable_write_behind(); None means messages are inserted synchronously
+# Message counts and token usage per conversation, folded into the Conversations row in batches
+conversation_stats = StatsAccumulator(lambda rows: get_storage().apply_conversation_stats(rows))
 
 def initialize_conversation_log():
     return [
@@ -18,35 +30,180 @@ def initialize_conversation_log():
         }
     ]
 
-def initialize_conversation(system_prompt : str):
-    conversation_data = generate_conversation_data() # Generates the dictionary of conversation data
-    insert_into_table("Conversations", conversation_data) # Places dictionary into table
-    
-    conversation_id = get_latest_conversation_id()
-
-    insert_into_table(  # Place the system prompt into the Messages table under the conversation ID
-        "Messages",
-        generate_message_data(
-            conversation_id = conversation_id,
-            role = "system",
-            content = system_prompt,
-            token_count = 88
-        )
+def initialize_context_window(system_prompt: str, token_budget: int = CONTEXT_TOKEN_BUDGET) -> ContextWindow:
+    """
+    Creates a token-budgeted context window with the system prompt pinned at the front.
+    Turns that fall out of the window are kept for the rolling summarizer.
+    """
+    return ContextWindow(system_prompt, count_tokens(system_prompt), token_budget, keep_evicted=True)
+
+def add_to_conversation(conversation: Union[List[Dict], ContextWindow], role: str, content: str, token_count: int):
+    if isinstance(conversation, ContextWindow):
+        conversation.add(role, content, token_count)
+    else:
+        conversation.append({"role": role, "content": content})
+
+@traced("conversation.build_prompt")
+def build_prompt(conversation_id: str, window: ContextWindow, query: str, k: int = RECALL_K) -> List[Dict]:
+    """
+    Assembles the prompt for a turn: the window's system prompt and summary, the `k` past
+    messages from other conversations most relevant to `query`, then the recent turns.
+    """
+    messages = window.messages()
+    with span("memory.search"):
+        recalled = search_memory(query, k, exclude_conversation_id=conversation_id)
+    if not recalled:
+        return messages
+
+    memories = "\n".join(f"- {memory['role']}: {memory['content'][:RECALL_MAX_CHARS]}" for memory in recalled)
+    recall_message = {"role": "system", "content": f"Relevant messages from earlier conversations:\n{memories}"}
+    first_turn = 2 if window.summary else 1
+    return messages[:first_turn] + [recall_message] + messages[first_turn:]
+
+async def build_prompt_async(conversation_id: str, window: ContextWindow, query: str, k: int = RECALL_K) -> List[Dict]:
+    """
+    Async variant of build_prompt. The recall search is CPU-bound, so it runs on the
+    loop's default executor (with the caller's context, for its spans) instead of
+    holding up the event loop.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(None, functools.partial(context.run, build_prompt, conversation_id, window, query, k))
+
+@traced("conversation.initialize")
+def initialize_conversation(system_prompt : str, interface: str = None):
+    """
+    Creates a conversation and stores its system prompt in one atomic statement.
+    Returns the new conversation ID (None if the insert failed) for use in future message handling.
+    """
+    system_message = generate_message_data(  # The system prompt, stored under the new conversation's ID
+        conversation_id = None,
+        role = "system",
+        content = system_prompt,
+        token_count = count_tokens(system_prompt)
     )
+    conversation_data = generate_conversation_data(interface)  # Generates the dictionary of conversation data
+    conversation_data["message_count"] = 1  # The row starts out counting its system prompt
+    conversation_data["token_usage_total"] = system_message["token_count"]
+    return get_storage().create_conversation(conversation_data, system_message)
+
+@traced("conversation.resume")
+def resume_conversation(system_prompt: str, interface: str, token_budget: int = CONTEXT_TOKEN_BUDGET) -> Tuple[str, ContextWindow]:
+    """
+    Picks up the newest conversation held on `interface`, restoring its summary and as many
+    recent turns as fit the token budget, or starts a new one if there is none.
+    Returns (conversation_id, context window).
+    """
+    if message_buffer is not None:
+        message_buffer.flush()  # Make sure the latest turns are in the table before reading them back
+
+    window = initialize_context_window(system_prompt, token_budget)
+    latest = get_storage().get_latest_conversation_for_interface(interface)
+    if latest is None:
+        return initialize_conversation(system_prompt, interface), window
 
-    return conversation_id # Returns the conversation ID for use in future message handling
+    conversation_id, summary = latest
+    if summary:
+        window.set_summary(summary, count_tokens(summary))
+    remaining_budget = window.token_budget - window.token_count
+    for message in reversed(get_storage().get_recent_conversation_messages(conversation_id, remaining_budget)):
+        token_count = message["token_count"]
+        window.add(message["role"], message["content"], count_tokens(message["content"]) if token_count is None else token_count)
+    window.clear_evicted(len(window.evicted))  # Already stored and covered by the summary
+    return conversation_id, window
 
-def append_message(conversation_id: int, conversation: List[Dict], role: str, content: str):
-    insert_into_table(
-        "Messages",
-        generate_message_data(
-            conversation_id=conversation_id,
-            role=role,
-            content=content,
-            token_count=len(encoding.encode(content))
+def enable_write_behind(max_rows: int = 50, max_age: float = 1.0):
+    """
+    Routes append_message through a write-behind buffer so the database round trip
+    happens off the request path. Messages are flushed in bulk on size, age or shutdown.
+    """
+    global message_buffer
+    if message_buffer is None:
+        message_buffer = WriteBehindBuffer(
+            lambda rows: get_storage().insert_many_into_table("Messages", rows),
+            max_rows=max_rows,
+            max_age=max_age
         )
+    return message_buffer
+
+def disable_write_behind():
+    """
+    Flushes any buffered messages and returns append_message to synchronous inserts.
+    """
+    global message_buffer
+    if message_buffer is not None:
+        message_buffer.close()
+        message_buffer = None
+
+@traced("conversation.append_message")
+def append_message(conversation_id: int, conversation: Union[List[Dict], ContextWindow], role: str, content: str):
+    message_data = generate_message_data(
+        conversation_id=conversation_id,
+        role=role,
+        content=content,
+        token_count=count_tokens(content)
     )
-    conversation.append({"role": role, "content": content})
+
+    if message_buffer is not None:
+        message_buffer.enqueue(message_data)
+    else:
+        get_storage().insert_into_table("Messages", message_data)
+
+    if conversation_stats.record(conversation_id, role, message_data["token_count"], message_data["timestamp"]):
+        conversation_stats.flush()
+
+    index_message(conversation_id, role, content)
+    add_to_conversation(conversation, role, content, message_data["token_count"])
+
+@traced("conversation.append_message")
+async def append_message_async(conversation_id: int, conversation: Union[List[Dict], ContextWindow], role: str, content: str):
+    """
+    Async variant of append_message for event-loop callers such as the Discord client.
+    """
+    message_data = generate_message_data(
+        conversation_id=conversation_id,
+        role=role,
+        content=content,
+        token_count=count_tokens(content)
+    )
+
+    if message_buffer is not None:
+        message_buffer.enqueue(message_data)
+    else:
+        await run_in_storage_executor(get_storage().insert_into_table, "Messages", message_data)
+
+    if conversation_stats.record(conversation_id, role, message_data["token_count"], message_data["timestamp"]):
+        await run_in_storage_executor(conversation_stats.flush)
+
+    index_message(conversation_id, role, content)
+    add_to_conversation(conversation, role, content, message_data["token_count"])
+
+def finalize_conversation(conversation_id: str):
+    """
+    Closes a conversation: writes its pending message count and token usage to its row
+    and sets end_time and duration_seconds. Call when a CLI session exits or a Discord
+    session is evicted; a conversation resumed later is simply finalized again.
+    """
+    if conversation_id is not None:
+        conversation_stats.finalize(conversation_id)
+
+async def finalize_conversation_async(conversation_id: str):
+    await run_in_storage_executor(finalize_conversation, conversation_id)
+
+def verify_conversation_stats(conversation_id: str) -> Dict:
+    """
+    Compares a conversation's stored counters with an aggregate over its messages, after
+    writing anything still buffered. Returns {column: (stored, recomputed)} for every
+    counter that disagrees; an empty dictionary means they match.
+    """
+    if message_buffer is not None:
+        message_buffer.flush()
+    conversation_stats.flush()
+    stored = get_storage().get_conversation_stats(conversation_id)
+    recomputed = get_storage().recompute_conversation_stats(conversation_id)
+    if stored is None or recomputed is None:
+        return {"conversation": (stored, recomputed)}
+    return {column: (stored[column], recomputed[column]) for column in stored if stored[column] != recomputed[column]}
 
 def handle_user_message(conversation_id, user_input : str):
     pass
\ No newline at end of file
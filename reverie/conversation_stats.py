@@ -0,0 +1,136 @@
+# reverie/conversation_stats.py
+
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+# (conversation_id, messages, user tokens, assistant tokens, total tokens, end_time or None)
+StatsRow = Tuple[str, int, int, int, int, Optional[datetime]]
+
+
+class ConversationStats:
+    """
+    Counts for one conversation that have not been written to its row yet.
+    """
+
+    __slots__ = ("messages", "user_tokens", "assistant_tokens", "total_tokens")
+
+    def __init__(self):
+        self.messages = 0
+        self.user_tokens = 0
+        self.assistant_tokens = 0
+        self.total_tokens = 0
+
+    def add(self, role: str, token_count: int):
+        token_count = token_count or 0
+        self.messages += 1
+        self.total_tokens += token_count
+        if role == "user":
+            self.user_tokens += token_count
+        elif role == "assistant":
+            self.assistant_tokens += token_count
+
+    def merge(self, other: "ConversationStats"):
+        self.messages += other.messages
+        self.user_tokens += other.user_tokens
+        self.assistant_tokens += other.assistant_tokens
+        self.total_tokens += other.total_tokens
+
+class StatsAccumulator:
+    """
+    Keeps each conversation's message count and token usage up to date without
+    aggregate queries over Messages.
+
+    record() adds a message to the conversation's pending counts in memory. The counts
+    are written as increments, so they stay correct for resumed conversations and several
+    writers, by `apply(rows)` in one batched statement once `flush_every` messages are
+    pending, or by finalize(), which also stamps the conversation's end time. Counts
+    whose write fails are kept (and the error printed) and retried with the next flush.
+    """
+
+    def __init__(self, apply: Callable[[List[StatsRow]], None], flush_every: int = 50):
+        self.apply = apply
+        self.flush_every = flush_every
+        self._pending: Dict[str, ConversationStats] = {}
+        self._pending_messages = 0
+        self._last_message_at: Dict[str, datetime] = {}  # Survives flushes, for finalize()
+        self._lock = threading.Lock()
+
+        self.flushes = 0
+        self.rows_written = 0
+
+    def record(self, conversation_id: str, role: str, token_count: int, timestamp: Optional[datetime] = None) -> bool:
+        """
+        Counts one message. Returns True when enough are pending that flush() should be called.
+        """
+        with self._lock:
+            stats = self._pending.get(conversation_id)
+            if stats is None:
+                stats = self._pending[conversation_id] = ConversationStats()
+            stats.add(role, token_count)
+            if timestamp is not None:
+                self._last_message_at[conversation_id] = timestamp
+            self._pending_messages += 1
+            return self._pending_messages >= self.flush_every
+
+    def pending(self, conversation_id: str) -> Optional[ConversationStats]:
+        with self._lock:
+            return self._pending.get(conversation_id)
+
+    def _take(self, conversation_ids=None) -> Dict[str, ConversationStats]:
+        """
+        Removes and returns pending counts (all of them, or those of `conversation_ids`). Call with the lock held.
+        """
+        if conversation_ids is None:
+            taken, self._pending = self._pending, {}
+        else:
+            taken = {cid: self._pending.pop(cid) for cid in conversation_ids if cid in self._pending}
+        self._pending_messages -= sum(stats.messages for stats in taken.values())
+        return taken
+
+    def _restore(self, taken: Dict[str, ConversationStats]):
+        with self._lock:
+            for conversation_id, stats in taken.items():
+                current = self._pending.get(conversation_id)
+                if current is not None:
+                    stats.merge(current)
+                self._pending[conversation_id] = stats
+            self._pending_messages += sum(stats.messages for stats in taken.values())
+
+    def _write(self, taken: Dict[str, ConversationStats], end_times: Dict[str, datetime]) -> bool:
+        rows = []
+        for conversation_id in {**taken, **end_times}:
+            stats = taken.get(conversation_id) or ConversationStats()
+            rows.append((conversation_id, stats.messages, stats.user_tokens, stats.assistant_tokens,
+                         stats.total_tokens, end_times.get(conversation_id)))
+        if not rows:
+            return True
+        try:
+            self.apply(rows)
+        except Exception as e:
+            print(f"Error writing conversation stats: {e}")
+            self._restore(taken)
+            return False
+        with self._lock:
+            self.flushes += 1
+            self.rows_written += len(rows)
+        return True
+
+    def flush(self) -> bool:
+        """
+        Writes every conversation's pending counts in one batch. Returns False if the write failed.
+        """
+        with self._lock:
+            taken = self._take()
+        return self._write(taken, {})
+
+    def finalize(self, conversation_id: str, end_time: Optional[datetime] = None) -> bool:
+        """
+        Writes the conversation's pending counts and sets its end time (by default, the
+        time of its last recorded message, or now if there was none).
+        """
+        with self._lock:
+            taken = self._take([conversation_id])
+            last = self._last_message_at.pop(conversation_id, None)
+        end_time = end_time or last or datetime.now(timezone.utc)
+        return self._write(taken, {conversation_id: end_time})
@@ -0,0 +1,250 @@
+# reverie/db_pool.py
+
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Dict, Optional
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection became free within the pool's checkout timeout.
+    """
+
+def pool_config_from_env() -> Dict:
+    """
+    Connection pool settings from REVERIE_DB_* environment variables, falling back to
+    the local development database.
+    """
+    return {
+        "dbname": os.getenv("REVERIE_DB_NAME", "reverie_memory"),
+        "user": os.getenv("REVERIE_DB_USER", "reverie_user"),
+        "password": os.getenv("REVERIE_DB_PASSWORD", "dreamNoLonger00"),
+        "host": os.getenv("REVERIE_DB_HOST", "localhost"),
+        "port": os.getenv("REVERIE_DB_PORT", "5432"),
+        "min_connections": int(os.getenv("REVERIE_DB_POOL_MIN", "1")),
+        "max_connections": int(os.getenv("REVERIE_DB_POOL_MAX", "10")),
+        "checkout_timeout": float(os.getenv("REVERIE_DB_POOL_TIMEOUT", "30")),
+        "validate_after": float(os.getenv("REVERIE_DB_VALIDATE_AFTER", "30")),
+        "statement_timeout_ms": int(os.getenv("REVERIE_DB_STATEMENT_TIMEOUT_MS", "30000")),
+    }
+
+def postgres_connector(dbname: str, user: str, password: str, host: str, port: str,
+                       statement_timeout_ms: int = 0) -> Callable:
+    """
+    Returns a function opening a psycopg2 connection with the given statement timeout
+    (0 disables it), so no query can hold a pooled connection indefinitely.
+    """
+    import psycopg2
+
+    options = f"-c statement_timeout={statement_timeout_ms}" if statement_timeout_ms else None
+
+    def connect():
+        return psycopg2.connect(dbname=dbname, user=user, password=password, host=host, port=port, options=options)
+
+    return connect
+
+class _Waiter:
+    """
+    A thread queued for a connection; putconn() hands one straight to the oldest waiter.
+    """
+
+    __slots__ = ("condition", "granted", "connection", "returned_at")
+
+    def __init__(self, lock):
+        self.condition = threading.Condition(lock)
+        self.granted = False
+        self.connection = None  # None with `granted` means a free slot to open a connection in
+        self.returned_at = None
+
+class ConnectionPool:
+    """
+    A thread-safe, bounded pool of database connections.
+
+    Connections are opened on demand up to `max_connections`. When all are in use,
+    checkout queues first-come first-served (a returned connection goes straight to the
+    longest waiter, so no thread starves) for up to `checkout_timeout` seconds and then
+    raises PoolTimeout. A connection that has sat idle for more than `validate_after`
+    seconds is checked with `SELECT 1` before being handed out, and replaced if the
+    server has gone away. Connections closed while checked out are discarded on return.
+    Wait times and counts are kept for stats().
+    """
+
+    def __init__(self, connect: Callable, min_connections: int = 1, max_connections: int = 10,
+                 checkout_timeout: float = 30.0, validate_after: float = 30.0):
+        self.connect = connect
+        self.min_connections = min_connections
+        self.max_connections = max_connections
+        self.checkout_timeout = checkout_timeout
+        self.validate_after = validate_after
+
+        self._idle = []  # (connection, time returned), most recently returned last
+        self._open = 0   # Connections open or being opened, idle or checked out
+        self._waiters = deque()  # Oldest first
+        self._closed = False
+        self._lock = threading.Lock()
+
+        self.checkouts = 0
+        self.timeouts = 0
+        self.connections_opened = 0
+        self.reconnects = 0  # Stale or broken connections replaced
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.in_use_high_water = 0
+
+        for _ in range(min_connections):
+            self._open += 1
+            self._idle.append((self._open_connection(), time.monotonic()))
+
+    def _open_connection(self):
+        """
+        Opens a connection for a slot already counted in _open.
+        """
+        connection = self.connect()
+        with self._lock:
+            self.connections_opened += 1
+        return connection
+
+    @property
+    def in_use(self) -> int:
+        return self._open - len(self._idle)
+
+    def getconn(self, timeout: Optional[float] = None):
+        """
+        Checks out a connection; pair with putconn(), or use connection() instead.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        start = time.monotonic()
+        with self._lock:
+            if self._closed:
+                raise PoolTimeout("Connection pool is closed")
+            if self._idle and not self._waiters:
+                connection, returned_at = self._idle.pop()
+            elif self._open < self.max_connections:
+                self._open += 1  # Reserve the slot; connect outside the lock
+                connection, returned_at = None, None
+            else:
+                waiter = _Waiter(self._lock)
+                self._waiters.append(waiter)
+                while not waiter.granted:
+                    remaining = timeout - (time.monotonic() - start)
+                    if remaining <= 0 or self._closed:
+                        self._waiters.remove(waiter)
+                        self.timeouts += 1
+                        raise PoolTimeout(f"No database connection free after {time.monotonic() - start:.1f}s "
+                                          f"({self.max_connections} in use)")
+                    waiter.condition.wait(remaining)
+                connection, returned_at = waiter.connection, waiter.returned_at
+
+            waited = time.monotonic() - start
+            self.checkouts += 1
+            self.wait_seconds += waited
+            self.max_wait_seconds = max(self.max_wait_seconds, waited)
+            self.in_use_high_water = max(self.in_use_high_water, self.in_use)
+
+        try:
+            if connection is None:
+                return self._open_connection()
+            if connection.closed or time.monotonic() - returned_at > self.validate_after:
+                return self._validated(connection)
+            return connection
+        except Exception:
+            with self._lock:
+                self._release_slot()
+            raise
+
+    def _validated(self, connection):
+        """
+        Returns `connection` if it still answers, otherwise a fresh replacement.
+        """
+        if not connection.closed:
+            try:
+                with connection.cursor() as cursor:
+                    cursor.execute("SELECT 1")
+                connection.rollback()
+                return connection
+            except Exception as e:
+                print(f"Replacing stale database connection: {e}")
+        self._close_quietly(connection)
+        with self._lock:
+            self.reconnects += 1
+        return self._open_connection()
+
+    def _release_slot(self):
+        """
+        Frees the slot of a connection that was closed, or hands it to the next waiter. Call with the lock held.
+        """
+        if self._waiters and not self._closed:
+            self._grant(self._waiters.popleft(), None)
+        else:
+            self._open -= 1
+
+    def _grant(self, waiter: _Waiter, connection):
+        waiter.granted = True
+        waiter.connection = connection
+        waiter.returned_at = time.monotonic()
+        waiter.condition.notify()
+
+    def putconn(self, connection, discard: bool = False):
+        """
+        Returns a connection. Any open transaction is rolled back; closed or discarded
+        connections are dropped from the pool.
+        """
+        if not discard and not connection.closed:
+            try:
+                connection.rollback()  # A no-op after commit; never leak a half-done transaction
+            except Exception:
+                discard = True
+        with self._lock:
+            if discard or connection.closed or self._closed:
+                self._close_quietly(connection)
+                self._release_slot()
+            elif self._waiters:
+                self._grant(self._waiters.popleft(), connection)
+            else:
+                self._idle.append((connection, time.monotonic()))
+
+    @contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """
+        with pool.connection() as connection: ...  — returned to the pool on exit, even on error.
+        """
+        connection = self.getconn(timeout)
+        try:
+            yield connection
+        finally:
+            self.putconn(connection)
+
+    @staticmethod
+    def _close_quietly(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            for connection, _ in self._idle:
+                self._close_quietly(connection)
+            self._open -= len(self._idle)
+            self._idle = []
+            for waiter in self._waiters:
+                waiter.condition.notify()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "open": self._open,
+                "in_use": self.in_use,
+                "in_use_high_water": self.in_use_high_water,
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "waiting": len(self._waiters),
+                "connections_opened": self.connections_opened,
+                "reconnects": self.reconnects,
+                "mean_wait_ms": self.wait_seconds / self.checkouts * 1000 if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait_seconds * 1000,
+            }
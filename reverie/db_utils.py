@@ -1,73 +1,133 @@
+import asyncio
+import contextvars
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
 import psycopg2
-from psycopg2.pool import SimpleConnectionPool
-from psycopg2.extras import Json
-from datetime import datetime, timezone
-
-connection_pool = SimpleConnectionPool(
-    minconn = 1,
-    maxconn = 10,
-    dbname = "reverie_memory",
-    user = "reverie_user",
-    password = "dreamNoLonger00",
-    host = "localhost",
-    port = "5432"
-)
+from psycopg2.extras import Json, execute_values
+from datetime import datetime
+
+from reverie.db_pool import ConnectionPool, pool_config_from_env, postgres_connector
+from reverie.storage import STATS_COLUMNS, generate_conversation_data, generate_message_data  # Backend-neutral
+from reverie.tracing import traced
+
+pool_config = pool_config_from_env()
+POOL_MAX_CONNECTIONS = pool_config["max_connections"]
+
+# Created on first use by get_pool(), so importing this module never touches the database.
+# The pool is thread-safe: connections are checked out from the async executor and the
+# write-behind thread as well as the main thread.
+connection_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool() -> ConnectionPool:
+    global connection_pool
+    if connection_pool is None:
+        with _pool_lock:
+            if connection_pool is None:
+                connect = postgres_connector(
+                    pool_config["dbname"], pool_config["user"], pool_config["password"],
+                    pool_config["host"], pool_config["port"], pool_config["statement_timeout_ms"]
+                )
+                connection_pool = ConnectionPool(
+                    connect,
+                    min_connections=pool_config["min_connections"],
+                    max_connections=POOL_MAX_CONNECTIONS,
+                    checkout_timeout=pool_config["checkout_timeout"],
+                    validate_after=pool_config["validate_after"]
+                )
+    return connection_pool
+
+def checkout():
+    """
+    with checkout() as connection: ... — borrows a pooled connection and returns it on exit.
+    """
+    return get_pool().connection()
+
+@contextmanager
+def transaction():
+    """
+    with transaction() as cursor: ... — runs several statements as one unit of work,
+    committed when the block finishes and rolled back if it raises.
+    """
+    with checkout() as connection:
+        try:
+            with connection.cursor() as cursor:
+                yield cursor
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+
+@contextmanager
+def autocommit():
+    """
+    with autocommit() as cursor: ... — each statement commits on its own as soon as it runs.
+    For single-statement writes this saves the BEGIN and COMMIT round trips of transaction().
+    """
+    with checkout() as connection:
+        connection.autocommit = True
+        try:
+            with connection.cursor() as cursor:
+                yield cursor
+        finally:
+            connection.autocommit = False
 
 def get_connection():
     try:
-        return connection_pool.getconn()
+        return get_pool().getconn()
     except Exception as e:
         print(f"Error retrieving connection: {e}")
         raise
 
 def release_connection(connection):
     try:
-        connection_pool.putconn(connection)
+        get_pool().putconn(connection)
     except Exception as e:
         print(f"Error releasing connection: {e}")
         raise
 
+def pool_stats() -> dict:
+    """
+    Checkout counts and wait times of the connection pool (empty before first use).
+    """
+    return connection_pool.stats() if connection_pool is not None else {}
+
+# Bounded executor for the async wrappers below. Kept smaller than the pool so that
+# async callers can never exhaust it and starve the write-behind thread.
+db_executor = ThreadPoolExecutor(max_workers=max(1, POOL_MAX_CONNECTIONS - 2), thread_name_prefix="reverie-db")
+
+async def run_in_db_executor(func, *args, **kwargs):
+    """
+    Runs a blocking db_utils function on the database executor without blocking the event loop.
+    The caller's context goes with it, so its spans carry the caller's turn id.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(db_executor, functools.partial(context.run, func, *args, **kwargs))
+
 def close_connection_pool():
+    global connection_pool
+    if connection_pool is None:
+        return
     try:
         connection_pool.closeall()
+        connection_pool = None
     except Exception as e:
         print(f"Error closing connection pool: {e}")
         raise
 
-def generate_conversation_data():
-    return {
-        "user_id": "Rewind",  # Current default user
-        "interface": None,  # Placeholder; can be set later if needed
-        "start_time": datetime.now(timezone.utc),  # Record the current UTC time as the start time
-        "end_time": None,  # End time is null at the beginning
-        "duration_seconds": None,  # Duration will be calculated when the conversation ends
-        "message_count": 0,  # Initialize with 0 messages
-        "summary": None,  # No summary initially
-        "tags": None,  # Tags will be set later if needed
-        "token_usage_user": 0,  # Initialize user token usage as 0
-        "token_usage_assistant": 0,  # Initialize assistant token usage as 0
-        "token_usage_total": 0,  # Initialize total token usage as 0
-        "model_version": None,  # Placeholder; can be set dynamically during the conversation
-    }
-
-def generate_message_data(conversation_id: str, role: str, content: str, token_count: int, sentiment_score: float = None, custom_metrics: dict = None):
-    return {
-        "conversation_id": conversation_id,  # Link to the conversation
-        "role": role,  # Role of the sender
-        "content": content,  # Message content
-        "timestamp": datetime.now(timezone.utc),  # Current UTC time
-        "token_count": token_count,  # Number of tokens in the message
-        "sentiment_score": sentiment_score,  # Optional sentiment score
-        "custom_metrics": custom_metrics,  # Optional additional metrics
-    }
-
-def insert_into_table(table_name: str, data: dict):
-    """
-    Inserts data into a specified PostgreSQL table.
+@traced("db.insert_into_table")
+def insert_into_table(table_name: str, data: dict, returning: str = None):
+    """
+    Inserts data into a specified PostgreSQL table and commits it.
 
     Parameters:
         table_name (str): The name of the table.
         data (dict): A dictionary of column names and their values.
+        returning (str): Optional column of the new row to return, e.g. its generated id.
     """
 
     # Construct column names and placeholders for SQL
@@ -76,90 +136,353 @@ def insert_into_table(table_name: str, data: dict):
 
     # Insertion query
     query = f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders})"
+    if returning:
+        query += f" RETURNING {returning}"
 
     try:
-        # Connect to the database
-        connection = get_connection()
-        with connection.cursor() as cursor:
+        # A single statement, so it is committed on its own in one round trip
+        with autocommit() as cursor:
             cursor.execute(query, {k: (Json(v) if isinstance(v, dict) else v) for k, v in data.items()})
+            return cursor.fetchone()[0] if returning else None
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return None
+
+@traced("db.create_conversation")
+def create_conversation(conversation_data: dict, system_message: dict):
+    """
+    Inserts a conversation and its system message with one statement: a data-modifying
+    CTE inserts the conversation and hands its generated id to the message insert. The
+    statement is atomic and commits on its own, so this is a single round trip.
+    Returns the new conversation_id, or None on error.
+
+    Parameters:
+        conversation_data (dict): Conversations columns, as from generate_conversation_data().
+        system_message (dict): Messages columns, as from generate_message_data(); its
+            conversation_id is ignored.
+    """
+    message_data = {key: value for key, value in system_message.items() if key != "conversation_id"}
+    params = {f"c_{key}": value for key, value in conversation_data.items()}
+    params.update({f"m_{key}": value for key, value in message_data.items()})
+    query = (
+        f"WITH new_conversation AS ("
+        f"INSERT INTO Conversations ({', '.join(conversation_data)}) "
+        f"VALUES ({', '.join(f'%(c_{key})s' for key in conversation_data)}) RETURNING conversation_id) "
+        f"INSERT INTO Messages (conversation_id, {', '.join(message_data)}) "
+        f"SELECT conversation_id, {', '.join(f'%(m_{key})s' for key in message_data)} FROM new_conversation "
+        f"RETURNING conversation_id;"
+    )
+
+    try:
+        with autocommit() as cursor:
+            cursor.execute(query, {k: (Json(v) if isinstance(v, dict) else v) for k, v in params.items()})
+            return cursor.fetchone()[0]
     except psycopg2.Error as e:
         print(f"Database error: {e}")
-    finally:
-        if connection:
-            release_connection(connection)
+        return None
+
+@traced("db.insert_many_into_table")
+def insert_many_into_table(table_name: str, rows: list, page_size: int = 500):
+    """
+    Inserts several rows into a PostgreSQL table with multi-row INSERT statements
+    and commits them as one transaction.
+
+    Parameters:
+        table_name (str): The name of the table.
+        rows (list): Dictionaries of column names and their values, all sharing the same keys.
+        page_size (int): Maximum number of rows sent per INSERT statement.
+    """
+    if not rows:
+        return
+
+    keys = list(rows[0].keys())
+    columns = ", ".join(keys)
+    query = f"INSERT INTO {table_name} ({columns}) VALUES %s"
+    values = [tuple(Json(row[key]) if isinstance(row[key], dict) else row[key] for key in keys) for row in rows]
+
+    with checkout() as connection:
+        try:
+            with connection.cursor() as cursor:
+                execute_values(cursor, query, values, page_size=page_size)
+            connection.commit()
+        except psycopg2.Error as e:
+            print(f"Database error: {e}")
+            connection.rollback()
+            raise
 
 def update_table_column_by_id(table_name: str, column_name: str, id_column: str, record_id: str, value):
     query = f"UPDATE {table_name} SET {column_name} = %s WHERE {id_column} = %s"
     try:
-        connection = get_connection()
-        with connection.cursor() as cursor:
+        with checkout() as connection, connection.cursor() as cursor:
             cursor.execute(query, (value, record_id))
             connection.commit()
     except psycopg2.Error as e:
         print(f"Database error: {e}")
-    finally:
-        if connection:
-            release_connection(connection)
+
+@traced("db.bulk_update_table_column_by_id")
+def bulk_update_table_column_by_id(table_name: str, column_name: str, id_column: str, values: dict,
+                                   id_cast: str = None, value_cast: str = None, page_size: int = 500):
+    """
+    Updates one column for many rows with a single UPDATE ... FROM (VALUES ...) statement
+    inside one transaction. Either every row is updated or none are.
+
+    Parameters:
+        table_name (str): The name of the table.
+        column_name (str): The column to set.
+        id_column (str): The column identifying each row.
+        values (dict): Maps record ids to their new values.
+        id_cast (str): Optional SQL type for the ids, e.g. "uuid".
+        value_cast (str): Optional SQL type for the values, e.g. "jsonb".
+    """
+    if not values:
+        return
+
+    id_placeholder = f"%s::{id_cast}" if id_cast else "%s"
+    value_placeholder = f"%s::{value_cast}" if value_cast else "%s"
+    query = (
+        f"UPDATE {table_name} AS t SET {column_name} = v.value "
+        f"FROM (VALUES %s) AS v(id, value) WHERE t.{id_column} = v.id"
+    )
+
+    with checkout() as connection:
+        try:
+            with connection.cursor() as cursor:
+                execute_values(cursor, query, list(values.items()),
+                               template=f"({id_placeholder}, {value_placeholder})", page_size=page_size)
+            connection.commit()
+        except psycopg2.Error as e:
+            print(f"Database error: {e}")
+            connection.rollback()
+            raise
+
+@traced("db.apply_conversation_stats")
+def apply_conversation_stats(rows: list, page_size: int = 500):
+    """
+    Adds message counts and token usage to many conversation rows with a single
+    UPDATE ... FROM (VALUES ...) statement. Counts are increments, so concurrent writers
+    and resumed conversations stay correct. Rows with an end time also get end_time and
+    duration_seconds set.
+
+    Parameters:
+        rows (list): (conversation_id, messages, user tokens, assistant tokens, total tokens, end_time or None) tuples.
+    """
+    if not rows:
+        return
+
+    query = (
+        "UPDATE Conversations AS c SET "
+        "message_count = c.message_count + v.messages, "
+        "token_usage_user = c.token_usage_user + v.user_tokens, "
+        "token_usage_assistant = c.token_usage_assistant + v.assistant_tokens, "
+        "token_usage_total = c.token_usage_total + v.total_tokens, "
+        "end_time = COALESCE(v.end_time, c.end_time), "
+        "duration_seconds = COALESCE(EXTRACT(EPOCH FROM v.end_time - c.start_time), c.duration_seconds) "
+        "FROM (VALUES %s) AS v(id, messages, user_tokens, assistant_tokens, total_tokens, end_time) "
+        "WHERE c.conversation_id = v.id"
+    )
+
+    with checkout() as connection:
+        try:
+            with connection.cursor() as cursor:
+                execute_values(cursor, query, rows, template="(%s::uuid, %s, %s, %s, %s, %s::timestamptz)",
+                               page_size=page_size)
+            connection.commit()
+        except psycopg2.Error as e:
+            print(f"Database error: {e}")
+            connection.rollback()
+            raise
+
+def get_conversation_stats(conversation_id: str):
+    """
+    The counters stored on a conversation's row, as a dictionary keyed by STATS_COLUMNS.
+    """
+    try:
+        with checkout() as connection, connection.cursor() as cursor:
+            cursor.execute(f"SELECT {', '.join(STATS_COLUMNS)} FROM Conversations WHERE conversation_id = %s;",
+                           (conversation_id,))
+            result = cursor.fetchone()
+            return dict(zip(STATS_COLUMNS, result)) if result else None
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return None
+
+def recompute_conversation_stats(conversation_id: str):
+    """
+    The same counters aggregated from the conversation's messages, for checking the stored ones.
+    """
+    try:
+        with checkout() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT COUNT(*), "
+                "COALESCE(SUM(token_count) FILTER (WHERE role = 'user'), 0), "
+                "COALESCE(SUM(token_count) FILTER (WHERE role = 'assistant'), 0), "
+                "COALESCE(SUM(token_count), 0) "
+                "FROM Messages WHERE conversation_id = %s;",
+                (conversation_id,)
+            )
+            return dict(zip(STATS_COLUMNS, cursor.fetchone()))
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return None
 
 def get_first_conversation_id():
     try:
-        connection = get_connection()
-        with connection.cursor() as cursor:
+        with checkout() as connection, connection.cursor() as cursor:
             cursor.execute("SELECT conversation_id FROM Conversations ORDER BY start_time ASC LIMIT 1;")
             result = cursor.fetchone()
             return result[0] if result else None
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         return None
-    finally:
-        if connection:
-            release_connection(connection)
 
 def get_latest_conversation_id():
     try:
-        connection = get_connection()
-        with connection.cursor() as cursor:
+        with checkout() as connection, connection.cursor() as cursor:
             cursor.execute("SELECT conversation_id FROM Conversations ORDER BY start_time DESC LIMIT 1;")
             result = cursor.fetchone()
             return result[0] if result else None
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         return None
-    finally:
-        if connection:
-            release_connection(connection)
 
 def get_untagged_conversation_ids():
+    """
+    Returns conversations that still have messages without tags, oldest first. Driven by
+    the messages themselves (through messages_untagged_idx), so a backfill only revisits
+    conversations with new or previously failed messages.
+    """
     try:
-        connection = get_connection()
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT conversation_id FROM Conversations WHERE tags IS NULL ORDER BY start_time ASC;")
+        with checkout() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT conversation_id FROM Conversations WHERE conversation_id IN "
+                "(SELECT conversation_id FROM Messages WHERE tags IS NULL OR tags = '[]') ORDER BY start_time ASC;"
+            )
             results = cursor.fetchall()
             return [row[0] for row in results]
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         return []
-    finally:
-        if connection:
-            release_connection(connection)
 
+def get_unsummarized_closed_conversation_ids(closed_before: datetime):
+    """
+    Returns conversations without a summary that have ended, or that started before
+    `closed_before` and are therefore treated as closed, oldest first.
+    """
+    try:
+        with checkout() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT conversation_id FROM Conversations WHERE summary IS NULL "
+                "AND (end_time IS NOT NULL OR start_time < %s) ORDER BY start_time ASC;",
+                (closed_before,)
+            )
+            return [row[0] for row in cursor.fetchall()]
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return []
+
+def get_conversation_messages(conversation_id: str):
+    """
+    Returns a conversation's non-system messages as role/content/token_count dictionaries, oldest first.
+    """
+    try:
+        with checkout() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT role, content, token_count FROM Messages WHERE conversation_id = %s AND role != 'system' "
+                "ORDER BY timestamp ASC;",
+                (conversation_id,)
+            )
+            return [{"role": role, "content": content, "token_count": token_count}
+                    for role, content, token_count in cursor.fetchall()]
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return []
+
+@traced("db.get_recent_messages")
 def get_recent_messages(num_messages: int = 100):
     try:
-        connection = get_connection()
-        with connection.cursor() as cursor:
-            cursor.execute("SELECT role, content FROM messages WHERE role != 'system' ORDER BY timestamp ASC LIMIT %s;", (num_messages,))
-            return [{"role": role, "content": content} for role, content in cursor.fetchall()]
+        with checkout() as connection, connection.cursor() as cursor:
+            # Take the newest messages, then return them oldest first
+            cursor.execute("SELECT role, content FROM messages WHERE role != 'system' ORDER BY timestamp DESC LIMIT %s;", (num_messages,))
+            return [{"role": role, "content": content} for role, content in reversed(cursor.fetchall())]
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         return []
-    finally:
-        if connection:
-            release_connection(connection)
+
+@traced("db.get_latest_conversation_for_interface")
+def get_latest_conversation_for_interface(interface: str):
+    """
+    Returns (conversation_id, summary) of the newest conversation held on `interface`, or None.
+    """
+    try:
+        with checkout() as connection, connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT conversation_id, summary FROM Conversations WHERE interface = %s ORDER BY start_time DESC LIMIT 1;",
+                (interface,)
+            )
+            return cursor.fetchone()
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return None
+
+@traced("db.get_recent_conversation_messages")
+def get_recent_conversation_messages(conversation_id: str, token_budget: int, page_size: int = 50):
+    """
+    Returns the newest non-system messages of a conversation whose stored token counts fit
+    in `token_budget`, newest first. Pages backwards with keyset pagination on
+    (conversation_id, timestamp, message_id), so only the rows needed are read however long
+    the conversation is, and messages sharing a timestamp across a page boundary aren't skipped.
+    """
+    messages = []
+    tokens = 0
+    before = (None, None)
+    try:
+        with checkout() as connection, connection.cursor() as cursor:
+            while True:
+                cursor.execute(
+                    "SELECT role, content, token_count, timestamp, message_id FROM Messages "
+                    "WHERE conversation_id = %s AND role != 'system' "
+                    "AND (%s::timestamptz IS NULL OR (timestamp, message_id) < (%s, %s::uuid)) "
+                    "ORDER BY timestamp DESC, message_id DESC LIMIT %s;",
+                    (conversation_id, before[0], before[0], before[1], page_size)
+                )
+                page = cursor.fetchall()
+                for role, content, token_count, timestamp, message_id in page:
+                    tokens += token_count or 0
+                    if tokens > token_budget and messages:
+                        return messages
+                    messages.append({"role": role, "content": content, "token_count": token_count})
+                if len(page) < page_size:
+                    return messages
+                before = page[-1][3:]
+    except psycopg2.Error as e:
+        print(f"Database error: {e}")
+        return messages
+
+def iter_all_messages(batch_size: int = 10_000, since=None, until=None):
+    """
+    Streams every non-system message as a conversation_id/role/content/timestamp/message_id
+    dictionary, oldest first, through a server-side cursor so memory stays flat however
+    large the table is. `since` (inclusive) and `until` (exclusive) limit it to a time range.
+    """
+    with checkout() as connection:
+        try:
+            with connection.cursor(name="reverie_iter_all_messages") as cursor:
+                cursor.itersize = batch_size
+                cursor.execute("SELECT conversation_id, role, content, timestamp, message_id FROM Messages "
+                               "WHERE role != 'system' AND timestamp >= %s::timestamptz AND timestamp < %s::timestamptz "
+                               "ORDER BY timestamp ASC;",
+                               (since or "-infinity", until or "infinity"))
+                for conversation_id, role, content, timestamp, message_id in cursor:
+                    yield {"conversation_id": conversation_id, "role": role, "content": content,
+                           "timestamp": timestamp, "message_id": message_id}
+            connection.commit()  # Closes the transaction the named cursor ran in
+        except psycopg2.Error as e:
+            print(f"Database error: {e}")
+            connection.rollback()
 
 def get_all_messages_in_conversation(conversation_id: str):
     try:
-        connection = get_connection()
-        with connection.cursor() as cursor:
+        with checkout() as connection, connection.cursor() as cursor:
             query = "SELECT message_id, content FROM Messages WHERE conversation_id = %s ORDER BY timestamp ASC;"
             cursor.execute(query, (conversation_id,))
             results = cursor.fetchall()
@@ -167,14 +490,10 @@ def get_all_messages_in_conversation(conversation_id: str):
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         return {}
-    finally:
-        if connection:
-            release_connection(connection)
 
 def get_all_untagged_messages_in_conversation(conversation_id: str):
     try:
-        connection = get_connection()
-        with connection.cursor() as cursor:
+        with checkout() as connection, connection.cursor() as cursor:
             query = "SELECT message_id, content FROM messages WHERE conversation_id = %s AND (tags is NULL OR tags = '[]') ORDER BY timestamp ASC;"
             cursor.execute(query, (conversation_id,))
             results = cursor.fetchall()
@@ -182,6 +501,3 @@ def get_all_untagged_messages_in_conversation(conversation_id: str):
     except psycopg2.Error as e:
         print(f"Database error: {e}")
         return {}
-    finally:
-        if connection:
-            release_connection(connection)
\ No newline at end of file
@@ -1,11 +1,19 @@
 import os
+import time
 from dotenv import load_dotenv
 
 import discord
 
-from reverie.conversation_manager import initialize_conversation_log, initialize_conversation, append_message
-from reverie.db_utils import get_recent_messages
-from reverie.gpt_utils import query_gpt
+from reverie.conversation_manager import (
+    initialize_conversation_log, append_message_async, build_prompt_async, enable_write_behind, disable_write_behind,
+    resume_conversation, finalize_conversation_async
+)
+from reverie.storage import close_storage, get_storage, run_in_storage_executor
+from reverie.memory_index import start_memory_index
+from reverie.gpt_utils import stream_gpt_async
+from reverie.sessions import Session, SessionRegistry
+from reverie.summarizer import update_rolling_summary_async
+from reverie.tracing import new_turn
 
 load_dotenv()
 DISCORD_TOKEN = os.getenv("DISCORD_API_KEY")
@@ -13,10 +21,63 @@ DISCORD_TOKEN = os.getenv("DISCORD_API_KEY")
 intents = discord.Intents.default()
 intents.message_content = True
 
-client = discord.Client(intents=intents)
-
-conversation_id = ""
-conversation_log = []
+class ReverieClient(discord.Client):
+    async def close(self):
+        try:
+            await sessions.close()  # End time, duration and pending counters for every open conversation
+        finally:
+            await super().close()
+
+client = ReverieClient(intents=intents)
+
+SYSTEM_PROMPT = initialize_conversation_log()[0]["content"]
+MAX_SESSIONS = int(os.getenv("REVERIE_MAX_SESSIONS", "1000"))
+SESSION_IDLE_TIMEOUT = float(os.getenv("REVERIE_SESSION_IDLE_SECONDS", "1800"))
+
+EDIT_INTERVAL = 1.0  # Minimum seconds between edits of a streaming reply, to stay inside Discord's rate limits
+FALLBACK_REPLY = "Sorry, I couldn't come up with a reply just now. Please try again."
+
+async def stream_reply(channel, deltas) -> str:
+    """
+    Sends the reply as soon as its first piece arrives, then edits the message as more
+    text streams in, at most once per EDIT_INTERVAL. Returns the full reply text. If the
+    stream fails or ends without any text, FALLBACK_REPLY is sent and "" returned.
+    """
+    text = shown = ""
+    sent_message = None
+    last_edit = 0.0
+    async for delta in deltas:
+        text += delta
+        if sent_message is None:
+            if text.strip():
+                sent_message = await channel.send(text)
+                shown, last_edit = text, time.monotonic()
+        elif time.monotonic() - last_edit >= EDIT_INTERVAL:
+            await sent_message.edit(content=text)
+            shown, last_edit = text, time.monotonic()
+
+    if sent_message is None:
+        await channel.send(FALLBACK_REPLY)
+        return ""
+    if shown != text:
+        await sent_message.edit(content=text)
+    return text
+
+def session_key(channel) -> str:
+    """
+    Each channel or thread (threads are channels too) gets its own conversation.
+    """
+    return f"discord:{channel.id}"
+
+async def load_session(key: str) -> Session:
+    conversation_id, window = await run_in_storage_executor(resume_conversation, SYSTEM_PROMPT, key)
+    return Session(key, conversation_id, window)
+
+async def finalize_session(session: Session):
+    await finalize_conversation_async(session.conversation_id)
+
+sessions = SessionRegistry(load_session, max_sessions=MAX_SESSIONS, idle_timeout=SESSION_IDLE_TIMEOUT,
+                           on_evict=finalize_session)
 
 @client.event
 async def on_ready():
@@ -28,19 +89,30 @@ async def on_message(message):
 
     if message.author == client.user:
         return
+    new_turn()  # Each message is handled in its own task, so concurrent turns keep separate ids
+
+    # Everything below awaits, so other channels and the gateway heartbeat keep running
+    # while this message waits on the model or the database.
+    session = await sessions.get(session_key(message.channel))
 
-    append_message(conversation_id, conversation_log, "user", message.content)
+    await append_message_async(session.conversation_id, session.window, "user", message.content)
 
-    response = query_gpt(conversation_log)
+    prompt = await build_prompt_async(session.conversation_id, session.window, message.content)
+    response = await stream_reply(message.channel, stream_gpt_async(prompt))
     print(f"{response}")
+    if not response.strip():
+        return  # Nothing to remember; the user was sent FALLBACK_REPLY
 
-    append_message(conversation_id, conversation_log, "assistant", response)
+    await append_message_async(session.conversation_id, session.window, "assistant", response)
 
-    await message.channel.send(f"{response}")
+    await update_rolling_summary_async(session.conversation_id, session.window)
 
 if __name__ == "__main__":
-    conversation_log = initialize_conversation_log()
-    conversation_id = initialize_conversation(conversation_log)
-    conversation_log.extend(get_recent_messages())
-
-    client.run(DISCORD_TOKEN)
\ No newline at end of file
+    start_memory_index(get_storage())
+    enable_write_behind()
+
+    try:
+        client.run(DISCORD_TOKEN)  # Calls client.close() on shutdown, which finalizes every session
+    finally:
+        disable_write_behind()  # Flush buffered messages before the storage goes away
+        close_storage()
\ No newline at end of file
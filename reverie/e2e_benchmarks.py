@@ -0,0 +1,506 @@
+# reverie/e2e_benchmarks.py
+"""
+Offline end-to-end benchmarks: drives the real entry points (the CLI loop, the Discord
+on_message handler, the tagging backfill and the voice handle_speech_segment path)
+against the fake OpenAI server and an in-memory stand-in for PostgreSQL (or, with
+--backend sqlite, an embedded SQLite file), and reports throughput, p50/p95/p99 latency
+and peak memory for each.
+
+    python -m reverie.e2e_benchmarks --output results.json
+    python -m reverie.e2e_benchmarks --baseline results.json   # exits 1 on a regression
+
+Each scenario runs in a fresh interpreter, so its peak RSS is its own and patches to
+module globals never leak between scenarios. Results are written as JSON, and a
+previous results file can be passed as the baseline to flag metrics that got worse by
+more than the tolerance.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+SCENARIOS = ("cli", "discord", "tagging", "voice")
+ENTRY_MODULES = {"cli": "reverie.cli", "discord": "reverie.discord_client", "tagging": "reverie.tagging_utils",
+                 "voice": "reverie.voice"}
+
+# Metrics compared against a baseline, and which direction is worse
+LOWER_IS_BETTER = ("p50_ms", "p95_ms", "p99_ms", "max_rss_mb")
+HIGHER_IS_BETTER = ("throughput_per_s",)
+
+
+class MemoryDatabase:
+    """
+    Just enough of PostgreSQL, in memory, for the statements db_utils sends on the
+    benchmarked paths: conversation and message inserts (single, CTE and execute_values),
+    the tag and stats bulk updates, and the reads used by the CLI, Discord and backfill.
+    Other statements succeed and return no rows; they are counted in `unhandled`.
+    Every statement sleeps `round_trip` seconds, as a local server would take.
+    """
+
+    def __init__(self, round_trip: float = 0.0005):
+        self.round_trip = round_trip
+        self.conversations: Dict[str, Dict] = {}
+        self.messages: List[Dict] = []
+        self.statements = 0
+        self.unhandled = 0
+        self.lock = threading.Lock()
+
+    def connect(self) -> "MemoryConnection":
+        return MemoryConnection(self)
+
+    def execute(self, query: str, params, values: List[tuple]) -> List[tuple]:
+        with self.lock:
+            self.statements += 1
+            rows = self._execute(" ".join(query.split()), params, values)
+        time.sleep(self.round_trip)
+        return rows
+
+    def _execute(self, query: str, params, values: List[tuple]) -> List[tuple]:
+        if query.startswith("WITH new_conversation AS"):
+            conversation_id = str(uuid.uuid4())
+            conversation = {key[2:]: value for key, value in params.items() if key.startswith("c_")}
+            self.conversations[conversation_id] = dict(conversation, conversation_id=conversation_id)
+            message = {key[2:]: value for key, value in params.items() if key.startswith("m_")}
+            self.messages.append(dict(message, conversation_id=conversation_id, message_id=str(uuid.uuid4())))
+            return [(conversation_id,)]
+        if query.startswith("INSERT INTO Messages"):
+            if values:
+                columns = [column.strip() for column in re.search(r"\((.*?)\)", query).group(1).split(",")]
+                rows = [dict(zip(columns, row)) for row in values]
+            else:
+                rows = [dict(params)]
+            for row in rows:
+                self.messages.append(dict(row, message_id=str(uuid.uuid4())))
+            return []
+        if query.startswith("UPDATE Messages AS t SET tags"):
+            tags = dict(values)
+            for message in self.messages:
+                if message["message_id"] in tags:
+                    message["tags"] = tags[message["message_id"]]
+            return []
+        if query.startswith("UPDATE Conversations AS c SET message_count"):
+            return []  # Counters are not read back on the benchmarked paths
+        if query.startswith("UPDATE Conversations SET summary"):
+            summary, conversation_id = params
+            self.conversations[conversation_id]["summary"] = summary
+            return []
+        if query.startswith("SELECT conversation_id, role, content, timestamp, message_id FROM Messages"):
+            since, until = (bound if isinstance(bound, datetime) else None for bound in params)  # Or "[-]infinity"
+            return [(m["conversation_id"], m["role"], m["content"], m["timestamp"], m["message_id"])
+                    for m in self.messages if m["role"] != "system" and (since is None or m["timestamp"] >= since)
+                    and (until is None or m["timestamp"] < until)]
+        if query.startswith("SELECT conversation_id FROM Conversations WHERE conversation_id IN (SELECT conversation_id FROM Messages WHERE tags IS NULL"):
+            untagged = {m["conversation_id"] for m in self.messages if m.get("tags") in (None, "[]")}
+            return [(conversation_id,) for conversation_id in self.conversations if conversation_id in untagged]
+        if query.startswith("SELECT message_id, content FROM messages WHERE conversation_id = %s AND (tags is NULL"):
+            return [(m["message_id"], m["content"]) for m in self.messages
+                    if m["conversation_id"] == params[0] and m.get("tags") in (None, "[]")]
+        if query.startswith("SELECT conversation_id, summary FROM Conversations WHERE interface = %s"):
+            matches = [c for c in self.conversations.values() if c.get("interface") == params[0]]
+            return [(matches[-1]["conversation_id"], matches[-1].get("summary"))] if matches else []
+        if query.startswith("SELECT role, content, token_count, timestamp, message_id FROM Messages WHERE conversation_id = %s"):
+            conversation_id, _, before, before_id, page_size = params
+            rows = [m for m in self.messages if m["conversation_id"] == conversation_id and m["role"] != "system"
+                    and (before is None or (m["timestamp"], m["message_id"]) < (before, before_id))]
+            rows.sort(key=lambda m: (m["timestamp"], m["message_id"]), reverse=True)
+            return [(m["role"], m["content"], m["token_count"], m["timestamp"], m["message_id"])
+                    for m in rows][:page_size]
+        self.unhandled += 1
+        return []
+
+class MemoryConnection:
+    """
+    The parts of a psycopg2 connection that db_utils, db_pool and execute_values use.
+    """
+
+    encoding = "UTF8"
+
+    def __init__(self, database: MemoryDatabase):
+        self.database = database
+        self.autocommit = False
+        self.closed = 0
+
+    def cursor(self, name=None):
+        return MemoryCursor(self)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = 1
+
+class MemoryCursor:
+    def __init__(self, connection: MemoryConnection):
+        self.connection = connection
+        self.itersize = 2000
+        self._rows: List[tuple] = []
+        self._values: List[tuple] = []  # Argument tuples mogrified by execute_values for the next statement
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def mogrify(self, template, args) -> bytes:
+        self._values.append(tuple(args))
+        return b"(" + b",".join(b"%s" for _ in args) + b")"
+
+    def execute(self, query, params=None):
+        if isinstance(query, bytes):
+            query = query.decode()
+        self._rows = self.connection.database.execute(query, params, self._values)
+        self._values = []
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def __iter__(self):
+        rows, self._rows = self._rows, []
+        return iter(rows)
+
+class ApproximateEncoding:
+    """
+    Stands in for the tiktoken encoding (~4 characters per token) where it can't be downloaded.
+    """
+
+    def encode(self, text: str) -> List[int]:
+        return [0] * ((len(text) + 3) // 4)
+
+def summarize(latencies: List[float], seconds: float) -> Dict:
+    from reverie.gpt_utils import percentile
+
+    return {
+        "operations": len(latencies),
+        "seconds": seconds,
+        "throughput_per_s": len(latencies) / seconds if seconds else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+def install_stand_ins(database: MemoryDatabase, scratch: str, approximate_tokens: bool, backend: str = "memory"):
+    """
+    Points storage at `database` (through the PostgreSQL backend's real db_utils code) or,
+    for the "sqlite" backend, at a fresh SQLite file in `scratch`. Also gives gpt_utils a
+    fast scheduler (the fake server has no quota) and a completion cache in `scratch`, and
+    optionally replaces the tokenizer.
+    """
+    from reverie import db_utils, gpt_utils, memory_index, storage
+    from reverie.db_pool import ConnectionPool
+
+    if backend == "sqlite":
+        storage.storage = storage.SQLiteStorage(os.path.join(scratch, "reverie.sqlite3"))
+    else:
+        db_utils.connection_pool = ConnectionPool(database.connect, max_connections=db_utils.POOL_MAX_CONNECTIONS)
+        storage.storage = storage.PostgresStorage()
+    gpt_utils.scheduler = gpt_utils.RequestScheduler(1_000_000, 1_000_000_000)
+    gpt_utils.COMPLETION_CACHE_PATH = os.path.join(scratch, "completion_cache.sqlite3")
+    memory_index.MEMORY_INDEX_PATH = os.path.join(scratch, "memory_index.pickle")
+    if approximate_tokens:
+        gpt_utils.encoding = ApproximateEncoding()
+
+def run_cli_scenario(turns: int) -> Dict:
+    """
+    Runs run_cli() with scripted input; a turn is timed from the user's line being read
+    to the CLI asking for the next one.
+    """
+    import builtins
+    import contextlib
+    import io
+    from reverie.cli import run_cli
+
+    lines = iter([f"Turn {n}: tell me something new about tide pools." for n in range(turns)] + ["exit"])
+    latencies, returned_at = [], [None]
+
+    def scripted_input(prompt=""):
+        now = time.perf_counter()
+        if returned_at[0] is not None:
+            latencies.append(now - returned_at[0])
+        returned_at[0] = time.perf_counter()
+        return next(lines)
+
+    original_input = builtins.input
+    builtins.input = scripted_input
+    start = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            run_cli()
+    finally:
+        builtins.input = original_input
+    return summarize(latencies, time.perf_counter() - start)
+
+def run_discord_scenario(channels: int, messages_per_channel: int) -> Dict:
+    """
+    Sends messages from `channels` channels at once through on_message; each channel
+    sends its next message once the previous reply is complete.
+    """
+    import asyncio
+    import contextlib
+    import io
+    from reverie import discord_client
+
+    class SentMessage:
+        async def edit(self, content=None):
+            pass
+
+    class Channel:
+        def __init__(self, channel_id):
+            self.id = channel_id
+
+        async def send(self, content):
+            return SentMessage()
+
+    class Message:
+        author = "benchmark-user"
+
+        def __init__(self, channel, content):
+            self.channel = channel
+            self.content = content
+
+    latencies = []
+
+    async def converse(channel):
+        for n in range(messages_per_channel):
+            start = time.perf_counter()
+            await discord_client.on_message(Message(channel, f"Message {n}: what should I read next?"))
+            latencies.append(time.perf_counter() - start)
+
+    async def run():
+        await asyncio.gather(*(converse(Channel(c)) for c in range(channels)))
+        await discord_client.sessions.close()
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):  # on_message prints every reply
+        asyncio.run(run())
+    return summarize(latencies, time.perf_counter() - start)
+
+def seed_untagged_conversations(conversations: int, messages_each: int):
+    """
+    Stores conversations of untagged user messages, for the tagging backfill to work through.
+    """
+    from reverie.storage import generate_conversation_data, generate_message_data, get_storage
+
+    storage = get_storage()
+    for c in range(conversations):
+        conversation_id = storage.create_conversation(generate_conversation_data(),
+                                                      generate_message_data(None, "system", "Be curious.", 3))
+        storage.insert_many_into_table("Messages", [
+            generate_message_data(conversation_id, "user", f"Message {m} of conversation {c}: what do you think "
+                                                           f"about tide pools and the moon?", 16)
+            for m in range(messages_each)
+        ])
+
+def run_tagging_scenario(scratch: str, conversations: int, messages_each: int) -> Dict:
+    """
+    Backfills tags for seeded conversations with tagging_utils' writer and iterator. A
+    conversation's latency runs from it being read to its tags being written.
+    """
+    from reverie import tagging_utils
+    from reverie.cache_utils import PersistentLRUCache
+    from reverie.storage import get_storage
+    from reverie.tagging_engine import TaggingEngine
+
+    seed_untagged_conversations(conversations, messages_each)
+    read_at, latencies = {}, []
+
+    def timed_conversations():
+        for conversation_id, messages in tagging_utils.iter_untagged_conversations():
+            read_at[conversation_id] = time.perf_counter()
+            yield conversation_id, messages
+
+    def write_tags(conversation_id, tags_by_message_id):
+        tagging_utils.write_conversation_tags(conversation_id, tags_by_message_id)
+        latencies.append(time.perf_counter() - read_at[conversation_id])
+
+    engine = TaggingEngine(write_tags, concurrency=8, report_interval=3600,
+                           cache=PersistentLRUCache(os.path.join(scratch, "tag_cache.sqlite3"), table="message_tags"))
+    start = time.perf_counter()
+    engine.run(timed_conversations())
+    result = summarize(latencies, time.perf_counter() - start)
+    storage = get_storage()
+    result["messages_untagged"] = sum(len(storage.get_all_untagged_messages_in_conversation(conversation_id))
+                                      for conversation_id in read_at)
+    return result
+
+def run_voice_scenario(fixtures_dir: Optional[str], scratch: str, rounds: int, seconds_per_word: float) -> Dict:
+    """
+    Feeds each WAV fixture to handle_speech_segment as a finished utterance while
+    conversing, and times it until the reply has been spoken by a sink that takes
+    `seconds_per_word` per word. Also reports time to first audio.
+    """
+    import contextlib
+    import glob
+    import io
+    from reverie import voice
+    from reverie.gpt_utils import percentile
+    from reverie.speech_output import SentenceSpeaker
+    from reverie.synthetic_audio import read_wav_frames, write_synthetic_wav_fixtures
+
+    class TimedSink:
+        def say(self, text):
+            time.sleep(seconds_per_word * len(text.split()))
+
+    if fixtures_dir is None:
+        fixtures_dir = os.path.join(scratch, "fixtures")
+        os.makedirs(fixtures_dir)
+        write_synthetic_wav_fixtures(fixtures_dir)
+    fixtures = [read_wav_frames(path) for path in sorted(glob.glob(os.path.join(fixtures_dir, "*.wav")))]
+    if not fixtures:
+        raise SystemExit(f"No WAV fixtures found in {fixtures_dir}")
+
+    voice.speaker = SentenceSpeaker(TimedSink())
+    voice.wake_detector = None
+    latencies = []
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(rounds):
+            for frames, sample_rate, channels in fixtures:
+                voice.conversation_state = "CONVERSING"
+                voice.last_interaction_time = time.time()
+                began = time.perf_counter()
+                voice.handle_speech_segment(b"".join(frames), sample_rate=sample_rate, channels=channels)
+                voice.speaker.wait()
+                latencies.append(time.perf_counter() - began)
+    result = summarize(latencies, time.perf_counter() - start)
+    result["first_audio_p50_ms"] = percentile(voice.speaker.first_audio_latencies, 0.5) * 1000
+    voice.speaker.close()
+    return result
+
+def run_scenario(name: str, args) -> Dict:
+    """
+    Runs one scenario in this interpreter against a fresh fake server and database.
+    """
+    import importlib
+    import resource
+    from reverie import tracing
+    from reverie.benchmarks import use_fake_server
+    from reverie.fake_openai import FakeOpenAIServer, tagging_reply
+
+    if args.stages:
+        tracing.tracer = tracing.Tracer(enabled=True, trace_file=None, metrics_file=None)
+    database = MemoryDatabase(round_trip=args.db_round_trip_ms / 1000)
+    reply = tagging_reply if name == "tagging" else lambda body: args.reply
+    with tempfile.TemporaryDirectory() as scratch, \
+            FakeOpenAIServer(latency=args.latency, token_interval=args.token_interval, reply=reply) as server:
+        importlib.import_module(ENTRY_MODULES[name])  # Some set openai.api_key from the environment on import
+        use_fake_server(server)
+        install_stand_ins(database, scratch, args.approximate_tokens, args.backend)
+        if name == "cli":
+            result = run_cli_scenario(args.turns)
+        elif name == "discord":
+            result = run_discord_scenario(args.channels, args.turns)
+        elif name == "tagging":
+            result = run_tagging_scenario(scratch, args.conversations, args.messages_per_conversation)
+        else:
+            result = run_voice_scenario(args.fixtures, scratch, args.rounds, args.seconds_per_word)
+        result["requests"] = server.request_count
+
+    result["backend"] = args.backend
+    result["db_statements"] = database.statements
+    result["db_unhandled_statements"] = database.unhandled
+    result["max_rss_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+    if args.stages:
+        result["stages"] = tracing.tracer.summary()
+    return result
+
+def compare_results(results: Dict, baseline: Dict, tolerance: float = 0.2) -> List[Dict]:
+    """
+    Metrics that are worse than the baseline's by more than `tolerance` (a fraction),
+    as {"scenario", "metric", "baseline", "current", "change"} dictionaries.
+    """
+    regressions = []
+    for scenario, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(scenario)
+        if not previous:
+            continue
+        for metric in LOWER_IS_BETTER + HIGHER_IS_BETTER:
+            if not previous.get(metric) or metric not in current:
+                continue
+            change = current[metric] / previous[metric] - 1
+            if change > tolerance if metric in LOWER_IS_BETTER else change < -tolerance:
+                regressions.append({"scenario": scenario, "metric": metric, "baseline": previous[metric],
+                                    "current": current[metric], "change": change})
+    return regressions
+
+def run_all(args) -> Dict:
+    """
+    Runs each requested scenario in its own interpreter and collects the results.
+    """
+    scenarios = {}
+    for name in args.scenarios:
+        # A new spawned worker per scenario: a clean interpreter, so peak RSS is the scenario's own
+        with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+            result = scenarios[name] = executor.submit(run_scenario, name, args).result()
+        print(f"{name:>8}: {result['operations']} operations, {result['throughput_per_s']:.1f}/s, "
+              f"p50 {result['p50_ms']:.1f}ms p95 {result['p95_ms']:.1f}ms p99 {result['p99_ms']:.1f}ms, "
+              f"peak RSS {result['max_rss_mb']:.0f}MB")
+        if result["db_unhandled_statements"]:
+            print(f"{'':>8}  {result['db_unhandled_statements']} statements not understood by the database stand-in")
+    return {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {key: value for key, value in vars(args).items()
+                     if key not in ("output", "baseline", "scenarios")},
+        "scenarios": scenarios,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Run Reverie's offline end-to-end benchmarks.")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="A previous results file; regressions against it make the exit status 1")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed fractional change before flagging")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake server latency per request, in seconds")
+    parser.add_argument("--token-interval", type=float, default=0.005, help="Fake server seconds per streamed word")
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory",
+                        help="Store data in the in-memory PostgreSQL stand-in or an embedded SQLite file")
+    parser.add_argument("--db-round-trip-ms", type=float, default=0.5, help="Database stand-in time per statement")
+    parser.add_argument("--reply", default="That is a lovely question. Tide pools hold whole worlds. Shall we go on?")
+    parser.add_argument("--turns", type=int, default=30, help="CLI turns, and Discord messages per channel")
+    parser.add_argument("--channels", type=int, default=20, help="Discord channels talking at once")
+    parser.add_argument("--conversations", type=int, default=40, help="Conversations to backfill tags for")
+    parser.add_argument("--messages-per-conversation", type=int, default=25)
+    parser.add_argument("--fixtures", help="Directory of WAV fixtures for the voice scenario (synthetic if omitted)")
+    parser.add_argument("--rounds", type=int, default=2, help="Times each voice fixture is played")
+    parser.add_argument("--seconds-per-word", type=float, default=0.005, help="Stand-in TTS time per word")
+    parser.add_argument("--approximate-tokens", action="store_true",
+                        help="Count ~4 characters per token instead of loading the tiktoken encoding")
+    parser.add_argument("--stages", action="store_true", help="Also record per-stage latency with reverie.tracing")
+    args = parser.parse_args()
+
+    results = run_all(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as output:
+            json.dump(results, output, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as baseline_file:
+            regressions = compare_results(results, json.load(baseline_file), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression['scenario']} {regression['metric']}: {regression['baseline']:.2f} -> "
+                  f"{regression['current']:.2f} ({regression['change']:+.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,235 @@
+# reverie/fake_openai.py
+
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Optional
+
+
+def default_reply(request_body: Dict) -> str:
+    return "This is a reply from the fake completion server."
+
+def tagging_reply(request_body: Dict) -> str:
+    """
+    Answers tag prompts: a comma-separated list for single messages, or a JSON object
+    with tags for every key when the request asks for JSON (batched tagging).
+    """
+    if "response_format" not in request_body:
+        return "greeting, small talk"
+    numbered = json.loads(request_body["messages"][-1]["content"])
+    return json.dumps({key: ["greeting", "small talk"] for key in numbered})
+
+def default_transcript(audio: bytes) -> str:
+    return "hello reverie"
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256  # Benchmarks open many connections at once
+
+class FakeOpenAIServer:
+    """
+    A local stand-in for the OpenAI chat completions and audio transcription endpoints,
+    used by tests and benchmarks.
+
+    Every request sleeps for `latency` seconds before answering with the text returned by
+    `reply(request_body)`. Generation is simulated as one word every `token_interval`
+    seconds: streaming requests (`"stream": true`) receive each word as a server-sent
+    event as it is "generated", while other requests wait for the whole reply. The first
+    `rate_limited_requests` requests are answered with a 429 instead, to exercise retry
+    paths. With `requests_per_minute`, the server also enforces that quota like the real
+    API: a token bucket holding up to `burst` requests (a minute's worth by default), and
+    a 429 with a Retry-After header once it is empty. Transcription requests are answered
+    with `transcript(upload)`, where `upload` is the raw multipart request body. Use it as
+    a context manager and point a client at `base_url`.
+    """
+
+    def __init__(self, latency: float = 0.0, reply: Callable[[Dict], str] = default_reply,
+                 rate_limited_requests: int = 0, token_interval: float = 0.0,
+                 transcript: Callable[[bytes], str] = default_transcript,
+                 requests_per_minute: Optional[float] = None, burst: Optional[float] = None,
+                 host: str = "127.0.0.1", port: int = 0):
+        self.latency = latency
+        self.reply = reply
+        self.transcript = transcript
+        self.token_interval = token_interval
+        self.rate_limited_requests = rate_limited_requests
+        self.requests_per_minute = requests_per_minute
+        self.burst = burst if burst is not None else requests_per_minute
+        self._bucket = self.burst
+        self._bucket_time = time.monotonic()
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self.quota_rejections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._httpd = _Server((host, port), self._make_handler())
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/v1/"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, kwargs={"poll_interval": 0.05},
+                                        name="fake-openai", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def _begin_request(self) -> Optional[float]:
+        """
+        Records a request. Returns None to serve it, or the Retry-After seconds of a 429.
+        """
+        with self._lock:
+            self.request_count += 1
+            if self.rate_limited_count < self.rate_limited_requests:
+                self.rate_limited_count += 1
+                return 0.0
+            if self.requests_per_minute:
+                now = time.monotonic()
+                self._bucket = min(self.burst, self._bucket + (now - self._bucket_time) * self.requests_per_minute / 60)
+                self._bucket_time = now
+                if self._bucket < 1:
+                    self.quota_rejections += 1
+                    return (1 - self._bucket) * 60 / self.requests_per_minute
+                self._bucket -= 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            return None
+
+    def _end_request(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark and test output quiet
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                raw_body = self.rfile.read(length)
+                path = self.path.rstrip("/")
+
+                if path.endswith("/audio/transcriptions"):
+                    self._transcribe(raw_body)
+                    return
+                if not path.endswith("/chat/completions"):
+                    self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                    return
+
+                body = json.loads(raw_body or b"{}")
+                retry_after = server._begin_request()
+                if retry_after is not None:
+                    self._send_rate_limited(retry_after)
+                    return
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    model, content = body.get("model", "fake-model"), server.reply(body)
+                    if body.get("stream"):
+                        self._send_stream(model, content)
+                    else:
+                        time.sleep(server.token_interval * len(split_words(content)))
+                        self._send_json(200, completion_payload(model, content))
+                finally:
+                    server._end_request()
+
+            def _transcribe(self, upload: bytes):
+                retry_after = server._begin_request()
+                if retry_after is not None:
+                    self._send_rate_limited(retry_after)
+                    return
+                try:
+                    if server.latency:
+                        time.sleep(server.latency)
+                    self._send_json(200, {"text": server.transcript(upload)})
+                finally:
+                    server._end_request()
+
+            def _send_stream(self, model: str, content: str):
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+
+                self._send_event(json.dumps(chunk_payload(model, {"role": "assistant", "content": ""})))
+                for word in split_words(content):
+                    if server.token_interval:
+                        time.sleep(server.token_interval)
+                    self._send_event(json.dumps(chunk_payload(model, {"content": word})))
+                self._send_event(json.dumps(chunk_payload(model, {}, finish_reason="stop")))
+                self._send_event("[DONE]")
+                self.wfile.write(b"0\r\n\r\n")
+
+            def _send_event(self, data: str):
+                event = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+                self.wfile.flush()
+
+            def _send_rate_limited(self, retry_after: float):
+                self._send_json(429, {"error": {"message": "Rate limit reached", "type": "requests"}},
+                                {"Retry-After": f"{retry_after:.3f}"} if retry_after else None)
+
+            def _send_json(self, status: int, payload: Dict, headers: Optional[Dict] = None):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        return Handler
+
+def split_words(content: str):
+    """
+    Splits text into word-sized deltas that join back into the original string.
+    """
+    return re.findall(r"\S*\s*", content)[:-1] or [content]
+
+def chunk_payload(model: str, delta: Dict, finish_reason: Optional[str] = None) -> Dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+def completion_payload(model: str, content: str) -> Dict:
+    return {
+        "id": "chatcmpl-fake",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+    }
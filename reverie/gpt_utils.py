@@ -1,14 +1,59 @@
 # reverie/gpt_utils.py
 
+import asyncio
+import json
 import os
-from typing import List, Dict
+import random
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Iterator, List, Dict, Optional
 import openai
 from dotenv import load_dotenv
 
+from reverie.cache_utils import PersistentLRUCache, content_hash
+from reverie.tracing import record, span, traced
+
 load_dotenv()  # loads .env from the project root if present
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
+client = None  # Created on first use by get_client()
+_client_settings = None  # (api_key, base_url) the client was created with
+async_client = None  # Created on first use by get_async_client()
+_async_client_settings = None  # (api_key, base_url) the async client was created with
+scheduler = None  # Created on first use by get_scheduler()
+_init_lock = threading.Lock()  # Guards the lazy creation of the scheduler and clients
+
+# Priority lanes, highest first. Interactive requests (chat, voice) are always admitted
+# ahead of queued batch requests (tagging backfills).
+INTERACTIVE = "interactive"
+BATCH = "batch"
+LANES = (INTERACTIVE, BATCH)
+
+OPENAI_REQUESTS_PER_MINUTE = float(os.getenv("REVERIE_OPENAI_RPM", "500"))
+OPENAI_TOKENS_PER_MINUTE = float(os.getenv("REVERIE_OPENAI_TPM", "200000"))
+# Share of both buckets that batch requests leave free, so interactive bursts never wait on a refill
+BATCH_RESERVE = float(os.getenv("REVERIE_OPENAI_BATCH_RESERVE", "0.2"))
+OPENAI_MAX_RETRIES = int(os.getenv("REVERIE_OPENAI_MAX_RETRIES", "5"))
+
+TAG_MAX_TOKENS = 50
+SUMMARY_MAX_TOKENS = 400
+TAG_PROMPT_VERSION = "1"  # Bump whenever the tag prompts change so cached tags are not reused
+
+encoding = None  # tiktoken encoding, loaded on first use by count_tokens()
+
+# Completions at or below this temperature are cached unless a call passes cache=False
+# (a negative value disables caching by temperature; calls can still pass cache=True)
+COMPLETION_CACHE_MAX_TEMPERATURE = float(os.getenv("REVERIE_COMPLETION_CACHE_MAX_TEMPERATURE", "0"))
+COMPLETION_CACHE_PATH = os.getenv("REVERIE_COMPLETION_CACHE_PATH", "completion_cache.sqlite3")
+COMPLETION_CACHE_TTL = float(os.getenv("REVERIE_COMPLETION_CACHE_TTL", str(7 * 24 * 3600)))
+COMPLETION_CACHE_MAX_ENTRIES = int(os.getenv("REVERIE_COMPLETION_CACHE_MAX_ENTRIES", "100000"))
+
+completion_cache = None  # Opened on first use by get_completion_cache()
+completion_cache_saved_seconds = 0.0  # API latency avoided by cache hits
+_completion_cache_lock = threading.Lock()
+
 def initialize_cli_log():
     return [
         {
@@ -22,37 +67,512 @@ def initialize_cli_log():
         }
     ]
 
+def get_completion_cache() -> PersistentLRUCache:
+    """
+    Returns the shared completion cache, keyed by completion_cache_key().
+    """
+    global completion_cache
+    if completion_cache is None:
+        with _completion_cache_lock:
+            if completion_cache is None:
+                completion_cache = PersistentLRUCache(COMPLETION_CACHE_PATH, table="completions",
+                                                      ttl=COMPLETION_CACHE_TTL,
+                                                      max_disk_entries=COMPLETION_CACHE_MAX_ENTRIES)
+    return completion_cache
+
+def completion_cache_key(conversation_messages: List[Dict], model: str, temperature: float, max_tokens: int,
+                         kwargs: Dict) -> str:
+    """
+    Canonical hash of everything that determines a completion, so the same request built
+    with differently ordered dictionaries maps to one entry.
+    """
+    return content_hash(
+        model, repr(float(temperature)), str(max_tokens),
+        json.dumps(conversation_messages, sort_keys=True, separators=(",", ":"), ensure_ascii=False),
+        json.dumps(kwargs, sort_keys=True, separators=(",", ":"), default=str)
+    )
+
+def use_completion_cache(cache: Optional[bool], temperature: float) -> bool:
+    return cache if cache is not None else temperature <= COMPLETION_CACHE_MAX_TEMPERATURE
+
+def cached_completion(key: str) -> Optional[str]:
+    global completion_cache_saved_seconds
+    entry = get_completion_cache().get(key)
+    if entry is None:
+        return None
+    with _completion_cache_lock:
+        completion_cache_saved_seconds += entry["latency"]
+    return entry["content"]
+
+def completion_cache_stats() -> dict:
+    """
+    Hit rate and API latency saved by the completion cache (empty before first use).
+    """
+    if completion_cache is None:
+        return {}
+    return {**completion_cache.stats(), "entries": len(completion_cache),
+            "saved_seconds": completion_cache_saved_seconds}
+
 def query_gpt(
     conversation_messages: List[Dict],
     model: str = "gpt-4o-mini",
     temperature: float = 0.7,
     max_tokens: int = 400,
+    raise_errors: bool = False,
+    cache: Optional[bool] = None,
+    lane: str = INTERACTIVE,
     **kwargs
 ) -> str:
     """
     Sends the given text to your GPT-4o mini model (or another Chat model)
-    and returns the model's response.
+    and returns the model's response. Errors are printed and an empty string is
+    returned unless `raise_errors` is set, in which case they propagate to the caller.
+
+    Replies are served from the completion cache when `cache` is True, or when it is
+    None and `temperature` is at most COMPLETION_CACHE_MAX_TEMPERATURE. Errors and
+    empty replies are never cached. Requests go through the shared scheduler on `lane`.
+    """
+    key = None
+    if use_completion_cache(cache, temperature):
+        key = completion_cache_key(conversation_messages, model, temperature, max_tokens, kwargs)
+        content = cached_completion(key)
+        if content is not None:
+            return content
+
+    try:
+        start = time.monotonic()
+        with span("gpt.completion", model=model, lane=lane):
+            response = get_scheduler().call(
+                lane,
+                estimate_request_tokens(conversation_messages, max_tokens),
+                get_client().chat.completions.create,
+                model=model,
+                messages=conversation_messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+        # Extract and return the assistant’s reply
+        content = response.choices[0].message.content
+        if key is not None and content:
+            get_completion_cache().set(key, {"content": content, "latency": time.monotonic() - start})
+        return content
+    except Exception as e:
+        if raise_errors:
+            raise
+        print(f"Error during GPT query: {e}")
+        return ""
+
+@traced("tokenizer.count_tokens")
+def count_tokens(text: str) -> int:
+    """
+    Counts tokens with the gpt-4o-mini tiktoken encoding.
+    """
+    global encoding
+    if encoding is None:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model("gpt-4o-mini")
+    return len(encoding.encode(text))
+
+def estimate_request_tokens(conversation_messages: List[Dict], max_tokens: int = 0) -> int:
+    """
+    Cheap upper-bound estimate of the tokens a request will consume, for rate limiting.
+    Uses ~4 characters per token plus per-message overhead and the completion allowance.
+    """
+    prompt_chars = sum(len(message["content"] or "") for message in conversation_messages)
+    return prompt_chars // 4 + 4 * len(conversation_messages) + max_tokens
+
+class RateLimiter:
+    """
+    Thread-safe token buckets for a requests-per-minute and a tokens-per-minute limit.
+    `acquire` blocks until both buckets have room, so every worker sharing one
+    limiter stays under the account's quota together.
+    """
+
+    def __init__(self, requests_per_minute: float, tokens_per_minute: float):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self._requests_available = float(requests_per_minute)
+        self._tokens_available = float(tokens_per_minute)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed_minutes = (now - self._last_refill) / 60
+        self._last_refill = now
+        self._requests_available = min(self.requests_per_minute,
+                                       self._requests_available + elapsed_minutes * self.requests_per_minute)
+        self._tokens_available = min(self.tokens_per_minute,
+                                     self._tokens_available + elapsed_minutes * self.tokens_per_minute)
+
+    def try_acquire(self, tokens: int = 0, reserve: float = 0.0) -> float:
+        """
+        Takes one request and `tokens` tokens if that leaves at least `reserve` (a fraction
+        of each bucket) available. Returns 0 on success, otherwise roughly how many seconds
+        until it would succeed.
+        """
+        # A single request larger than the whole bucket could never be admitted, so cap it
+        tokens = min(tokens, self.tokens_per_minute * (1 - reserve))
+        requests_needed = max(1.0, min(self.requests_per_minute, 1 + reserve * self.requests_per_minute))
+        tokens_needed = tokens + reserve * self.tokens_per_minute
+        with self._lock:
+            self._refill()
+            if self._requests_available >= requests_needed and self._tokens_available >= tokens_needed:
+                self._requests_available -= 1
+                self._tokens_available -= tokens
+                return 0.0
+            request_wait = (requests_needed - self._requests_available) / self.requests_per_minute * 60
+            token_wait = (tokens_needed - self._tokens_available) / self.tokens_per_minute * 60
+            return max(request_wait, token_wait, 0.001)
+
+    def acquire(self, tokens: int = 0):
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return
+            time.sleep(wait)
+
+def percentile(values, fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] if ordered else 0.0
+
+class LaneStats:
+    """
+    Queue depth, retries and latencies (of the most recent requests) for one scheduler lane.
+    """
+
+    def __init__(self, window: int = 10_000):
+        self.waiting = 0
+        self.max_waiting = 0
+        self.requests = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.failures = 0
+        self.queue_waits = deque(maxlen=window)
+        self.latencies = deque(maxlen=window)  # From first queueing to the response, retries included
+
+    def snapshot(self) -> dict:
+        return {
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "requests": self.requests,
+            "retries": self.retries,
+            "rate_limited": self.rate_limited,
+            "failures": self.failures,
+            "queue_wait_p50_ms": percentile(self.queue_waits, 0.5) * 1000,
+            "queue_wait_p99_ms": percentile(self.queue_waits, 0.99) * 1000,
+            "latency_p50_ms": percentile(self.latencies, 0.5) * 1000,
+            "latency_p95_ms": percentile(self.latencies, 0.95) * 1000,
+            "latency_p99_ms": percentile(self.latencies, 0.99) * 1000,
+        }
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.InternalServerError)
+
+class RequestScheduler:
+    """
+    Admits every OpenAI request through one shared RateLimiter, in priority lanes.
+
+    Requests queue first-come first-served within a lane, and a lane is only served while
+    every higher lane is empty, so interactive requests overtake any backlog of batch work.
+    Batch requests are also held back whenever admitting them would leave less than
+    `batch_reserve` of the request or token bucket, which keeps headroom for interactive
+    bursts even while a backfill saturates the quota.
+
+    call() retries 429s, connection errors and 5xx responses with jittered exponential
+    backoff (at least as long as any Retry-After header), queueing again before each
+    attempt. Blocking and asyncio callers share the same queues.
+    """
+
+    def __init__(self, requests_per_minute: float = OPENAI_REQUESTS_PER_MINUTE,
+                 tokens_per_minute: float = OPENAI_TOKENS_PER_MINUTE, batch_reserve: float = BATCH_RESERVE,
+                 max_retries: int = OPENAI_MAX_RETRIES, base_delay: float = 1.0, max_delay: float = 60.0):
+        self.limiter = RateLimiter(requests_per_minute, tokens_per_minute)
+        self.batch_reserve = batch_reserve
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lanes = {lane: LaneStats() for lane in LANES}
+        self._queues = {lane: deque() for lane in LANES}
+        self._condition = threading.Condition()
+
+    def _enqueue(self, lane: str) -> object:
+        if lane not in self._queues:
+            raise ValueError(f"Unknown lane {lane!r}; expected one of {LANES}")
+        ticket = object()
+        with self._condition:
+            self._queues[lane].append(ticket)
+            stats = self.lanes[lane]
+            stats.waiting += 1
+            stats.max_waiting = max(stats.max_waiting, stats.waiting)
+        return ticket
+
+    def _dequeue(self, lane: str, ticket: object, queued_at: float):
+        with self._condition:
+            self._queues[lane].remove(ticket)
+            stats = self.lanes[lane]
+            stats.waiting -= 1
+            stats.queue_waits.append(time.monotonic() - queued_at)
+            self._condition.notify_all()
+
+    def _try_admit(self, lane: str, ticket: object, tokens: int) -> float:
+        """
+        Returns 0 if the request may go now, otherwise how long to wait before asking again. Call with the condition held.
+        """
+        for higher in LANES[:LANES.index(lane)]:
+            if self._queues[higher]:
+                return 0.05  # Woken early when the higher lane drains
+        if self._queues[lane][0] is not ticket:
+            return 0.05
+        return self.limiter.try_acquire(tokens, self.batch_reserve if lane == BATCH else 0.0)
+
+    def acquire(self, lane: str = INTERACTIVE, tokens: int = 0):
+        """
+        Blocks until a request of about `tokens` tokens may be sent on `lane`.
+        """
+        queued_at = time.monotonic()
+        ticket = self._enqueue(lane)
+        try:
+            with self._condition:
+                while True:
+                    wait = self._try_admit(lane, ticket, tokens)
+                    if not wait:
+                        return
+                    self._condition.wait(wait)
+        finally:
+            self._dequeue(lane, ticket, queued_at)
+
+    async def acquire_async(self, lane: str = INTERACTIVE, tokens: int = 0):
+        queued_at = time.monotonic()
+        ticket = self._enqueue(lane)
+        try:
+            while True:
+                with self._condition:
+                    wait = self._try_admit(lane, ticket, tokens)
+                if not wait:
+                    return
+                await asyncio.sleep(min(wait, 0.05))
+        finally:
+            self._dequeue(lane, ticket, queued_at)
+
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        delay = min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+        response = getattr(error, "response", None)
+        retry_after = response.headers.get("retry-after") if response is not None else None
+        try:
+            return max(delay, float(retry_after)) if retry_after else delay
+        except ValueError:
+            return delay
+
+    def _record_failure(self, lane: str, attempt: int, error: Exception) -> bool:
+        """
+        Counts a failed attempt and returns True if it should be retried.
+        """
+        stats = self.lanes[lane]
+        with self._condition:
+            if isinstance(error, openai.RateLimitError):
+                stats.rate_limited += 1
+            if attempt == self.max_retries:
+                stats.failures += 1
+                return False
+            stats.retries += 1
+            return True
+
+    def _record_success(self, lane: str, started: float):
+        with self._condition:
+            stats = self.lanes[lane]
+            stats.requests += 1
+            stats.latencies.append(time.monotonic() - started)
+
+    def call(self, lane: str, tokens: int, func: Callable, *args, **kwargs):
+        """
+        Sends `func(*args, **kwargs)` on `lane` once admitted, retrying transient failures.
+        """
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            with span("gpt.queue_wait", lane=lane):
+                self.acquire(lane, tokens)
+            try:
+                result = func(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if not self._record_failure(lane, attempt, e):
+                    raise
+                time.sleep(self.backoff_delay(attempt, e))
+                continue
+            self._record_success(lane, started)
+            return result
+
+    async def call_async(self, lane: str, tokens: int, func: Callable, *args, **kwargs):
+        """
+        Async variant of call() for coroutine functions such as the async client's methods.
+        """
+        started = time.monotonic()
+        for attempt in range(self.max_retries + 1):
+            with span("gpt.queue_wait", lane=lane):
+                await self.acquire_async(lane, tokens)
+            try:
+                result = await func(*args, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                if not self._record_failure(lane, attempt, e):
+                    raise
+                await asyncio.sleep(self.backoff_delay(attempt, e))
+                continue
+            self._record_success(lane, started)
+            return result
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {lane: stats.snapshot() for lane, stats in self.lanes.items()}
+
+def get_scheduler() -> RequestScheduler:
+    """
+    Returns the process-wide request scheduler, configured from REVERIE_OPENAI_* settings.
+    """
+    global scheduler
+    if scheduler is None:
+        with _init_lock:
+            if scheduler is None:
+                scheduler = RequestScheduler()
+    return scheduler
+
+def get_client() -> openai.OpenAI:
+    """
+    Returns the shared OpenAI client, whose keep-alive connection pool every blocking
+    request reuses. It is rebuilt if openai.api_key or openai.base_url change. The SDK's
+    own retries are off: RequestScheduler.call() retries within the rate limits.
+    """
+    global client, _client_settings
+    settings = (openai.api_key, openai.base_url)
+    if client is None or settings != _client_settings:
+        with _init_lock:
+            if client is None or settings != _client_settings:
+                client = openai.OpenAI(api_key=settings[0], base_url=settings[1], max_retries=0)
+                _client_settings = settings
+    return client
+
+def get_async_client() -> openai.AsyncOpenAI:
+    """
+    Returns the shared async OpenAI client, rebuilt like get_client() if openai.api_key or
+    openai.base_url change.
+    """
+    global async_client, _async_client_settings
+    settings = (openai.api_key, openai.base_url)
+    if async_client is None or settings != _async_client_settings:
+        with _init_lock:
+            if async_client is None or settings != _async_client_settings:
+                async_client = openai.AsyncOpenAI(api_key=settings[0], base_url=settings[1], max_retries=0)
+                _async_client_settings = settings
+    return async_client
+
+async def query_gpt_async(
+    conversation_messages: List[Dict],
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.7,
+    max_tokens: int = 400,
+    cache: Optional[bool] = None,
+    lane: str = INTERACTIVE,
+    **kwargs
+) -> str:
+    """
+    Async variant of query_gpt that awaits the completion instead of blocking the event loop.
+    """
+    key = None
+    if use_completion_cache(cache, temperature):
+        key = completion_cache_key(conversation_messages, model, temperature, max_tokens, kwargs)
+        content = cached_completion(key)
+        if content is not None:
+            return content
+
+    try:
+        start = time.monotonic()
+        with span("gpt.completion", model=model, lane=lane):
+            response = await get_scheduler().call_async(
+                lane,
+                estimate_request_tokens(conversation_messages, max_tokens),
+                get_async_client().chat.completions.create,
+                model=model,
+                messages=conversation_messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                **kwargs
+            )
+        content = response.choices[0].message.content
+        if key is not None and content:
+            get_completion_cache().set(key, {"content": content, "latency": time.monotonic() - start})
+        return content
+    except Exception as e:
+        print(f"Error during GPT query: {e}")
+        return ""
+
+def stream_gpt(
+    conversation_messages: List[Dict],
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.7,
+    max_tokens: int = 400,
+    **kwargs
+) -> Iterator[str]:
     """
+    Streaming variant of query_gpt: yields pieces of the reply as the model produces them.
+    On error the stream simply ends, so callers see whatever text arrived before it.
+    """
+    start = time.perf_counter()
+    first = True
     try:
-        response = openai.chat.completions.create(
+        stream = get_scheduler().call(
+            INTERACTIVE,
+            estimate_request_tokens(conversation_messages, max_tokens),
+            get_client().chat.completions.create,
             model=model,
             messages=conversation_messages,
             temperature=temperature,
             max_tokens=max_tokens,
+            stream=True,
             **kwargs
         )
-        # Extract and return the assistant’s reply
-        return response.choices[0].message.content
+        for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first:
+                    record("gpt.first_token", time.perf_counter() - start, model=model)
+                    first = False
+                yield chunk.choices[0].delta.content
     except Exception as e:
-        print(f"Error during GPT query: {e}")
-        return ""
+        print(f"Error during GPT stream: {e}")
 
-def query_gpt_binary(query: str) -> str:
+async def stream_gpt_async(
+    conversation_messages: List[Dict],
+    model: str = "gpt-4o-mini",
+    temperature: float = 0.7,
+    max_tokens: int = 400,
+    **kwargs
+) -> AsyncIterator[str]:
     """
-    Queries GPT for a binary decision (e.g., yes/no).
+    Async variant of stream_gpt for event-loop callers.
     """
+    start = time.perf_counter()
+    first = True
+    try:
+        stream = await get_scheduler().call_async(
+            INTERACTIVE,
+            estimate_request_tokens(conversation_messages, max_tokens),
+            get_async_client().chat.completions.create,
+            model=model,
+            messages=conversation_messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            stream=True,
+            **kwargs
+        )
+        async for chunk in stream:
+            if chunk.choices and chunk.choices[0].delta.content:
+                if first:
+                    record("gpt.first_token", time.perf_counter() - start, model=model)
+                    first = False
+                yield chunk.choices[0].delta.content
+    except Exception as e:
+        print(f"Error during GPT stream: {e}")
 
-    prompt_plus_query = [
+def binary_prompt(query: str) -> List[Dict]:
+    return [
         {"role": "system",
          "content": "You are an assistant tasked with answering questions with a binary 'Yes' or 'No' response. Do not provide any explanation."},
         {"role": "user", "content": "Is the sky blue?"},
@@ -60,37 +580,152 @@ def query_gpt_binary(query: str) -> str:
         {"role": "user", "content": query}
     ]
 
+def query_gpt_binary(query: str) -> str:
+    """
+    Queries GPT for a binary decision (e.g., yes/no).
+    """
     return query_gpt(
-        prompt_plus_query,
+        binary_prompt(query),
+        model="gpt-4o-mini",
+        temperature=0.0,
+        max_tokens=20
+    )
+
+async def query_gpt_binary_async(query: str) -> str:
+    return await query_gpt_async(
+        binary_prompt(query),
         model="gpt-4o-mini",
         temperature=0.0,
         max_tokens=20
     )
 
-def query_gpt_for_message_tags(message: str):
-    prompt_plus_message = [
+def message_tags_prompt(message: str) -> List[Dict]:
+    return [
         {"role": "system", "content": "Analyze the provided message and provide relevant subject tags. Return the tags "
                                       "as a comma-separated list. If there are no relevant subjects return an empty string."},
         {"role": "user", "content": message}
     ]
 
-    tagged_message = {}
+def message_tags_cache_key(message: str, model: str = "gpt-4o-mini", prompt: str = "message") -> str:
+    """
+    Content-addressed cache key for a message's tags. Whitespace and case are normalized
+    so trivially different copies of the same text ("OK", "ok ") share one entry. `prompt`
+    is the prompt that produced the tags ("message" or "batch"), so tags from one are
+    never served in place of the other.
+    """
+    normalized = " ".join(message.split()).casefold()
+    return content_hash(model, TAG_PROMPT_VERSION, prompt, normalized)
+
+def parse_message_tags(message: str, tags: str) -> Dict:
+    tag_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
 
+    return {
+        "content": message,
+        "tags": tag_list
+    }
+
+def query_gpt_for_message_tags(message: str, raise_errors: bool = False):
     tags = query_gpt(
-        prompt_plus_message,
+        message_tags_prompt(message),
         model="gpt-4o-mini",
         temperature=0.3,
-        max_tokens=50
+        max_tokens=TAG_MAX_TOKENS,
+        raise_errors=raise_errors,
+        lane=BATCH
     )
 
-    tag_list = [tag.strip() for tag in tags.split(',') if tag.strip()]
+    return parse_message_tags(message, tags)
 
-    tagged_message = {
-        "content": message,
-        "tags": tag_list
-    }
+async def query_gpt_for_message_tags_async(message: str):
+    tags = await query_gpt_async(
+        message_tags_prompt(message),
+        model="gpt-4o-mini",
+        temperature=0.3,
+        max_tokens=TAG_MAX_TOKENS,
+        lane=BATCH
+    )
+
+    return parse_message_tags(message, tags)
+
+def summary_prompt(previous_summary: str, turns: List[Dict]) -> List[Dict]:
+    transcript = "\n".join(f"{turn['role']}: {turn['content']}" for turn in turns)
+    return [
+        {"role": "system", "content": "You maintain a rolling summary of a conversation between a user and an AI "
+                                      "assistant. Merge the new transcript into the existing summary. Keep names, "
+                                      "facts, preferences, commitments and open questions; drop small talk. Reply "
+                                      "with the updated summary only, in at most a few short paragraphs."},
+        {"role": "user", "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew transcript:\n{transcript}"}
+    ]
+
+def query_gpt_for_summary(previous_summary: str, turns: List[Dict], raise_errors: bool = False) -> str:
+    """
+    Folds `turns` into `previous_summary` and returns the updated summary.
+    """
+    return query_gpt(
+        summary_prompt(previous_summary, turns),
+        model="gpt-4o-mini",
+        temperature=0.3,
+        max_tokens=SUMMARY_MAX_TOKENS,
+        raise_errors=raise_errors
+    )
 
-    return tagged_message
+async def query_gpt_for_summary_async(previous_summary: str, turns: List[Dict]) -> str:
+    return await query_gpt_async(
+        summary_prompt(previous_summary, turns),
+        model="gpt-4o-mini",
+        temperature=0.3,
+        max_tokens=SUMMARY_MAX_TOKENS
+    )
 
+def batch_tags_prompt(messages: Dict[str, str]) -> List[Dict]:
+    """
+    Builds one request that tags several messages. Messages are keyed "1".."N" rather than
+    by their ids to keep the prompt and the response short.
+    """
+    numbered = {str(index): content for index, content in enumerate(messages.values(), start=1)}
+    return [
+        {"role": "system", "content": "Analyze each of the provided messages and provide relevant subject tags. The "
+                                      "messages are given as a JSON object mapping a key to the message text. Respond "
+                                      "with a JSON object mapping every key to a list of tag strings. Use an empty "
+                                      "list for messages with no relevant subjects."},
+        {"role": "user", "content": json.dumps(numbered, ensure_ascii=False)}
+    ]
 
+def parse_batch_tags(messages: Dict[str, str], response: Optional[str]) -> Dict[str, List[str]]:
+    """
+    Maps a batch response back to {message_id: tags}. Raises ValueError if the response
+    is missing, is not valid JSON or does not cover every message.
+    """
+    if not response:
+        raise ValueError("Batch tag response is empty")
+    try:
+        numbered_tags = json.loads(response)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Batch tag response is not valid JSON: {e}") from e
+    if not isinstance(numbered_tags, dict):
+        raise ValueError("Batch tag response is not a JSON object")
+
+    tags_by_message_id = {}
+    for index, message_id in enumerate(messages, start=1):
+        tags = numbered_tags.get(str(index))
+        if not isinstance(tags, list):
+            raise ValueError(f"Batch tag response is missing tags for key {index}")
+        tags_by_message_id[message_id] = [str(tag).strip() for tag in tags if str(tag).strip()]
+    return tags_by_message_id
+
+def query_gpt_for_batch_tags(messages: Dict[str, str], raise_errors: bool = False) -> Dict[str, List[str]]:
+    """
+    Tags several messages with a single completion and returns {message_id: tags}.
+    Raises ValueError if the response can't be parsed, so callers can split and retry.
+    """
+    response = query_gpt(
+        batch_tags_prompt(messages),
+        model="gpt-4o-mini",
+        temperature=0.3,
+        max_tokens=TAG_MAX_TOKENS * len(messages),
+        raise_errors=raise_errors,
+        lane=BATCH,
+        response_format={"type": "json_object"}
+    )
 
+    return parse_batch_tags(messages, response)
@@ -0,0 +1,249 @@
+# reverie/history_export.py
+"""
+Streams the whole conversation history to and from a gzip-compressed JSONL file.
+Run with `python -m reverie.history_export export|import <path>`.
+
+The file starts with a header line, then each conversation followed by its messages
+(in order, without repeating the conversation id), and ends with a line of counts so a
+truncated file is detected on import:
+
+    {"format": "reverie-history", "version": 1, "exported_at": "..."}
+    {"conversation": {"conversation_id": "...", "start_time": "...", ...}}
+    {"message": {"message_id": "...", "role": "user", "content": "...", ...}}
+    {"end": {"conversations": 1, "messages": 1}}
+"""
+
+import argparse
+import gzip
+import io
+import json
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+
+FORMAT = "reverie-history"
+FORMAT_VERSION = 1
+
+CONVERSATION_COLUMNS = (
+    "conversation_id", "user_id", "interface", "start_time", "end_time", "duration_seconds", "message_count",
+    "summary", "tags", "token_usage_user", "token_usage_assistant", "token_usage_total", "model_version",
+)
+MESSAGE_COLUMNS = (
+    "message_id", "conversation_id", "role", "content", "timestamp", "token_count", "sentiment_score",
+    "custom_metrics", "tags",
+)
+JSON_COLUMNS = {"tags", "custom_metrics"}
+
+
+def json_value(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+def write_export(fileobj, conversations: Iterable[Sequence], messages: Iterable[Sequence]) -> Dict[str, int]:
+    """
+    Writes conversation rows (CONVERSATION_COLUMNS, ordered by conversation_id) and message
+    rows (MESSAGE_COLUMNS, ordered by conversation_id then timestamp) to `fileobj`, framing
+    each conversation's messages after it. Both inputs are consumed as streams.
+    Returns the number of conversations and messages written.
+    """
+    dumps = json.dumps
+    message_columns = [(i, column) for i, column in enumerate(MESSAGE_COLUMNS) if column != "conversation_id"]
+    counts = {"conversations": 0, "messages": 0, "orphaned_messages": 0}
+
+    fileobj.write(dumps({"format": FORMAT, "version": FORMAT_VERSION,
+                         "exported_at": datetime.now(timezone.utc).isoformat()}) + "\n")
+    messages = iter(messages)
+    pending = next(messages, None)
+    for conversation in conversations:
+        conversation_id = str(conversation[0])
+        fileobj.write(dumps({"conversation": {column: json_value(value)
+                                              for column, value in zip(CONVERSATION_COLUMNS, conversation)}}) + "\n")
+        counts["conversations"] += 1
+
+        # Both streams are sorted by id, so a message behind the current conversation has no conversation row
+        while pending is not None and str(pending[1]) < conversation_id:
+            counts["orphaned_messages"] += 1
+            pending = next(messages, None)
+        while pending is not None and str(pending[1]) == conversation_id:
+            fileobj.write(dumps({"message": {column: json_value(pending[i]) for i, column in message_columns}}) + "\n")
+            counts["messages"] += 1
+            pending = next(messages, None)
+
+    while pending is not None:
+        counts["orphaned_messages"] += 1
+        pending = next(messages, None)
+    fileobj.write(dumps({"end": {"conversations": counts["conversations"], "messages": counts["messages"]}}) + "\n")
+    return counts
+
+def read_export(fileobj) -> Iterator[Tuple[str, Dict]]:
+    """
+    Yields ("conversation", row) and ("message", row) pairs from an export, in file order;
+    message rows get their conversation_id back from the frame they are in. Raises
+    ValueError for a file that isn't an export or that ends early.
+    """
+    header = json.loads(fileobj.readline() or "{}")
+    if header.get("format") != FORMAT or header.get("version") != FORMAT_VERSION:
+        raise ValueError(f"Not a {FORMAT} v{FORMAT_VERSION} export")
+
+    loads = json.loads
+    conversation_id = None
+    conversations = messages = 0
+    for line in fileobj:
+        record = loads(line)
+        message = record.get("message")
+        if message is not None:
+            if conversation_id is None:
+                raise ValueError("Message before any conversation")
+            message["conversation_id"] = conversation_id
+            messages += 1
+            yield "message", message
+        elif "conversation" in record:
+            conversation_id = record["conversation"]["conversation_id"]
+            conversations += 1
+            yield "conversation", record["conversation"]
+        elif "end" in record:
+            if record["end"] != {"conversations": conversations, "messages": messages}:
+                raise ValueError(f"Export says {record['end']}, but {conversations} conversations and "
+                                 f"{messages} messages were read")
+            return
+    raise ValueError(f"Export ended early, after {conversations} conversations and {messages} messages")
+
+def copy_value(column: str, value) -> str:
+    """
+    One field in PostgreSQL's COPY text format.
+    """
+    if value is None:
+        return "\\N"
+    if column in JSON_COLUMNS:
+        value = json.dumps(value)
+    elif not isinstance(value, str):
+        return str(value)
+    return value.replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+def copy_row(columns: Sequence[str], row: Dict) -> str:
+    return "\t".join([copy_value(column, row.get(column)) for column in columns]) + "\n"
+
+def copy_chunks(events: Iterable[Tuple[str, Dict]], chunk_rows: int = 50_000,
+                new_ids: bool = False) -> Iterator[Tuple[List[str], List[str]]]:
+    """
+    Groups an export's rows into (conversation lines, message lines) chunks of about
+    `chunk_rows` rows in COPY text format. A chunk's conversations are loaded before its
+    messages, and a message's conversation is always in the same or an earlier chunk.
+
+    With `new_ids`, every conversation and message gets a fresh UUID, so one export can
+    be loaded into the same database many times (e.g. to seed a benchmark database).
+    """
+    conversation_lines, message_lines = [], []
+    conversation_id = None
+    for kind, row in events:
+        if kind == "conversation":
+            if new_ids:
+                row["conversation_id"] = str(uuid.uuid4())
+            conversation_id = row["conversation_id"]
+            conversation_lines.append(copy_row(CONVERSATION_COLUMNS, row))
+        else:
+            if new_ids:
+                row["message_id"] = str(uuid.uuid4())
+                row["conversation_id"] = conversation_id
+            message_lines.append(copy_row(MESSAGE_COLUMNS, row))
+        if len(conversation_lines) + len(message_lines) >= chunk_rows:
+            yield conversation_lines, message_lines
+            conversation_lines, message_lines = [], []
+    if conversation_lines or message_lines:
+        yield conversation_lines, message_lines
+
+def export_history(path: str, batch_size: int = 10_000) -> Dict[str, int]:
+    """
+    Exports every conversation and message to `path` from one consistent snapshot, reading
+    both tables through server-side cursors so memory stays flat however large they are.
+    """
+    import psycopg2
+    from reverie.db_utils import checkout
+
+    start = time.perf_counter()
+    with checkout() as connection:
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+            with connection.cursor(name="reverie_export_conversations") as conversations, \
+                    connection.cursor(name="reverie_export_messages") as messages:
+                conversations.itersize = messages.itersize = batch_size
+                conversations.execute(f"SELECT {', '.join(CONVERSATION_COLUMNS)} FROM Conversations "
+                                      f"ORDER BY conversation_id")
+                messages.execute(f"SELECT {', '.join(MESSAGE_COLUMNS)} FROM Messages "
+                                 f"ORDER BY conversation_id, timestamp")
+                with gzip.open(path, "wt", encoding="utf-8", compresslevel=6) as fileobj:
+                    counts = write_export(fileobj, conversations, messages)
+            connection.commit()
+        except psycopg2.Error as e:
+            print(f"Database error: {e}")
+            connection.rollback()
+            raise
+
+    counts["seconds"] = time.perf_counter() - start
+    return counts
+
+def import_history(path: str, new_ids: bool = False, migrate: bool = False, chunk_rows: int = 50_000) -> Dict[str, int]:
+    """
+    Loads an export with COPY ... FROM STDIN, one chunk at a time, in a single transaction:
+    either the whole file is imported or nothing is. With `migrate`, the schema is
+    created first (for restoring into an empty database).
+    """
+    import psycopg2
+    from reverie.db_utils import checkout
+
+    conversation_copy = f"COPY Conversations ({', '.join(CONVERSATION_COLUMNS)}) FROM STDIN"
+    message_copy = f"COPY Messages ({', '.join(MESSAGE_COLUMNS)}) FROM STDIN"
+    counts = {"conversations": 0, "messages": 0}
+    start = time.perf_counter()
+    with checkout() as connection:
+        if migrate:
+            from reverie.schema import migrate as migrate_schema
+            migrate_schema(connection)
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as fileobj, connection.cursor() as cursor:
+                for conversation_lines, message_lines in copy_chunks(read_export(fileobj), chunk_rows, new_ids):
+                    if conversation_lines:
+                        cursor.copy_expert(conversation_copy, io.StringIO("".join(conversation_lines)))
+                    if message_lines:
+                        cursor.copy_expert(message_copy, io.StringIO("".join(message_lines)))
+                    counts["conversations"] += len(conversation_lines)
+                    counts["messages"] += len(message_lines)
+            connection.commit()
+        except (psycopg2.Error, ValueError) as e:
+            print(f"Import failed, nothing was imported: {e}")
+            connection.rollback()
+            raise
+
+    counts["seconds"] = time.perf_counter() - start
+    return counts
+
+def main():
+    from reverie.db_utils import close_connection_pool
+
+    parser = argparse.ArgumentParser(description="Export or import Reverie's conversation history.")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("path", help="A .jsonl.gz export file")
+    parser.add_argument("--new-ids", action="store_true", help="Import: give every row a fresh UUID")
+    parser.add_argument("--migrate", action="store_true", help="Import: create the schema first")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            counts = export_history(args.path)
+        else:
+            counts = import_history(args.path, new_ids=args.new_ids, migrate=args.migrate)
+    finally:
+        close_connection_pool()
+    rate = counts["messages"] / counts["seconds"] * 60 if counts["seconds"] else 0
+    print(f"{args.command.capitalize()}ed {counts['conversations']} conversations and {counts['messages']} messages "
+          f"in {counts['seconds']:.1f}s ({rate:,.0f} messages/minute)")
+    if counts.get("orphaned_messages"):
+        print(f"Skipped {counts['orphaned_messages']} messages with no conversation row")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# reverie/memory_index.py
+
+import math
+import os
+import pickle
+import re
+import threading
+import time
+from array import array
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+MEMORY_INDEX_PATH = os.getenv("REVERIE_MEMORY_INDEX_PATH", "memory_index.pickle")
+SNAPSHOT_VERSION = 1
+# Catch-up re-reads this much history before the snapshot's newest message, so rows committed
+# late with an earlier timestamp (e.g. from another process's write-behind buffer) aren't missed
+CATCH_UP_OVERLAP = timedelta(minutes=5)
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9']+")
+STOPWORDS = frozenset("""
+a about after all also am an and any are as at be because been but by can could did do does for from
+had has have he her him his how i if in into is it its just me my no not of on or our she so than that
+the their them then there these they this to up us was we were what when where which who will with would
+you your i'm it's don't
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+class BM25Index:
+    """
+    An append-only inverted index over messages, scored with Okapi BM25.
+
+    Documents get consecutive integer ids as they are added, so each posting list is a
+    pair of growing arrays (doc ids, term frequencies) and adding a message only appends.
+    Queries score every posting of each query term at once with NumPy and return the
+    top `k` documents. Not thread-safe: search() reads the posting arrays through NumPy
+    views, which add() must not grow meanwhile. The shared index below is only touched
+    under _index_lock.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, tuple] = {}  # term -> (array of doc ids, array of term frequencies)
+        self.doc_lengths = array("I")
+        self.documents = []  # (conversation_id, role, content) per doc id
+        self.total_length = 0
+        self.indexed_until: Optional[datetime] = None  # Timestamp of the newest stored message added by catch_up()
+        self.recent_ids: Dict[str, datetime] = {}  # Message ids added within CATCH_UP_OVERLAP of indexed_until
+
+    def __len__(self):
+        return len(self.documents)
+
+    def add(self, conversation_id: str, role: str, content: str):
+        doc_id = len(self.documents)
+        terms = tokenize(content)
+        frequencies = {}
+        for term in terms:
+            frequencies[term] = frequencies.get(term, 0) + 1
+
+        for term, frequency in frequencies.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                posting = self.postings[term] = (array("I"), array("I"))
+            posting[0].append(doc_id)
+            posting[1].append(frequency)
+
+        self.documents.append((conversation_id, role, content))
+        self.doc_lengths.append(len(terms))
+        self.total_length += len(terms)
+
+    def catch_up(self, messages: Iterable[Dict]) -> int:
+        """
+        Adds stored messages (as yielded by a storage backend's iter_all_messages) that
+        are not in the index yet, advancing indexed_until. Returns how many were added.
+        """
+        added = 0
+        for message in messages:
+            message_id = str(message["message_id"])
+            if message_id in self.recent_ids:
+                continue
+            timestamp = as_datetime(message["timestamp"])
+            self.add(message["conversation_id"], message["role"], message["content"])
+            self.recent_ids[message_id] = timestamp
+            if self.indexed_until is None or timestamp > self.indexed_until:
+                self.indexed_until = timestamp
+            added += 1
+        if self.indexed_until is not None:
+            horizon = self.indexed_until - CATCH_UP_OVERLAP
+            self.recent_ids = {message_id: timestamp for message_id, timestamp in self.recent_ids.items()
+                               if timestamp >= horizon}
+        return added
+
+    def catch_up_since(self) -> Optional[datetime]:
+        """
+        Where the next catch_up() should start reading stored messages from.
+        """
+        return self.indexed_until - CATCH_UP_OVERLAP if self.indexed_until is not None else None
+
+    def save(self, path: str, source: str = None):
+        """
+        Writes the index to `path` (atomically, via a temporary file) so the next start
+        only has to catch up on newer messages. `source` names the storage it came from.
+        """
+        state = {"version": SNAPSHOT_VERSION, "source": source, "k1": self.k1, "b": self.b,
+                 "postings": self.postings, "doc_lengths": self.doc_lengths, "documents": self.documents,
+                 "total_length": self.total_length, "indexed_until": self.indexed_until,
+                 "recent_ids": self.recent_ids}
+        temporary_path = f"{path}.tmp"
+        try:
+            with open(temporary_path, "wb") as snapshot:
+                pickle.dump(state, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temporary_path, path)
+        except OSError as e:
+            print(f"Error saving memory index snapshot: {e}")
+
+    @classmethod
+    def load(cls, path: str, source: str = None) -> Optional["BM25Index"]:
+        """
+        Reads a snapshot written by save(), or returns None if there is none or it is
+        unreadable, from an older version or from different storage.
+        """
+        try:
+            with open(path, "rb") as snapshot:
+                state = pickle.load(snapshot)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable memory index snapshot {path}: {e}")
+            return None
+        if state.get("version") != SNAPSHOT_VERSION or state.get("source") != source:
+            return None
+        index = cls(state["k1"], state["b"])
+        for key in ("postings", "doc_lengths", "documents", "total_length", "indexed_until", "recent_ids"):
+            setattr(index, key, state[key])
+        return index
+
+    def search(self, query: str, k: int = 5, exclude_conversation_id: Optional[str] = None) -> List[Dict]:
+        """
+        Returns up to `k` of the most relevant messages as dictionaries with role,
+        content, conversation_id and score, best first.
+        """
+        doc_count = len(self.documents)
+        terms = set(tokenize(query))
+        if not doc_count or not terms:
+            return []
+
+        average_length = self.total_length / doc_count
+        doc_lengths = np.frombuffer(self.doc_lengths, dtype=np.uint32)
+        scores = np.zeros(doc_count, dtype=np.float32)
+        for term in terms:
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            doc_ids = np.frombuffer(posting[0], dtype=np.uint32)
+            frequencies = np.frombuffer(posting[1], dtype=np.uint32).astype(np.float32)
+            idf = math.log(1 + (doc_count - len(doc_ids) + 0.5) / (len(doc_ids) + 0.5))
+            length_norm = self.k1 * (1 - self.b + self.b * doc_lengths[doc_ids] / average_length)
+            scores[doc_ids] += idf * frequencies * (self.k1 + 1) / (frequencies + length_norm)
+
+        candidates = np.flatnonzero(scores)
+        if not len(candidates):
+            return []
+        # Over-fetch a little so excluded messages don't leave the result short
+        fetch = min(len(candidates), k * 4 if exclude_conversation_id else k)
+        top = candidates[np.argpartition(-scores[candidates], fetch - 1)[:fetch]]
+        top = top[np.argsort(-scores[top], kind="stable")]
+
+        results = []
+        for doc_id in top.tolist():
+            conversation_id, role, content = self.documents[doc_id]
+            if exclude_conversation_id is not None and conversation_id == exclude_conversation_id:
+                continue
+            results.append({"role": role, "content": content, "conversation_id": conversation_id,
+                            "score": float(scores[doc_id])})
+            if len(results) == k:
+                break
+        return results
+
+def as_datetime(timestamp) -> datetime:
+    """
+    Stored timestamps come back as datetimes from PostgreSQL and ISO strings from SQLite.
+    """
+    if isinstance(timestamp, str):
+        timestamp = datetime.fromisoformat(timestamp)
+    return timestamp if timestamp.tzinfo else timestamp.replace(tzinfo=timezone.utc)
+
+memory_index: Optional[BM25Index] = None  # Built by load_memory_index() or start_memory_index()
+_pending: Optional[List[tuple]] = None  # Messages added while start_memory_index() is still building
+_index_lock = threading.Lock()
+
+def load_memory_index(messages: Iterable[Dict]) -> BM25Index:
+    """
+    Builds the shared index from stored messages (dictionaries with conversation_id,
+    role and content). After this, index_message keeps it current as messages are added.
+    """
+    global memory_index
+    index = BM25Index()
+    for message in messages:
+        index.add(message["conversation_id"], message["role"], message["content"])
+    with _index_lock:
+        memory_index = index
+    return index
+
+def start_memory_index(storage, path: Optional[str] = None) -> threading.Thread:
+    """
+    Builds the shared index on a background thread, so startup doesn't wait for it:
+    recall returns nothing until it is ready. The snapshot at `path` (by default
+    MEMORY_INDEX_PATH) is loaded and caught up with messages stored since it was written,
+    then saved again; only a missing or stale snapshot means reading every message.
+    Messages added meanwhile through index_message are kept and added once it is built.
+    """
+    global _pending
+    path = MEMORY_INDEX_PATH if path is None else path
+    until = datetime.now(timezone.utc)  # Newer messages are this process's own, added via index_message
+    with _index_lock:
+        _pending = []
+
+    source = f"{storage.name}:{storage.location}"
+
+    def build():
+        global memory_index, _pending
+        start = time.perf_counter()
+        index = BM25Index.load(path, source) if path else None
+        loaded = len(index) if index is not None else 0
+        index = index or BM25Index()
+        try:
+            added = index.catch_up(storage.iter_all_messages(since=index.catch_up_since(), until=until))
+            if path:
+                index.save(path, source)
+        except Exception as e:
+            added = 0
+            print(f"Error building memory index: {e}")
+        with _index_lock:
+            for message in _pending:
+                index.add(*message)
+            memory_index, _pending = index, None
+        print(f"Memory index ready in {time.perf_counter() - start:.1f}s: {loaded} messages from the snapshot, "
+              f"{added} caught up")
+
+    thread = threading.Thread(target=build, name="memory-index", daemon=True)
+    thread.start()
+    return thread
+
+def index_message(conversation_id: str, role: str, content: str):
+    """
+    Adds a new message to the shared index, if one has been loaded or is being built.
+    """
+    if role == "system":
+        return
+    with _index_lock:
+        if _pending is not None:
+            _pending.append((conversation_id, role, content))
+        elif memory_index is not None:
+            memory_index.add(conversation_id, role, content)
+
+def search_memory(query: str, k: int = 5, exclude_conversation_id: Optional[str] = None) -> List[Dict]:
+    """
+    Returns the `k` past messages most relevant to `query`, or nothing if no index is loaded.
+    Holds the index lock, so messages indexed by other threads wait for the search to finish.
+    """
+    with _index_lock:
+        if memory_index is None:
+            return []
+        return memory_index.search(query, k, exclude_conversation_id)
@@ -0,0 +1,247 @@
+# reverie/schema.py
+"""
+Reverie's database schema as numbered migrations, plus a check that the queries db_utils
+issues are served by indexes. Run with `python -m reverie.schema migrate|status|check`.
+Requires PostgreSQL 13+ (for gen_random_uuid()).
+"""
+
+import argparse
+import json
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# (version, description, statements). Applied in order, each version in its own
+# transaction, and recorded in schema_migrations. Never edit a released migration;
+# add a new one.
+MIGRATIONS = [
+    (1, "Conversations and messages", [
+        """
+        CREATE TABLE IF NOT EXISTS conversations (
+            conversation_id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+            user_id text NOT NULL,
+            interface text,
+            start_time timestamptz NOT NULL DEFAULT now(),
+            end_time timestamptz,
+            duration_seconds double precision,
+            message_count integer NOT NULL DEFAULT 0,
+            summary text,
+            tags jsonb,
+            token_usage_user integer NOT NULL DEFAULT 0,
+            token_usage_assistant integer NOT NULL DEFAULT 0,
+            token_usage_total integer NOT NULL DEFAULT 0,
+            model_version text
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS messages (
+            message_id uuid PRIMARY KEY DEFAULT gen_random_uuid(),
+            conversation_id uuid NOT NULL REFERENCES conversations (conversation_id) ON DELETE CASCADE,
+            role text NOT NULL,
+            content text NOT NULL,
+            timestamp timestamptz NOT NULL DEFAULT now(),
+            token_count integer,
+            sentiment_score real,
+            custom_metrics jsonb,
+            tags jsonb
+        )
+        """,
+    ]),
+    (2, "Indexes for db_utils' query patterns", [
+        # A conversation's messages in order: history, keyset pagination, tagging
+        "CREATE INDEX IF NOT EXISTS messages_conversation_timestamp_idx ON messages (conversation_id, timestamp)",
+        # Messages still waiting for tags, per conversation
+        "CREATE INDEX IF NOT EXISTS messages_untagged_idx ON messages (conversation_id, timestamp) "
+        "WHERE tags IS NULL OR tags = '[]'::jsonb",
+        # Recent / all non-system messages across conversations (recall index, get_recent_messages)
+        "CREATE INDEX IF NOT EXISTS messages_non_system_timestamp_idx ON messages (timestamp) WHERE role <> 'system'",
+        # Tag lookups, e.g. tags @> '["music"]'
+        "CREATE INDEX IF NOT EXISTS messages_tags_gin_idx ON messages USING gin (tags jsonb_path_ops)",
+        # First/latest conversation
+        "CREATE INDEX IF NOT EXISTS conversations_start_time_idx ON conversations (start_time)",
+        # Newest conversation on an interface (session resume)
+        "CREATE INDEX IF NOT EXISTS conversations_interface_start_time_idx ON conversations (interface, start_time)",
+        # Conversations still waiting for tags or a summary
+        "CREATE INDEX IF NOT EXISTS conversations_untagged_idx ON conversations (start_time) WHERE tags IS NULL",
+        "CREATE INDEX IF NOT EXISTS conversations_unsummarized_idx ON conversations (start_time) WHERE summary IS NULL",
+    ]),
+    (3, "Backfill conversation counters", [
+        # From here on the counters are maintained incrementally (reverie.conversation_stats)
+        """
+        UPDATE conversations AS c SET
+            message_count = m.messages,
+            token_usage_user = m.user_tokens,
+            token_usage_assistant = m.assistant_tokens,
+            token_usage_total = m.total_tokens
+        FROM (
+            SELECT conversation_id, COUNT(*) AS messages,
+                   COALESCE(SUM(token_count) FILTER (WHERE role = 'user'), 0) AS user_tokens,
+                   COALESCE(SUM(token_count) FILTER (WHERE role = 'assistant'), 0) AS assistant_tokens,
+                   COALESCE(SUM(token_count), 0) AS total_tokens
+            FROM messages GROUP BY conversation_id
+        ) AS m
+        WHERE c.conversation_id = m.conversation_id
+        """,
+    ]),
+    (4, "Tie-break message keyset pagination on message_id", [
+        # Replaces messages_conversation_timestamp_idx, which is its prefix
+        "CREATE INDEX IF NOT EXISTS messages_conversation_timestamp_id_idx "
+        "ON messages (conversation_id, timestamp, message_id)",
+        "DROP INDEX IF EXISTS messages_conversation_timestamp_idx",
+    ]),
+    (5, "Find untagged conversations through their messages", [
+        # Conversations.tags is never set, so the backfill now selects by messages_untagged_idx
+        "DROP INDEX IF EXISTS conversations_untagged_idx",
+    ]),
+]
+
+SAMPLE_ID = "00000000-0000-0000-0000-000000000000"
+
+# The hot queries in db_utils, verbatim, with sample parameters for EXPLAIN. Queries
+# marked full_scan read the whole table by design and only need to avoid a sort.
+HOT_QUERIES = [
+    {"name": "first_conversation",
+     "sql": "SELECT conversation_id FROM Conversations ORDER BY start_time ASC LIMIT 1;", "params": ()},
+    {"name": "latest_conversation",
+     "sql": "SELECT conversation_id FROM Conversations ORDER BY start_time DESC LIMIT 1;", "params": ()},
+    {"name": "untagged_conversations",
+     "sql": "SELECT conversation_id FROM Conversations WHERE conversation_id IN "
+            "(SELECT conversation_id FROM Messages WHERE tags IS NULL OR tags = '[]') ORDER BY start_time ASC;",
+     "params": ()},
+    {"name": "unsummarized_closed_conversations",
+     "sql": "SELECT conversation_id FROM Conversations WHERE summary IS NULL "
+            "AND (end_time IS NOT NULL OR start_time < %s) ORDER BY start_time ASC;",
+     "params": ("now",)},
+    {"name": "conversation_messages",
+     "sql": "SELECT role, content, token_count FROM Messages WHERE conversation_id = %s AND role != 'system' "
+            "ORDER BY timestamp ASC;",
+     "params": ("conversation_id",)},
+    {"name": "recent_messages",
+     "sql": "SELECT role, content FROM messages WHERE role != 'system' ORDER BY timestamp DESC LIMIT %s;",
+     "params": (100,)},
+    {"name": "latest_conversation_for_interface",
+     "sql": "SELECT conversation_id, summary FROM Conversations WHERE interface = %s ORDER BY start_time DESC LIMIT 1;",
+     "params": ("interface",)},
+    {"name": "recent_conversation_messages",
+     "sql": "SELECT role, content, token_count, timestamp, message_id FROM Messages "
+            "WHERE conversation_id = %s AND role != 'system' "
+            "AND (%s::timestamptz IS NULL OR (timestamp, message_id) < (%s, %s::uuid)) "
+            "ORDER BY timestamp DESC, message_id DESC LIMIT %s;",
+     "params": ("conversation_id", None, None, None, 50)},
+    {"name": "all_messages", "full_scan": True,
+     "sql": "SELECT conversation_id, role, content, timestamp, message_id FROM Messages "
+            "WHERE role != 'system' AND timestamp >= %s::timestamptz AND timestamp < %s::timestamptz "
+            "ORDER BY timestamp ASC;",
+     "params": ("-infinity", "infinity")},
+    {"name": "all_messages_in_conversation",
+     "sql": "SELECT message_id, content FROM Messages WHERE conversation_id = %s ORDER BY timestamp ASC;",
+     "params": ("conversation_id",)},
+    {"name": "untagged_messages_in_conversation",
+     "sql": "SELECT message_id, content FROM messages WHERE conversation_id = %s AND (tags is NULL OR tags = '[]') "
+            "ORDER BY timestamp ASC;",
+     "params": ("conversation_id",)},
+]
+
+
+def query_params(query: Dict, samples: Dict) -> tuple:
+    """
+    Fills a hot query's placeholder names ("conversation_id", "interface", "now") from `samples`.
+    """
+    return tuple(samples.get(param, param) if isinstance(param, str) else param for param in query["params"])
+
+def current_version(cursor) -> int:
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version integer PRIMARY KEY, description text NOT NULL, applied_at timestamptz NOT NULL DEFAULT now())"
+    )
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+def migrate(connection, target: Optional[int] = None) -> List[int]:
+    """
+    Applies every migration above the database's current version (up to `target`), each
+    in its own transaction. Returns the versions applied.
+    """
+    applied = []
+    with connection.cursor() as cursor:
+        version = current_version(cursor)
+    connection.commit()
+
+    for number, description, statements in MIGRATIONS:
+        if number <= version or (target is not None and number > target):
+            continue
+        try:
+            with connection.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute("INSERT INTO schema_migrations (version, description) VALUES (%s, %s)",
+                               (number, description))
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+        print(f"Applied migration {number}: {description}")
+        applied.append(number)
+    return applied
+
+def plan_seq_scans(plan: Dict) -> List[str]:
+    """
+    Returns the relations read with a sequential scan anywhere in an EXPLAIN (FORMAT JSON) plan.
+    """
+    scans = [plan["Relation Name"]] if plan.get("Node Type") == "Seq Scan" else []
+    for child in plan.get("Plans", []):
+        scans.extend(plan_seq_scans(child))
+    return scans
+
+def plan_sorts(plan: Dict) -> int:
+    return (plan.get("Node Type") == "Sort") + sum(plan_sorts(child) for child in plan.get("Plans", []))
+
+def check_indexes(connection, samples: Optional[Dict] = None) -> Dict[str, List[str]]:
+    """
+    EXPLAINs every hot query with sequential scans disabled, so the plan shows whether an
+    index *can* serve it however small the tables are. Returns {query name: problems};
+    an empty dictionary means every query is index-backed.
+    """
+    samples = {"conversation_id": SAMPLE_ID, "interface": "cli", "now": datetime.now(timezone.utc), **(samples or {})}
+    problems = {}
+    with connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        for query in HOT_QUERIES:
+            cursor.execute("EXPLAIN (FORMAT JSON) " + query["sql"], query_params(query, samples))
+            raw = cursor.fetchone()[0]
+            plan = (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+            found = [f"sequential scan of {relation}" for relation in plan_seq_scans(plan)]
+            if query.get("full_scan"):
+                found = [f"sorts {plan_sorts(plan)} time(s) instead of reading an index in order"] if plan_sorts(plan) else []
+            if found:
+                problems[query["name"]] = found
+    connection.rollback()
+    return problems
+
+def main():
+    from reverie.db_utils import checkout, close_connection_pool
+
+    parser = argparse.ArgumentParser(description="Manage Reverie's database schema.")
+    parser.add_argument("command", choices=["migrate", "status", "check"])
+    parser.add_argument("--target", type=int, help="Migrate up to this version only")
+    args = parser.parse_args()
+
+    try:
+        with checkout() as connection:
+            if args.command == "migrate":
+                applied = migrate(connection, args.target)
+                print(f"Applied {len(applied)} migration(s)." if applied else "Schema is up to date.")
+            elif args.command == "status":
+                with connection.cursor() as cursor:
+                    version = current_version(cursor)
+                connection.commit()
+                print(f"Schema version {version} of {MIGRATIONS[-1][0]}.")
+            else:
+                problems = check_indexes(connection)
+                for name, found in problems.items():
+                    print(f"{name}: {'; '.join(found)}")
+                print("Every hot query is index-backed." if not problems else f"{len(problems)} query(s) not index-backed.")
+    finally:
+        close_connection_pool()
+
+if __name__ == "__main__":
+    main()
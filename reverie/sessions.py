@@ -0,0 +1,109 @@
+# reverie/sessions.py
+
+import asyncio
+import inspect
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional
+
+from reverie.context_window import ContextWindow
+
+
+class Session:
+    """
+    One conversation's live state: its database id and its token-bounded context window.
+    """
+
+    def __init__(self, key: str, conversation_id: str, window: ContextWindow):
+        self.key = key
+        self.conversation_id = conversation_id
+        self.window = window
+        self.last_active = time.monotonic()
+
+class SessionRegistry:
+    """
+    Keeps at most `max_sessions` sessions in memory, keyed by e.g. Discord channel or thread.
+
+    Sessions are evicted least-recently-used first when the registry is full, and any
+    session idle for more than `idle_timeout` seconds is evicted on the next lookup. A
+    lookup that misses calls `load_session(key)` to rehydrate the session (typically from
+    the database); concurrent lookups for the same key share one load. `on_evict(session)`,
+    which may be a coroutine function, is called for every evicted session.
+    """
+
+    def __init__(
+        self,
+        load_session: Callable[[str], Awaitable[Session]],
+        max_sessions: int = 1000,
+        idle_timeout: float = 1800.0,
+        on_evict: Optional[Callable[[Session], object]] = None
+    ):
+        self.load_session = load_session
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.on_evict = on_evict
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()  # Least recently used first
+        self._loading: Dict[str, asyncio.Future] = {}
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.sessions)
+
+    async def get(self, key: str) -> Session:
+        await self.evict_idle()
+
+        session = self.sessions.get(key)
+        if session is not None:
+            self.hits += 1
+            self.sessions.move_to_end(key)
+            session.last_active = time.monotonic()
+            return session
+
+        pending = self._loading.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        pending = self._loading[key] = asyncio.get_running_loop().create_future()
+        try:
+            session = await self.load_session(key)
+        except BaseException as e:
+            pending.set_exception(e)
+            pending.exception()  # Mark retrieved so a load nobody else waited on isn't logged
+            raise
+        finally:
+            del self._loading[key]
+
+        pending.set_result(session)
+        self.sessions[key] = session
+        while len(self.sessions) > self.max_sessions:
+            _, evicted = self.sessions.popitem(last=False)
+            await self._evicted(evicted)
+        return session
+
+    async def evict_idle(self):
+        cutoff = time.monotonic() - self.idle_timeout
+        while self.sessions:
+            key, session = next(iter(self.sessions.items()))
+            if session.last_active > cutoff:
+                break
+            del self.sessions[key]
+            await self._evicted(session)
+
+    async def close(self):
+        """
+        Evicts every session, e.g. at shutdown.
+        """
+        while self.sessions:
+            _, session = self.sessions.popitem(last=False)
+            await self._evicted(session)
+
+    async def _evicted(self, session: Session):
+        self.evictions += 1
+        if self.on_evict is not None:
+            result = self.on_evict(session)
+            if inspect.isawaitable(result):
+                await result
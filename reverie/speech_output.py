@@ -0,0 +1,156 @@
+# reverie/speech_output.py
+
+import queue
+import re
+import threading
+import time
+from typing import Iterable, List, Optional, Tuple
+
+from reverie.tracing import current_turn, record, span
+
+# A sentence ends at ., ! or ? (plus any closing quotes or brackets) followed by whitespace, or at a line break
+SENTENCE_END = re.compile(r"(?<=[.!?])[\"')\]]*\s+|\n+")
+
+
+def split_sentences(text: str) -> Tuple[List[str], str]:
+    """
+    Splits off every complete sentence at the start of `text`.
+    Returns (sentences, remainder), where the remainder is an unfinished sentence.
+    """
+    sentences = []
+    start = 0
+    for match in SENTENCE_END.finditer(text):
+        sentence = text[start:match.end()].strip()
+        if sentence:
+            sentences.append(sentence)
+        start = match.end()
+    return sentences, text[start:]
+
+class SentenceSpeaker:
+    """
+    Speaks text one sentence at a time on a dedicated TTS thread.
+
+    speak_stream() consumes completion deltas and queues each sentence as soon as it
+    is complete, so the first sentence is being spoken while the rest of the reply is
+    still being generated. cancel() (barge-in) drops everything queued, stops the
+    current sentence if the sink supports it, and ends any speak_stream() in progress.
+
+    `sink` needs say(text), which blocks until the text has been spoken, and may have
+    stop(), which is called from other threads and should only ask the sink to stop
+    soon.
+
+    is_playing() tells whether a sentence is being spoken, e.g. so the microphone can
+    tell the assistant's own voice from the user's. The time from `started_at` until the
+    first sentence of each reply starts to play is recorded in `first_audio_latencies`.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.first_audio_latencies = []
+        self.sentences_spoken = 0
+        self.sentences_cancelled = 0
+        self.cancellations = 0
+        self._generation = 0  # Bumped by cancel(); queued sentences from older generations are dropped
+        self._playing_until = 0.0  # Monotonic time the last sentence finished, or infinity while one is playing
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name="tts", daemon=True)
+        self._thread.start()
+
+    def speak(self, text: str, started_at: Optional[float] = None):
+        """
+        Queues `text` to be spoken after anything already queued.
+        """
+        if text:
+            self._queue.put((self._generation, text, started_at, current_turn()))
+
+    def speak_stream(self, deltas: Iterable[str], started_at: Optional[float] = None) -> str:
+        """
+        Speaks a streamed reply sentence by sentence and returns the text received. Returns
+        as soon as the stream ends (or is cancelled), without waiting for playback.
+        """
+        started_at = time.monotonic() if started_at is None else started_at
+        generation = self._generation
+        turn = current_turn()  # The TTS thread has its own context, so the turn id travels with each sentence
+        parts = []
+        pending = ""
+        first = True
+        try:
+            for delta in deltas:
+                if self._generation != generation:
+                    return "".join(parts)
+                parts.append(delta)
+                sentences, pending = split_sentences(pending + delta)
+                for sentence in sentences:
+                    self._queue.put((generation, sentence, started_at if first else None, turn))
+                    first = False
+        finally:
+            close = getattr(deltas, "close", None)
+            if close is not None:
+                close()  # Stops the request if the reply was cut short
+
+        if pending.strip() and self._generation == generation:
+            self._queue.put((generation, pending.strip(), started_at if first else None, turn))
+        return "".join(parts)
+
+    def cancel(self):
+        """
+        Barge-in: silences the current reply and discards the rest of it.
+        """
+        self._generation += 1
+        self.cancellations += 1
+        stop = getattr(self.sink, "stop", None)
+        if stop is not None:
+            stop()
+
+    def is_playing(self, tail: float = 0.0) -> bool:
+        """
+        True while a sentence is being spoken, or ended less than `tail` seconds ago (e.g. for room echo).
+        """
+        return time.monotonic() < self._playing_until + tail
+
+    def wait(self):
+        """
+        Blocks until everything queued has been spoken or discarded.
+        """
+        self._queue.join()
+
+    def close(self):
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            generation, text, started_at, turn = item
+            try:
+                if generation != self._generation:
+                    self.sentences_cancelled += 1
+                    continue
+                if started_at is not None:
+                    latency = time.monotonic() - started_at
+                    self.first_audio_latencies.append(latency)
+                    record("tts.first_audio", latency, turn=turn)
+                self._playing_until = float("inf")
+                try:
+                    with span("tts.say", turn=turn):
+                        self.sink.say(text)
+                finally:
+                    self._playing_until = time.monotonic()
+                self.sentences_spoken += 1
+            except Exception as e:
+                print(f"Error speaking text: {e}")
+            finally:
+                self._queue.task_done()
+
+    def stats(self) -> dict:
+        latencies = sorted(self.first_audio_latencies)
+        return {
+            "replies": len(latencies),
+            "first_audio_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+            "sentences_spoken": self.sentences_spoken,
+            "sentences_cancelled": self.sentences_cancelled,
+            "cancellations": self.cancellations,
+        }
@@ -0,0 +1,637 @@
+# reverie/storage.py
+"""
+Where conversations and messages are stored. get_storage() returns the backend chosen
+by REVERIE_DB_BACKEND:
+
+    postgres  the PostgreSQL server configured by the REVERIE_DB_* settings (the default);
+              the queries themselves live in db_utils
+    sqlite    an embedded SQLite database in WAL mode at REVERIE_DB_PATH, for single-user
+              CLI or voice deployments that don't want a database server
+
+Both implement StorageBackend, which covers everything the rest of Reverie reads and
+writes. Database-specific tooling (schema migrations, history export) stays PostgreSQL-only.
+"""
+
+import asyncio
+import contextvars
+import functools
+import json
+import os
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from reverie.tracing import traced
+
+DB_BACKEND = os.getenv("REVERIE_DB_BACKEND", "postgres")
+DB_PATH = os.getenv("REVERIE_DB_PATH", "reverie.sqlite3")
+
+STATS_COLUMNS = ("message_count", "token_usage_user", "token_usage_assistant", "token_usage_total")
+
+storage = None  # Created on first use by get_storage()
+_storage_lock = threading.Lock()
+
+
+def generate_conversation_data(interface: str = None):
+    return {
+        "user_id": "Rewind",  # Current default user
+        "interface": interface,  # Where the conversation takes place, e.g. "discord:<channel id>"
+        "start_time": datetime.now(timezone.utc),  # Record the current UTC time as the start time
+        "end_time": None,  # End time is null at the beginning
+        "duration_seconds": None,  # Duration will be calculated when the conversation ends
+        "message_count": 0,  # Initialize with 0 messages
+        "summary": None,  # No summary initially
+        "tags": None,  # Tags will be set later if needed
+        "token_usage_user": 0,  # Initialize user token usage as 0
+        "token_usage_assistant": 0,  # Initialize assistant token usage as 0
+        "token_usage_total": 0,  # Initialize total token usage as 0
+        "model_version": None,  # Placeholder; can be set dynamically during the conversation
+    }
+
+def generate_message_data(conversation_id: str, role: str, content: str, token_count: int, sentiment_score: float = None, custom_metrics: dict = None):
+    return {
+        "conversation_id": conversation_id,  # Link to the conversation
+        "role": role,  # Role of the sender
+        "content": content,  # Message content
+        "timestamp": datetime.now(timezone.utc),  # Current UTC time
+        "token_count": token_count,  # Number of tokens in the message
+        "sentiment_score": sentiment_score,  # Optional sentiment score
+        "custom_metrics": custom_metrics,  # Optional additional metrics
+    }
+
+class StorageBackend(ABC):
+    """
+    Everything Reverie reads and writes about conversations and messages. Reads print
+    database errors and return None or an empty result; bulk writes (insert_many_into_table,
+    bulk_update_table_column_by_id, apply_conversation_stats) roll back and raise, so
+    their callers can keep the rows and retry.
+    """
+
+    name = None
+    location = None  # Which database, e.g. for caches derived from its contents
+
+    @abstractmethod
+    def insert_into_table(self, table_name: str, data: dict, returning: str = None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_conversation(self, conversation_data: dict, system_message: dict) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def insert_many_into_table(self, table_name: str, rows: list, page_size: int = 500):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_table_column_by_id(self, table_name: str, column_name: str, id_column: str, record_id: str, value):
+        raise NotImplementedError
+
+    @abstractmethod
+    def bulk_update_table_column_by_id(self, table_name: str, column_name: str, id_column: str, values: dict,
+                                       id_cast: str = None, value_cast: str = None, page_size: int = 500):
+        raise NotImplementedError
+
+    @abstractmethod
+    def apply_conversation_stats(self, rows: list, page_size: int = 500):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_conversation_stats(self, conversation_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def recompute_conversation_stats(self, conversation_id: str) -> Optional[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_first_conversation_id(self) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_latest_conversation_id(self) -> Optional[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_untagged_conversation_ids(self) -> List[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_unsummarized_closed_conversation_ids(self, closed_before: datetime) -> List[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_conversation_messages(self, conversation_id: str) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_recent_messages(self, num_messages: int = 100) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_latest_conversation_for_interface(self, interface: str) -> Optional[Tuple[str, Optional[str]]]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_recent_conversation_messages(self, conversation_id: str, token_budget: int,
+                                         page_size: int = 50) -> List[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_all_messages(self, batch_size: int = 10_000, since=None, until=None) -> Iterator[Dict]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_messages_in_conversation(self, conversation_id: str) -> Dict[str, str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_all_untagged_messages_in_conversation(self, conversation_id: str) -> Dict[str, str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    async def run_in_executor(self, func, *args, **kwargs):
+        """
+        Runs a blocking storage call off the event loop, keeping the caller's context (turn id).
+        """
+        raise NotImplementedError
+
+    def stats(self) -> dict:
+        return {}
+
+    def close(self):
+        pass
+
+class PostgresStorage(StorageBackend):
+    """
+    The PostgreSQL backend: a thin adapter over db_utils and its connection pool.
+    """
+
+    name = "postgres"
+
+    def __init__(self):
+        from reverie import db_utils
+        from reverie.db_pool import pool_config_from_env
+        self.db = db_utils
+        config = pool_config_from_env()
+        self.location = f"{config['host']}:{config['port']}/{config['dbname']}"
+
+    def insert_into_table(self, table_name, data, returning=None):
+        return self.db.insert_into_table(table_name, data, returning)
+
+    def create_conversation(self, conversation_data, system_message):
+        return self.db.create_conversation(conversation_data, system_message)
+
+    def insert_many_into_table(self, table_name, rows, page_size=500):
+        return self.db.insert_many_into_table(table_name, rows, page_size)
+
+    def update_table_column_by_id(self, table_name, column_name, id_column, record_id, value):
+        return self.db.update_table_column_by_id(table_name, column_name, id_column, record_id, value)
+
+    def bulk_update_table_column_by_id(self, table_name, column_name, id_column, values, id_cast=None,
+                                       value_cast=None, page_size=500):
+        return self.db.bulk_update_table_column_by_id(table_name, column_name, id_column, values, id_cast,
+                                                      value_cast, page_size)
+
+    def apply_conversation_stats(self, rows, page_size=500):
+        return self.db.apply_conversation_stats(rows, page_size)
+
+    def get_conversation_stats(self, conversation_id):
+        return self.db.get_conversation_stats(conversation_id)
+
+    def recompute_conversation_stats(self, conversation_id):
+        return self.db.recompute_conversation_stats(conversation_id)
+
+    def get_first_conversation_id(self):
+        return self.db.get_first_conversation_id()
+
+    def get_latest_conversation_id(self):
+        return self.db.get_latest_conversation_id()
+
+    def get_untagged_conversation_ids(self):
+        return self.db.get_untagged_conversation_ids()
+
+    def get_unsummarized_closed_conversation_ids(self, closed_before):
+        return self.db.get_unsummarized_closed_conversation_ids(closed_before)
+
+    def get_conversation_messages(self, conversation_id):
+        return self.db.get_conversation_messages(conversation_id)
+
+    def get_recent_messages(self, num_messages=100):
+        return self.db.get_recent_messages(num_messages)
+
+    def get_latest_conversation_for_interface(self, interface):
+        return self.db.get_latest_conversation_for_interface(interface)
+
+    def get_recent_conversation_messages(self, conversation_id, token_budget, page_size=50):
+        return self.db.get_recent_conversation_messages(conversation_id, token_budget, page_size)
+
+    def iter_all_messages(self, batch_size=10_000, since=None, until=None):
+        return self.db.iter_all_messages(batch_size, since, until)
+
+    def get_all_messages_in_conversation(self, conversation_id):
+        return self.db.get_all_messages_in_conversation(conversation_id)
+
+    def get_all_untagged_messages_in_conversation(self, conversation_id):
+        return self.db.get_all_untagged_messages_in_conversation(conversation_id)
+
+    async def run_in_executor(self, func, *args, **kwargs):
+        return await self.db.run_in_db_executor(func, *args, **kwargs)
+
+    def stats(self):
+        return self.db.pool_stats()
+
+    def close(self):
+        self.db.close_connection_pool()
+
+# The PostgreSQL schema (schema.py, version 1 and 2) translated to SQLite: uuids are
+# generated in Python and stored as text, timestamps as UTC ISO 8601 text (which sorts
+# chronologically), and jsonb columns as JSON text.
+SQLITE_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS conversations (
+        conversation_id TEXT PRIMARY KEY,
+        user_id TEXT NOT NULL,
+        interface TEXT,
+        start_time TEXT NOT NULL,
+        end_time TEXT,
+        duration_seconds REAL,
+        message_count INTEGER NOT NULL DEFAULT 0,
+        summary TEXT,
+        tags TEXT,
+        token_usage_user INTEGER NOT NULL DEFAULT 0,
+        token_usage_assistant INTEGER NOT NULL DEFAULT 0,
+        token_usage_total INTEGER NOT NULL DEFAULT 0,
+        model_version TEXT
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS messages (
+        message_id TEXT PRIMARY KEY,
+        conversation_id TEXT NOT NULL REFERENCES conversations (conversation_id) ON DELETE CASCADE,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        timestamp TEXT NOT NULL,
+        token_count INTEGER,
+        sentiment_score REAL,
+        custom_metrics TEXT,
+        tags TEXT
+    )
+    """,
+    "DROP INDEX IF EXISTS messages_conversation_timestamp_idx",
+    "CREATE INDEX IF NOT EXISTS messages_conversation_timestamp_id_idx ON messages (conversation_id, timestamp, message_id)",
+    "CREATE INDEX IF NOT EXISTS messages_untagged_idx ON messages (conversation_id, timestamp) "
+    "WHERE tags IS NULL OR tags = '[]'",
+    "CREATE INDEX IF NOT EXISTS messages_non_system_timestamp_idx ON messages (timestamp) WHERE role <> 'system'",
+    "CREATE INDEX IF NOT EXISTS conversations_start_time_idx ON conversations (start_time)",
+    "CREATE INDEX IF NOT EXISTS conversations_interface_start_time_idx ON conversations (interface, start_time)",
+    "DROP INDEX IF EXISTS conversations_untagged_idx",
+]
+
+ID_COLUMNS = {"conversations": "conversation_id", "messages": "message_id"}
+
+def sqlite_value(value):
+    """
+    A Python value as SQLite stores it: timestamps as UTC ISO 8601 text, dicts and lists as JSON.
+    """
+    if isinstance(value, datetime):
+        return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+class SQLiteStorage(StorageBackend):
+    """
+    An embedded SQLite database in WAL mode. One connection serves every thread, with
+    calls serialized by a lock (SQLite has a single writer anyway), so the statement
+    cache of that connection holds every query: each SQL string below is prepared once
+    and reused. Multi-row writes run in one transaction; with synchronous=NORMAL a
+    commit appends to the WAL without waiting for an fsync.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: str = DB_PATH, busy_timeout_ms: int = 5000):
+        self.path = path
+        self.location = os.path.abspath(path)
+        self.connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False, cached_statements=256)
+        self.connection.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.execute("PRAGMA foreign_keys = ON")
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reverie-sqlite")
+        with self.transaction() as cursor:
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+
+    @contextmanager
+    def transaction(self):
+        """
+        with storage.transaction() as cursor: ... — one BEGIN IMMEDIATE ... COMMIT, rolled back if the block raises.
+        """
+        with self._lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+                cursor.execute("COMMIT")
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            finally:
+                cursor.close()
+
+    def _query(self, query: str, params=()) -> list:
+        with self._lock:
+            return self.connection.execute(query, params).fetchall()
+
+    def _with_id(self, table_name: str, data: dict) -> dict:
+        id_column = ID_COLUMNS.get(table_name.lower())
+        if id_column and data.get(id_column) is None:
+            data = dict(data, **{id_column: str(uuid.uuid4())})
+        return data
+
+    @traced("db.insert_into_table")
+    def insert_into_table(self, table_name, data, returning=None):
+        data = self._with_id(table_name, data)
+        query = f"INSERT INTO {table_name} ({', '.join(data)}) VALUES ({', '.join('?' for _ in data)})"
+        if returning:
+            query += f" RETURNING {returning}"
+        try:
+            rows = self._query(query, [sqlite_value(value) for value in data.values()])
+            return rows[0][0] if returning else None
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+
+    @traced("db.create_conversation")
+    def create_conversation(self, conversation_data, system_message):
+        conversation_data = self._with_id("conversations", conversation_data)
+        conversation_id = conversation_data["conversation_id"]
+        message_data = self._with_id("messages", dict(system_message, conversation_id=conversation_id))
+        try:
+            with self.transaction() as cursor:
+                for table_name, data in (("conversations", conversation_data), ("messages", message_data)):
+                    cursor.execute(f"INSERT INTO {table_name} ({', '.join(data)}) VALUES ({', '.join('?' for _ in data)})",
+                                   [sqlite_value(value) for value in data.values()])
+            return conversation_id
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+
+    @traced("db.insert_many_into_table")
+    def insert_many_into_table(self, table_name, rows, page_size=500):
+        if not rows:
+            return
+        rows = [self._with_id(table_name, row) for row in rows]
+        keys = list(rows[0].keys())
+        query = f"INSERT INTO {table_name} ({', '.join(keys)}) VALUES ({', '.join('?' for _ in keys)})"
+        try:
+            with self.transaction() as cursor:
+                cursor.executemany(query, ([sqlite_value(row[key]) for key in keys] for row in rows))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            raise
+
+    def update_table_column_by_id(self, table_name, column_name, id_column, record_id, value):
+        try:
+            self._query(f"UPDATE {table_name} SET {column_name} = ? WHERE {id_column} = ?",
+                        (sqlite_value(value), sqlite_value(record_id)))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
+    @traced("db.bulk_update_table_column_by_id")
+    def bulk_update_table_column_by_id(self, table_name, column_name, id_column, values, id_cast=None,
+                                       value_cast=None, page_size=500):
+        # The casts only matter to PostgreSQL; ids and JSON are plain text here
+        if not values:
+            return
+        try:
+            with self.transaction() as cursor:
+                cursor.executemany(f"UPDATE {table_name} SET {column_name} = ? WHERE {id_column} = ?",
+                                   ((sqlite_value(value), sqlite_value(record_id)) for record_id, value in values.items()))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            raise
+
+    @traced("db.apply_conversation_stats")
+    def apply_conversation_stats(self, rows, page_size=500):
+        if not rows:
+            return
+        query = (
+            "UPDATE conversations SET "
+            "message_count = message_count + ?2, "
+            "token_usage_user = token_usage_user + ?3, "
+            "token_usage_assistant = token_usage_assistant + ?4, "
+            "token_usage_total = token_usage_total + ?5, "
+            "end_time = COALESCE(?6, end_time), "
+            "duration_seconds = COALESCE((julianday(?6) - julianday(start_time)) * 86400.0, duration_seconds) "
+            "WHERE conversation_id = ?1"
+        )
+        try:
+            with self.transaction() as cursor:
+                cursor.executemany(query, ((sqlite_value(conversation_id), messages, user_tokens, assistant_tokens,
+                                            total_tokens, sqlite_value(end_time))
+                                           for conversation_id, messages, user_tokens, assistant_tokens, total_tokens,
+                                           end_time in rows))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            raise
+
+    def get_conversation_stats(self, conversation_id):
+        try:
+            rows = self._query(f"SELECT {', '.join(STATS_COLUMNS)} FROM conversations WHERE conversation_id = ?",
+                               (conversation_id,))
+            return dict(zip(STATS_COLUMNS, rows[0])) if rows else None
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+
+    def recompute_conversation_stats(self, conversation_id):
+        try:
+            rows = self._query(
+                "SELECT COUNT(*), "
+                "COALESCE(SUM(token_count) FILTER (WHERE role = 'user'), 0), "
+                "COALESCE(SUM(token_count) FILTER (WHERE role = 'assistant'), 0), "
+                "COALESCE(SUM(token_count), 0) "
+                "FROM messages WHERE conversation_id = ?",
+                (conversation_id,)
+            )
+            return dict(zip(STATS_COLUMNS, rows[0]))
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+
+    def _first_column(self, query: str, params=()) -> list:
+        try:
+            return [row[0] for row in self._query(query, params)]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+
+    def get_first_conversation_id(self):
+        ids = self._first_column("SELECT conversation_id FROM conversations ORDER BY start_time ASC LIMIT 1")
+        return ids[0] if ids else None
+
+    def get_latest_conversation_id(self):
+        ids = self._first_column("SELECT conversation_id FROM conversations ORDER BY start_time DESC LIMIT 1")
+        return ids[0] if ids else None
+
+    def get_untagged_conversation_ids(self):
+        return self._first_column("SELECT conversation_id FROM conversations WHERE conversation_id IN "
+                                  "(SELECT conversation_id FROM messages WHERE tags IS NULL OR tags = '[]') "
+                                  "ORDER BY start_time ASC")
+
+    def get_unsummarized_closed_conversation_ids(self, closed_before):
+        return self._first_column(
+            "SELECT conversation_id FROM conversations WHERE summary IS NULL "
+            "AND (end_time IS NOT NULL OR start_time < ?) ORDER BY start_time ASC",
+            (sqlite_value(closed_before),)
+        )
+
+    def get_conversation_messages(self, conversation_id):
+        try:
+            rows = self._query("SELECT role, content, token_count FROM messages WHERE conversation_id = ? "
+                               "AND role != 'system' ORDER BY timestamp ASC", (conversation_id,))
+            return [{"role": role, "content": content, "token_count": token_count} for role, content, token_count in rows]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+
+    @traced("db.get_recent_messages")
+    def get_recent_messages(self, num_messages=100):
+        try:
+            rows = self._query("SELECT role, content FROM messages WHERE role != 'system' ORDER BY timestamp DESC LIMIT ?",
+                               (num_messages,))
+            return [{"role": role, "content": content} for role, content in reversed(rows)]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return []
+
+    @traced("db.get_latest_conversation_for_interface")
+    def get_latest_conversation_for_interface(self, interface):
+        try:
+            rows = self._query("SELECT conversation_id, summary FROM conversations WHERE interface = ? "
+                               "ORDER BY start_time DESC LIMIT 1", (interface,))
+            return rows[0] if rows else None
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return None
+
+    @traced("db.get_recent_conversation_messages")
+    def get_recent_conversation_messages(self, conversation_id, token_budget, page_size=50):
+        messages = []
+        tokens = 0
+        before = (None, None)
+        try:
+            while True:
+                page = self._query(
+                    "SELECT role, content, token_count, timestamp, message_id FROM messages "
+                    "WHERE conversation_id = ?1 AND role != 'system' "
+                    "AND (?2 IS NULL OR (timestamp, message_id) < (?2, ?3)) "
+                    "ORDER BY timestamp DESC, message_id DESC LIMIT ?4",
+                    (conversation_id, *before, page_size)
+                )
+                for role, content, token_count, timestamp, message_id in page:
+                    tokens += token_count or 0
+                    if tokens > token_budget and messages:
+                        return messages
+                    messages.append({"role": role, "content": content, "token_count": token_count})
+                if len(page) < page_size:
+                    return messages
+                before = page[-1][3:]
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return messages
+
+    def iter_all_messages(self, batch_size=10_000, since=None, until=None):
+        # Keyset pages rather than one open cursor, so writers on other threads aren't held up meanwhile
+        after = (sqlite_value(since) if since else "", "")  # Every id sorts after "", so rows at `since` are included
+        until = sqlite_value(until) if until else None
+        try:
+            while True:
+                page = self._query(
+                    "SELECT conversation_id, role, content, timestamp, message_id FROM messages "
+                    "WHERE role != 'system' AND (timestamp, message_id) > (?1, ?2) AND (?3 IS NULL OR timestamp < ?3) "
+                    "ORDER BY timestamp ASC, message_id ASC LIMIT ?4",
+                    (after[0], after[1], until, batch_size)
+                )
+                for conversation_id, role, content, timestamp, message_id in page:
+                    yield {"conversation_id": conversation_id, "role": role, "content": content,
+                           "timestamp": timestamp, "message_id": message_id}
+                if len(page) < batch_size:
+                    return
+                after = (page[-1][3], page[-1][4])
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+
+    def get_all_messages_in_conversation(self, conversation_id):
+        try:
+            rows = self._query("SELECT message_id, content FROM messages WHERE conversation_id = ? ORDER BY timestamp ASC",
+                               (conversation_id,))
+            return dict(rows)
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return {}
+
+    def get_all_untagged_messages_in_conversation(self, conversation_id):
+        try:
+            rows = self._query("SELECT message_id, content FROM messages WHERE conversation_id = ? "
+                               "AND (tags IS NULL OR tags = '[]') ORDER BY timestamp ASC", (conversation_id,))
+            return dict(rows)
+        except sqlite3.Error as e:
+            print(f"Database error: {e}")
+            return {}
+
+    async def run_in_executor(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(self._executor, functools.partial(context.run, func, *args, **kwargs))
+
+    def stats(self):
+        with self._lock:
+            page_count = self.connection.execute("PRAGMA page_count").fetchone()[0]
+            page_size = self.connection.execute("PRAGMA page_size").fetchone()[0]
+            journal_mode = self.connection.execute("PRAGMA journal_mode").fetchone()[0]
+        return {"path": self.path, "size_bytes": page_count * page_size, "journal_mode": journal_mode}
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        with self._lock:
+            self.connection.close()
+
+BACKENDS = {"postgres": PostgresStorage, "sqlite": SQLiteStorage}
+
+def get_storage() -> StorageBackend:
+    global storage
+    if storage is None:
+        with _storage_lock:
+            if storage is None:
+                if DB_BACKEND not in BACKENDS:
+                    raise ValueError(f"Unknown REVERIE_DB_BACKEND {DB_BACKEND!r}; expected one of {sorted(BACKENDS)}")
+                storage = BACKENDS[DB_BACKEND]()
+    return storage
+
+def close_storage():
+    global storage
+    if storage is None:
+        return
+    try:
+        storage.close()
+        storage = None
+    except Exception as e:
+        print(f"Error closing storage: {e}")
+        raise
+
+async def run_in_storage_executor(func, *args, **kwargs):
+    """
+    Runs a blocking storage call (or a function making several) without blocking the event loop.
+    """
+    return await get_storage().run_in_executor(func, *args, **kwargs)
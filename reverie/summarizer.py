@@ -0,0 +1,127 @@
+# reverie/summarizer.py
+
+import argparse
+import os
+from concurrent.futures import Executor, Future
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from reverie.context_window import ContextWindow
+from reverie.storage import close_storage, get_storage, run_in_storage_executor
+from reverie.gpt_utils import count_tokens, query_gpt_for_summary, query_gpt_for_summary_async
+
+# Fold evicted turns into the summary once this many tokens have fallen out of the window
+SUMMARY_THRESHOLD_TOKENS = int(os.getenv("REVERIE_SUMMARY_THRESHOLD_TOKENS", "1500"))
+# Largest slice of transcript folded into the summary by a single request in the batch job
+SUMMARY_CHUNK_TOKENS = 3000
+
+
+def update_rolling_summary(conversation_id: str, window: ContextWindow, threshold: int = SUMMARY_THRESHOLD_TOKENS) -> bool:
+    """
+    Folds the turns that have fallen out of `window` into its rolling summary once they
+    add up to `threshold` tokens, and stores the result in Conversations.summary.
+    Returns True if the summary was updated.
+    """
+    if window.evicted_tokens < threshold:
+        return False
+
+    turns = window.evicted_messages()
+    summary = query_gpt_for_summary(window.summary, turns)
+    if not summary:
+        return False  # Keep the evicted turns and try again after the next turn
+
+    window.clear_evicted(len(turns))
+    window.set_summary(summary, count_tokens(summary))
+    get_storage().update_table_column_by_id("Conversations", "summary", "conversation_id", conversation_id, summary)
+    return True
+
+async def update_rolling_summary_async(conversation_id: str, window: ContextWindow, threshold: int = SUMMARY_THRESHOLD_TOKENS) -> bool:
+    """
+    Async variant of update_rolling_summary. The window is only touched on the event loop,
+    and concurrent calls for the same window are skipped while one is in progress.
+    """
+    if window.evicted_tokens < threshold or window.summarizing:
+        return False
+
+    window.summarizing = True
+    try:
+        turns = window.evicted_messages()
+        summary = await query_gpt_for_summary_async(window.summary, turns)
+        if not summary:
+            return False
+
+        window.clear_evicted(len(turns))
+        window.set_summary(summary, count_tokens(summary))
+        await run_in_storage_executor(get_storage().update_table_column_by_id, "Conversations", "summary",
+                                      "conversation_id", conversation_id, summary)
+        return True
+    finally:
+        window.summarizing = False
+
+def update_rolling_summary_in_background(conversation_id: str, window: ContextWindow, executor: Executor,
+                                         threshold: int = SUMMARY_THRESHOLD_TOKENS) -> Optional[Future]:
+    """
+    Runs update_rolling_summary on `executor`, so the next turn doesn't wait for the summary
+    request. Returns its Future, or None if there is nothing to fold in yet or an update
+    for this window is still running. Call from the thread that drives the conversation.
+    """
+    if window.evicted_tokens < threshold or window.summarizing:
+        return None
+
+    window.summarizing = True
+
+    def update():
+        try:
+            return update_rolling_summary(conversation_id, window, threshold)
+        finally:
+            window.summarizing = False
+
+    return executor.submit(update)
+
+def summarize_conversation(conversation_id: str, chunk_tokens: int = SUMMARY_CHUNK_TOKENS) -> str:
+    """
+    Builds a summary for a whole stored conversation by folding it in chunks of
+    at most `chunk_tokens` tokens, so long conversations never exceed the context limit.
+    """
+    summary, chunk, chunk_size = None, [], 0
+    for message in get_storage().get_conversation_messages(conversation_id):
+        chunk.append({"role": message["role"], "content": message["content"]})
+        chunk_size += message["token_count"] or 0
+        if chunk_size >= chunk_tokens:
+            summary = query_gpt_for_summary(summary, chunk, raise_errors=True)
+            chunk, chunk_size = [], 0
+    if chunk:
+        summary = query_gpt_for_summary(summary, chunk, raise_errors=True)
+    return summary
+
+def summarize_closed_conversations(idle_hours: float = 24, chunk_tokens: int = SUMMARY_CHUNK_TOKENS):
+    """
+    Summarizes every closed conversation that has no summary yet. Each summary is stored as
+    soon as it is built, and only unsummarized conversations are selected, so the job can be
+    interrupted and rerun without repeating work.
+    """
+    closed_before = datetime.now(timezone.utc) - timedelta(hours=idle_hours)
+    conversation_ids = get_storage().get_unsummarized_closed_conversation_ids(closed_before)
+    print(f"Summarizing {len(conversation_ids)} conversations.")
+
+    for index, conversation_id in enumerate(conversation_ids, start=1):
+        try:
+            summary = summarize_conversation(conversation_id, chunk_tokens)
+        except Exception as e:
+            print(f"Error summarizing conversation {conversation_id}: {e}")
+            continue
+        # Conversations without messages get an empty summary so they are not selected again
+        get_storage().update_table_column_by_id("Conversations", "summary", "conversation_id", conversation_id,
+                                                summary or "")
+        print(f"[{index}/{len(conversation_ids)}] Summarized conversation {conversation_id}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarize closed conversations that have no summary yet.")
+    parser.add_argument("--idle-hours", type=float, default=24,
+                        help="Treat conversations started more than this many hours ago as closed")
+    parser.add_argument("--chunk-tokens", type=int, default=SUMMARY_CHUNK_TOKENS,
+                        help="Maximum transcript tokens folded into the summary per request")
+    args = parser.parse_args()
+
+    summarize_closed_conversations(args.idle_hours, args.chunk_tokens)
+    close_storage()
@@ -0,0 +1,117 @@
+# reverie/synthetic_audio.py
+"""
+Synthetic audio for tests and benchmarks: WAV fixtures, crude voiced speech with a
+made-up wake phrase, and long noisy sessions for the VAD. Deterministic for a given
+NumPy random generator, so results can be compared between runs.
+"""
+
+import os
+import wave
+
+import numpy as np
+
+
+def read_wav_frames(path: str, frame_ms: int = 10):
+    """
+    Reads a 16-bit WAV fixture and splits it into `frame_ms` chunks, the way voice.py
+    receives audio from the microphone. Returns (frames, sample_rate, channels).
+    """
+    with wave.open(path, "rb") as wav:
+        sample_rate, channels = wav.getframerate(), wav.getnchannels()
+        data = wav.readframes(wav.getnframes())
+    frame_bytes = sample_rate * frame_ms // 1000 * channels * 2
+    return [data[i:i + frame_bytes] for i in range(0, len(data), frame_bytes)], sample_rate, channels
+
+def write_wav(path: str, samples: bytes, sample_rate: int = 16000):
+    """
+    Writes 16-bit mono samples as a WAV file.
+    """
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples)
+
+def write_synthetic_wav_fixtures(directory: str, count: int = 20, sample_rate: int = 16000):
+    """
+    Writes `count` speech-length (1–4s) WAV files of tone plus noise into `directory`,
+    for when no recorded fixtures are available.
+    """
+    rng = np.random.default_rng(0)
+    for n in range(count):
+        seconds = rng.uniform(1.0, 4.0)
+        t = np.arange(int(sample_rate * seconds)) / sample_rate
+        signal = 0.3 * np.sin(2 * np.pi * rng.uniform(100, 300) * t) + 0.05 * rng.standard_normal(len(t))
+        samples = (signal * 32767).astype("<i2").tobytes()
+        write_wav(os.path.join(directory, f"fixture_{n:02d}.wav"), samples, sample_rate)
+
+# (F1, F2) formant pairs for a handful of vowel-like sounds
+SYNTHETIC_VOWELS = [(730, 1090), (270, 2290), (530, 1840), (570, 840), (300, 870), (660, 1720), (440, 1020), (490, 1350)]
+SYNTHETIC_WAKE_PHRASE = [(2, 120), (4, 160), (1, 110), (5, 140), (1, 200)]  # (vowel, milliseconds)
+
+def synthetic_speech(syllables, rng, sample_rate: int = 16000, stretch: float = 1.0, noise: float = 0.02):
+    """
+    Crude voiced speech: each (vowel, milliseconds) syllable is a harmonic tone shaped by
+    that vowel's formants, with a smooth envelope, some pitch jitter and background noise.
+    Returns 16-bit samples as a NumPy array.
+    """
+    pieces = [np.zeros(int(sample_rate * rng.uniform(0.05, 0.2)))]
+    f0 = rng.uniform(110, 190)
+    for vowel, milliseconds in syllables:
+        t = np.arange(int(sample_rate * milliseconds * stretch / 1000)) / sample_rate
+        f0 *= rng.uniform(0.95, 1.05)
+        harmonics = np.arange(1, int(4000 // f0)) * f0
+        weights = sum(np.exp(-((harmonics - formant) / 120) ** 2) for formant in SYNTHETIC_VOWELS[vowel])
+        tone = (weights[:, None] * np.sin(2 * np.pi * harmonics[:, None] * t)).sum(axis=0)
+        pieces.append(tone * np.hanning(len(t)) ** 0.5)
+    pieces.append(np.zeros(int(sample_rate * rng.uniform(0.05, 0.2))))
+    signal = np.concatenate(pieces)
+    signal = 0.5 * signal / np.abs(signal).max() + noise * rng.standard_normal(len(signal))
+    return (np.clip(signal, -1, 1) * 32767 * rng.uniform(0.3, 1.0)).astype("<i2")
+
+def write_synthetic_wake_fixtures(directory: str, templates: int = 3, positives: int = 100, negatives: int = 400,
+                                  sample_rate: int = 16000):
+    """
+    Writes templates/, positive/ and negative/ WAV clips: the synthetic wake phrase spoken at
+    varying speed, pitch and loudness, and other syllable sequences, some sharing its start.
+    """
+    rng = np.random.default_rng(0)
+    for name, count in (("templates", templates), ("positive", positives), ("negative", negatives)):
+        os.makedirs(os.path.join(directory, name), exist_ok=True)
+        for n in range(count):
+            if name == "negative":
+                syllables = [(int(rng.integers(len(SYNTHETIC_VOWELS))), int(rng.integers(100, 200)))
+                             for _ in range(rng.integers(3, 8))]
+                if n % 4 == 0:
+                    syllables = SYNTHETIC_WAKE_PHRASE[:2] + syllables  # Starts like the wake phrase
+            else:
+                syllables = SYNTHETIC_WAKE_PHRASE
+                if name == "positive" and n % 2:
+                    syllables = syllables + [(int(rng.integers(len(SYNTHETIC_VOWELS))), 150) for _ in range(4)]
+            samples = synthetic_speech(syllables, rng, sample_rate, stretch=rng.uniform(0.85, 1.15),
+                                       noise=rng.uniform(0.005, 0.05))
+            write_wav(os.path.join(directory, name, f"{name}_{n:03d}.wav"), samples.tobytes(), sample_rate)
+
+def synthetic_session(minutes: float, rng, sample_rate: int = 16000):
+    """
+    A long recording of background noise with utterances at random intervals, each
+    opening with a soft unvoiced sound (too quiet for the VAD) before the voiced part,
+    plus one 45-second monologue. Returns (16-bit samples, [(onset, end) in samples]).
+    """
+    pieces, utterances, position = [], [], 0
+    monologue_at = minutes * 60 / 2
+    while position < minutes * 60 * sample_rate:
+        gap = rng.normal(0, 0.003, int(sample_rate * rng.uniform(1.0, 4.0)))
+        syllables = [(int(rng.integers(len(SYNTHETIC_VOWELS))), int(rng.integers(100, 250)))
+                     for _ in range(rng.integers(4, 15))]
+        if position >= monologue_at * sample_rate:
+            syllables, monologue_at = syllables * (45_000 // sum(ms for _, ms in syllables) + 1), float("inf")
+        onset = rng.normal(0, 0.012, int(sample_rate * 0.08))
+        voiced = synthetic_speech(syllables, rng, sample_rate, noise=0.003).astype(np.float64) / 32767
+        voiced = voiced[np.argmax(np.abs(voiced) > 0.05):]  # The soft onset runs straight into the voiced part
+        pieces += [gap, onset, voiced]
+        start = position + len(gap)
+        position = start + len(onset) + len(voiced)
+        utterances.append((start, position))
+    samples = np.concatenate(pieces)
+    return (np.clip(samples, -1, 1) * 32767).astype("<i2"), utterances
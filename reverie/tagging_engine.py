@@ -0,0 +1,257 @@
+# reverie/tagging_engine.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from reverie.cache_utils import PersistentLRUCache
+from reverie.gpt_utils import (
+    TAG_MAX_TOKENS, batch_tags_prompt, count_tokens, message_tags_cache_key, query_gpt_for_batch_tags,
+    query_gpt_for_message_tags
+)
+
+BATCH_MESSAGE_OVERHEAD_TOKENS = 8  # JSON key, quotes and separators around each message in a batch prompt
+
+
+def pack_tag_batches(
+    messages: Dict[str, str],
+    token_budget: int,
+    max_batch_size: int = 50,
+    count_tokens: Callable[[str], int] = count_tokens
+) -> List[Dict[str, str]]:
+    """
+    Greedily splits {message_id: content} into batches whose prompt plus expected
+    response fits in `token_budget` tokens. A message too large for the budget on
+    its own still gets a batch of one.
+    """
+    base_tokens = sum(count_tokens(message["content"]) for message in batch_tags_prompt({}))
+    batches = []
+    current, current_tokens = {}, base_tokens
+    for message_id, content in messages.items():
+        message_tokens = count_tokens(content) + BATCH_MESSAGE_OVERHEAD_TOKENS + TAG_MAX_TOKENS
+        if current and (current_tokens + message_tokens > token_budget or len(current) >= max_batch_size):
+            batches.append(current)
+            current, current_tokens = {}, base_tokens
+        current[message_id] = content
+        current_tokens += message_tokens
+    if current:
+        batches.append(current)
+    return batches
+
+
+class TaggingProgress:
+    """
+    Thread-safe counters for a tagging run, printed as a progress/throughput line.
+    """
+
+    def __init__(self, report_interval: float = 10.0):
+        self.report_interval = report_interval
+        self.messages_tagged = 0
+        self.messages_failed = 0
+        self.messages_cached = 0
+        self.requests_sent = 0
+        self.conversations_written = 0
+        self.conversations_failed = 0
+        self.start_time = time.monotonic()
+        self._last_report = self.start_time
+        self._lock = threading.Lock()
+
+    def record_messages(self, count: int, failed: bool):
+        with self._lock:
+            if failed:
+                self.messages_failed += count
+            else:
+                self.messages_tagged += count
+
+    def record_cached(self, count: int):
+        with self._lock:
+            self.messages_cached += count
+
+    def record_request(self):
+        with self._lock:
+            self.requests_sent += 1
+
+    def record_conversation(self, failed: bool):
+        with self._lock:
+            if failed:
+                self.conversations_failed += 1
+            else:
+                self.conversations_written += 1
+
+    def maybe_report(self):
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_report < self.report_interval:
+                return
+            self._last_report = now
+        self.report()
+
+    def messages_per_second(self) -> float:
+        elapsed = time.monotonic() - self.start_time
+        messages = self.messages_tagged + self.messages_failed + self.messages_cached
+        return messages / elapsed if elapsed > 0 else 0.0
+
+    def report(self):
+        elapsed = time.monotonic() - self.start_time
+        print(f"Tagged {self.messages_tagged} messages ({self.messages_failed} failed, {self.messages_cached} cached) in "
+              f"{self.conversations_written} conversations ({self.conversations_failed} failed) "
+              f"with {self.requests_sent} requests after {elapsed:.1f}s — {self.messages_per_second():.1f} msg/s")
+
+class _ConversationBatch:
+    """
+    Collects the tags for one conversation until every message has finished.
+    """
+
+    def __init__(self, conversation_id: str, message_count: int):
+        self.conversation_id = conversation_id
+        self.remaining = message_count
+        self.tags_by_message_id: Dict[str, List[str]] = {}
+        self.lock = threading.Lock()
+
+    def add(self, tags_by_message_id: Dict[str, List[str]]) -> bool:
+        """
+        Records tags for some messages and returns True once the whole conversation is done.
+        """
+        with self.lock:
+            self.tags_by_message_id.update(tags_by_message_id)
+            self.remaining -= len(tags_by_message_id)
+            return self.remaining == 0
+
+class TaggingEngine:
+    """
+    Tags messages with a bounded pool of worker threads.
+
+    Requests go through the shared gpt_utils scheduler on its batch lane, which keeps the
+    run under the OpenAI quota regardless of `concurrency`, leaves headroom for interactive
+    turns and retries 429s. Tags are handed to `write_tags(conversation_id, tags_by_message_id)`
+    once per conversation so they can be stored with a single bulk UPDATE.
+
+    With `batch_token_budget` set, each conversation's messages are packed into batches
+    that fit the budget and tagged with one request per batch; a batch whose response
+    can't be parsed is split in half and retried.
+
+    With a `cache`, messages whose normalized content has been tagged before are
+    answered from it without an API call, and new results are added to it.
+    """
+
+    def __init__(
+        self,
+        write_tags: Callable[[str, Dict[str, List[str]]], None],
+        concurrency: int = 8,
+        report_interval: float = 10.0,
+        batch_token_budget: int = None,
+        max_batch_size: int = 50,
+        count_tokens: Callable[[str], int] = count_tokens,
+        tag_message: Callable[[str], Dict] = None,
+        tag_batch: Callable[[Dict[str, str]], Dict[str, List[str]]] = None,
+        cache: PersistentLRUCache = None
+    ):
+        self.write_tags = write_tags
+        self.concurrency = concurrency
+        self.progress = TaggingProgress(report_interval)
+        self.batch_token_budget = batch_token_budget
+        self.max_batch_size = max_batch_size
+        self.count_tokens = count_tokens
+        self.tag_message = tag_message or (lambda content: query_gpt_for_message_tags(content, raise_errors=True))
+        self.tag_batch = tag_batch or (lambda messages: query_gpt_for_batch_tags(messages, raise_errors=True))
+        self.cache = cache
+        self._slots = threading.BoundedSemaphore(concurrency * 2)  # Caps work units queued ahead of the workers
+
+    def _tag(self, content: str) -> List[str]:
+        self.progress.record_request()
+        tags = self.tag_message(content)["tags"]
+        if self.cache is not None:
+            self.cache.set(message_tags_cache_key(content, prompt="message"), tags)
+        return tags
+
+    def _tag_batch(self, messages: Dict[str, str]) -> Dict[str, List[str]]:
+        self.progress.record_request()
+        tags_by_message_id = self.tag_batch(messages)
+        if self.cache is not None:
+            for message_id, tags in tags_by_message_id.items():
+                self.cache.set(message_tags_cache_key(messages[message_id], prompt="batch"), tags)
+        return tags_by_message_id
+
+    def _tag_batch_with_split(self, messages: Dict[str, str]) -> Dict[str, List[str]]:
+        if len(messages) == 1:
+            message_id, content = next(iter(messages.items()))
+            return {message_id: self._tag(content)}
+
+        try:
+            return self._tag_batch(messages)
+        except ValueError as e:
+            print(f"Splitting batch of {len(messages)} messages after an unusable response: {e}")
+            items = list(messages.items())
+            middle = len(items) // 2
+            tags_by_message_id = self._tag_batch_with_split(dict(items[:middle]))
+            tags_by_message_id.update(self._tag_batch_with_split(dict(items[middle:])))
+            return tags_by_message_id
+
+    def _tag_unit(self, batch: _ConversationBatch, messages: Dict[str, str]):
+        try:
+            tags_by_message_id = self._tag_batch_with_split(messages)
+            self.progress.record_messages(len(messages), failed=False)
+        except Exception as e:
+            print(f"Error generating tags for messages {', '.join(map(str, messages))}: {e}")
+            tags_by_message_id = {message_id: [] for message_id in messages}
+            self.progress.record_messages(len(messages), failed=True)
+        finally:
+            self._slots.release()
+
+        if batch.add(tags_by_message_id):
+            self._write_conversation(batch)
+        self.progress.maybe_report()
+
+    def _split_cached(self, messages: Dict[str, str]):
+        """
+        Returns ({message_id: cached tags}, {message_id: content still to tag}). Only tags
+        from the prompt this engine uses (batch or single message) count.
+        """
+        if self.cache is None:
+            return {}, messages
+        prompt = "message" if self.batch_token_budget is None else "batch"
+        cached, uncached = {}, {}
+        for message_id, content in messages.items():
+            tags = self.cache.get(message_tags_cache_key(content, prompt=prompt))
+            if tags is None:
+                uncached[message_id] = content
+            else:
+                cached[message_id] = tags
+        return cached, uncached
+
+    def _work_units(self, messages: Dict[str, str]) -> List[Dict[str, str]]:
+        if self.batch_token_budget is None:
+            return [{message_id: content} for message_id, content in messages.items()]
+        return pack_tag_batches(messages, self.batch_token_budget, self.max_batch_size, self.count_tokens)
+
+    def _write_conversation(self, batch: _ConversationBatch):
+        try:
+            self.write_tags(batch.conversation_id, batch.tags_by_message_id)
+            self.progress.record_conversation(failed=False)
+        except Exception as e:
+            print(f"Error writing tags for conversation {batch.conversation_id}: {e}")
+            self.progress.record_conversation(failed=True)
+
+    def run(self, conversations: Iterable[Tuple[str, Dict[str, str]]]) -> TaggingProgress:
+        """
+        Tags every message of every (conversation_id, {message_id: content}) pair.
+        Conversations are consumed lazily, so a generator keeps memory bounded.
+        """
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="tagger") as executor:
+            for conversation_id, messages in conversations:
+                if not messages:
+                    continue
+                batch = _ConversationBatch(conversation_id, len(messages))
+                cached, uncached = self._split_cached(messages)
+                if cached:
+                    self.progress.record_cached(len(cached))
+                    if batch.add(cached):
+                        self._write_conversation(batch)
+                        continue
+                for unit in self._work_units(uncached):
+                    self._slots.acquire()
+                    executor.submit(self._tag_unit, batch, unit)
+
+        self.progress.report()
+        return self.progress
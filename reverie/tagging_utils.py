@@ -1,23 +1,47 @@
+import argparse
 import json
-import atexit
-from db_utils import close_connection_pool
-import gpt_utils
-from reverie.db_utils import get_untagged_conversation_ids, get_all_messages_in_conversation, update_table_column_by_id
-from reverie.gpt_utils import query_gpt_for_message_tags
+import os
+import threading
+from reverie.cache_utils import PersistentLRUCache
+from reverie.storage import close_storage, get_storage
+from reverie import gpt_utils
+from reverie.gpt_utils import query_gpt_for_message_tags, message_tags_cache_key
+from reverie.tagging_engine import TaggingEngine
 
+TAG_CACHE_PATH = os.getenv("REVERIE_TAG_CACHE_PATH", "tag_cache.sqlite3")
 
-def generate_subject_tags(messages: dict):
+tag_cache = None  # Opened on first use by get_tag_cache()
+_tag_cache_lock = threading.Lock()
+
+def get_tag_cache() -> PersistentLRUCache:
+    """
+    Returns the shared tag cache, keyed by normalized content hash, model, prompt and prompt version.
+    """
+    global tag_cache
+    if tag_cache is None:
+        with _tag_cache_lock:
+            if tag_cache is None:
+                tag_cache = PersistentLRUCache(TAG_CACHE_PATH, table="message_tags")
+    return tag_cache
+
+def generate_subject_tags(messages: dict, cache: PersistentLRUCache = None):
+    cache = cache or get_tag_cache()
     tagged_messages = {}
     for message_id, content in messages.items():
-        try:
-            message_with_tags = query_gpt_for_message_tags(content)
-        except Exception as e:
-            print(f"Error generating tags for message {message_id}: {e}")
-            message_with_tags = {"content": content, "tags": []}
+        cache_key = message_tags_cache_key(content)
+        tags = cache.get(cache_key)
+
+        if tags is None:
+            try:
+                tags = query_gpt_for_message_tags(content, raise_errors=True)["tags"]
+                cache.set(cache_key, tags)
+            except Exception as e:
+                print(f"Error generating tags for message {message_id}: {e}")
+                tags = []  # Not cached, so the message is retried next time
 
         tagged_messages[message_id] = {
-            "content" : message_with_tags["content"],
-            "tags" : message_with_tags["tags"]
+            "content" : content,
+            "tags" : tags
         }
 
     return tagged_messages
@@ -29,17 +53,48 @@ def tags_to_json(tags: list):
         print(f"Error converting tags to Json: {e}")
         return "[]"
 
+def iter_untagged_conversations():
+    """
+    Yields (conversation_id, {message_id: content}) for messages that still need tags,
+    loading one conversation at a time.
+    """
+    storage = get_storage()
+    for conversation_id in storage.get_untagged_conversation_ids():
+        yield conversation_id, storage.get_all_untagged_messages_in_conversation(conversation_id)
+
+def write_conversation_tags(conversation_id: str, tags_by_message_id: dict):
+    """
+    Stores a conversation's message tags with one bulk UPDATE in a single transaction.
+    """
+    get_storage().bulk_update_table_column_by_id(
+        table_name="Messages",
+        column_name="tags",
+        id_column="message_id",
+        values={message_id: tags_to_json(tags) for message_id, tags in tags_by_message_id.items()},
+        id_cast="uuid",
+        value_cast="jsonb"
+    )
+
 if __name__ == "__main__":
-    untagged_conversation_ids = get_untagged_conversation_ids()
-
-    for conversation_id in untagged_conversation_ids:
-        messages = get_all_messages_in_conversation(conversation_id)
-        tagged_messages = generate_subject_tags(messages)
-        for message_id, data in tagged_messages.items():
-            update_table_column_by_id(
-                table_name="Messages",
-                column_name="tags",
-                id_column="message_id",
-                record_id=message_id,
-                value=tags_to_json(data["tags"])
-            )
+    parser = argparse.ArgumentParser(description="Backfill subject tags for untagged messages.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Number of concurrent tagging workers")
+    parser.add_argument("--rpm", type=float, default=gpt_utils.OPENAI_REQUESTS_PER_MINUTE,
+                        help="Requests-per-minute limit of the request scheduler (default: REVERIE_OPENAI_RPM)")
+    parser.add_argument("--tpm", type=float, default=gpt_utils.OPENAI_TOKENS_PER_MINUTE,
+                        help="Tokens-per-minute limit of the request scheduler (default: REVERIE_OPENAI_TPM)")
+    parser.add_argument("--batch-token-budget", type=int, default=None,
+                        help="Pack messages into batched requests of at most this many tokens")
+    parser.add_argument("--report-interval", type=float, default=10.0, help="Seconds between progress reports")
+    args = parser.parse_args()
+
+    gpt_utils.scheduler = gpt_utils.RequestScheduler(args.rpm, args.tpm)
+    engine = TaggingEngine(
+        write_tags=write_conversation_tags,
+        concurrency=args.concurrency,
+        report_interval=args.report_interval,
+        batch_token_budget=args.batch_token_budget,
+        cache=get_tag_cache()
+    )
+    engine.run(iter_untagged_conversations())
+    print(f"Tag cache: {get_tag_cache().stats()}")
+    close_storage()
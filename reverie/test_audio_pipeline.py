@@ -0,0 +1,121 @@
+import threading
+import time
+
+import numpy as np
+
+from reverie.audio_pipeline import AudioPipeline, FrameRingBuffer, VadSegmenter, WavFileSource, energy_vad
+from reverie.voice import save_wav
+
+SAMPLE_RATE = 16000
+
+
+def write_utterances(path, utterances=3, speech_seconds=0.5, silence_seconds=1.0):
+    """
+    Writes a WAV of `utterances` tone bursts, each followed by silence.
+    """
+    t = np.arange(int(SAMPLE_RATE * speech_seconds)) / SAMPLE_RATE
+    tone = (8000 * np.sin(2 * np.pi * 220 * t)).astype("<i2").tobytes()
+    silence = bytes(int(SAMPLE_RATE * silence_seconds) * 2)
+    save_wav(str(path), [silence] + [tone + silence] * utterances, sample_rate=SAMPLE_RATE)
+
+def test_ring_buffer_drops_oldest_frames_when_full():
+    ring = FrameRingBuffer(capacity=3, frame_bytes=2)
+    for n in range(5):
+        ring.put(bytes([n, n]))
+    ring.close()
+
+    assert ring.dropped_frames == 2
+    assert [ring.get(), ring.get(), ring.get(), ring.get()] == [b"\x02\x02", b"\x03\x03", b"\x04\x04", None]
+
+def run_segmenter(segmenter, pattern):
+    """
+    Pushes one 2-byte frame per character of `pattern` ("#" voiced, "." silent), each
+    holding its own index, and returns the frame indices of every utterance.
+    """
+    segments = []
+    for n, mark in enumerate(pattern):
+        segment = segmenter.push(bytes([1 if mark == "#" else 0, n % 256]))
+        if segment is not None:
+            assert isinstance(segment, memoryview)
+            segments.append([segment[i + 1] for i in range(0, len(segment), 2)])
+    return segments
+
+def voiced_frame(frame):
+    return frame[0] == 1
+
+def test_segmenter_keeps_pre_roll_and_ignores_stray_frames():
+    segmenter = VadSegmenter(voiced_frame, frame_bytes=2, start_frames=4, start_ratio=0.75, end_frames=5,
+                             end_ratio=0.2, pre_roll_frames=2)
+
+    # Stray voiced frames at 1 and 5 never fill the start window; speech runs from 10 to 17
+    segments = run_segmenter(segmenter, "." "#..." "#...." "###.####" "......")
+
+    assert len(segments) == 1
+    # Speech starts at frame 12 (3 of 9-12 voiced); the utterance opens with that window and 2 frames before it
+    assert segments[0][0] == 7
+    # ...and ends at frame 21, the first with at most 1 of the last 5 voiced
+    assert segments[0] == list(range(7, 22))
+
+def test_back_to_back_utterances_stay_contiguous():
+    segmenter = VadSegmenter(voiced_frame, frame_bytes=2, start_frames=4, start_ratio=0.75, end_frames=3,
+                             end_ratio=0.0, pre_roll_frames=4)
+
+    # The second utterance starts two frames after the first ends, well within start + pre-roll frames
+    segments = run_segmenter(segmenter, "........" "####" "..." ".#####" "......")
+
+    assert len(segments) == 2
+    for segment in segments:
+        assert segment == list(range(segment[0], segment[-1] + 1))
+    assert segments[1][0] == segments[0][-1] + 1
+
+def test_segmenter_reuses_its_buffers_in_rotation():
+    segmenter = VadSegmenter(voiced_frame, frame_bytes=2, start_frames=2, start_ratio=1.0, end_frames=2,
+                             end_ratio=0.0, pre_roll_frames=0, buffers=2)
+
+    first, second, third = (segmenter.push(b"\1\0") or segmenter.push(b"\1\0") or segmenter.push(b"\0\0")
+                            or segmenter.push(b"\0\0") for _ in range(3))
+
+    assert first.obj is third.obj
+    assert second.obj is not first.obj
+
+def test_pipeline_keeps_capturing_while_worker_is_busy(tmp_path):
+    write_utterances(tmp_path / "speech.wav")
+    handled = []
+    capture_done = threading.Event()
+
+    def handle_segment(frames, sample_rate, channels):
+        capture_done.wait(5)  # Hold the first utterance until the whole file has been read
+        handled.append(bytes(frames))
+
+    source = WavFileSource(str(tmp_path / "speech.wav"))
+    pipeline = AudioPipeline(source, energy_vad(), handle_segment, ring_seconds=10.0,
+                             start_frames=10, end_frames=30).start()
+    while source.position < len(source.data):
+        time.sleep(0.01)
+    capture_done.set()
+
+    assert pipeline.wait(timeout=5)
+    stats = pipeline.stats()
+    assert len(handled) == 3
+    assert stats["segments_processed"] == 3
+    assert stats["frames_dropped"] == 0
+    assert stats["frames_captured"] == -(-len(source.data) // source.frame_bytes)
+
+def test_pipeline_counts_frames_dropped_under_backpressure(tmp_path):
+    write_utterances(tmp_path / "speech.wav", utterances=4)
+    release = threading.Event()
+
+    def handle_segment(frames, sample_rate, channels):
+        release.wait(5)
+
+    source = WavFileSource(str(tmp_path / "speech.wav"))
+    pipeline = AudioPipeline(source, energy_vad(), handle_segment, ring_seconds=0.05, max_pending_segments=1,
+                             start_frames=10, end_frames=30).start()
+    while source.position < len(source.data):
+        time.sleep(0.01)
+    release.set()
+
+    assert pipeline.wait(timeout=5)
+    stats = pipeline.stats()
+    assert stats["frames_dropped"] > 0
+    assert stats["ring_high_water"] == stats["ring_capacity"]
@@ -0,0 +1,77 @@
+import sqlite3
+
+from reverie import cache_utils
+from reverie.cache_utils import PersistentLRUCache
+from reverie.gpt_utils import message_tags_cache_key
+
+
+def test_values_survive_reopening(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = PersistentLRUCache(path)
+    cache.set("greeting", ["greeting"])
+    cache.close()
+
+    reopened = PersistentLRUCache(path)
+    assert reopened.get("greeting") == ["greeting"]
+    assert reopened.disk_hits == 1
+    assert reopened.get("greeting") == ["greeting"]
+    assert reopened.memory_hits == 1
+
+def test_memory_tier_is_bounded():
+    cache = PersistentLRUCache(":memory:", max_memory_entries=2)
+    for key in ("a", "b", "c"):
+        cache.set(key, key)
+
+    assert list(cache._memory) == ["b", "c"]
+    assert cache.get("a") == "a"  # Evicted from memory but still on disk
+    assert cache.get("missing") is None
+    assert cache.stats() == {"memory_hits": 0, "disk_hits": 1, "misses": 1, "hit_rate": 0.5,
+                             "expirations": 0, "evictions": 0}
+
+def test_tag_cache_key_normalizes_content():
+    assert message_tags_cache_key("OK ") == message_tags_cache_key("ok")
+    assert message_tags_cache_key("ok") != message_tags_cache_key("ok", model="gpt-4o")
+    assert message_tags_cache_key("ok") != message_tags_cache_key("okay")
+    assert message_tags_cache_key("ok") != message_tags_cache_key("ok", prompt="batch")
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_utils.time, "time", lambda: now[0])
+    cache = PersistentLRUCache(":memory:", ttl=60)
+    cache.set("a", "fresh")
+
+    now[0] += 30
+    assert cache.get("a") == "fresh"
+    now[0] += 31
+    assert cache.get("a") is None
+    assert cache.stats()["expirations"] == 1 and len(cache) == 0
+
+def test_disk_tier_evicts_least_recently_used(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache_utils.time, "time", lambda: now[0])
+    cache = PersistentLRUCache(":memory:", max_memory_entries=1, max_disk_entries=10)
+    for i in range(10):
+        now[0] += 1
+        cache.set(str(i), i)
+    now[0] += 1
+    assert cache.get("0") == 0  # A disk hit marks "0" as recently used
+
+    cache.set("10", 10)
+
+    assert len(cache) == 9
+    assert cache.stats()["evictions"] == 2
+    assert cache.get("0") == 0
+    assert cache.get("1") is None and cache.get("2") is None
+
+def test_tables_from_before_expiry_are_upgraded(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    db = sqlite3.connect(path)
+    db.execute("CREATE TABLE cache (key TEXT PRIMARY KEY, value TEXT NOT NULL)")
+    db.execute("""INSERT INTO cache VALUES ('old', '["tag"]')""")
+    db.commit()
+    db.close()
+
+    cache = PersistentLRUCache(path)
+
+    assert cache.get("old") == ["tag"]
+    assert len(cache) == 1
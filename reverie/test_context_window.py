@@ -0,0 +1,35 @@
+from reverie.context_window import ContextWindow, MESSAGE_OVERHEAD_TOKENS
+
+
+def test_keeps_system_prompt_and_most_recent_turns():
+    window = ContextWindow("system prompt", system_tokens=10, token_budget=10 + 3 * (20 + MESSAGE_OVERHEAD_TOKENS) + 4)
+    for n in range(10):
+        window.add("user", f"turn {n}", token_count=20)
+
+    messages = window.messages()
+    assert messages[0] == {"role": "system", "content": "system prompt"}
+    assert [message["content"] for message in messages[1:]] == ["turn 7", "turn 8", "turn 9"]
+    assert window.token_count <= window.token_budget
+
+def test_newest_turn_is_kept_even_if_over_budget():
+    window = ContextWindow("system prompt", system_tokens=10, token_budget=50)
+    window.add("user", "short", token_count=5)
+    window.add("user", "very long", token_count=500)
+
+    assert [message["content"] for message in window.messages()] == ["system prompt", "very long"]
+
+def test_evicted_turns_are_kept_for_the_summarizer():
+    window = ContextWindow("system prompt", system_tokens=10, token_budget=10 + 2 * 24 + 4, keep_evicted=True)
+    for n in range(5):
+        window.add("user", f"turn {n}", token_count=20)
+
+    assert [message["content"] for message, _ in window.evicted] == ["turn 0", "turn 1", "turn 2"]
+    assert window.evicted_tokens == 3 * 24
+
+    window.clear_evicted(3)
+    window.set_summary("the user counted to two", token_count=5)
+
+    messages = window.messages()
+    assert messages[1]["role"] == "system" and messages[1]["content"].endswith("the user counted to two")
+    assert [message["content"] for message in messages[2:]] == ["turn 4"]  # The summary pushed turn 3 out
+    assert window.evicted_tokens == 24
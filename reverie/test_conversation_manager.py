@@ -0,0 +1,64 @@
+import asyncio
+import threading
+
+import pytest
+
+from reverie import conversation_manager, memory_index, storage as storage_module
+from reverie.context_window import ContextWindow
+from reverie.conversation_manager import append_message_async, build_prompt_async
+from reverie.conversation_stats import StatsAccumulator
+from reverie.memory_index import BM25Index
+from reverie.storage import SQLiteStorage, generate_conversation_data, generate_message_data
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = SQLiteStorage(str(tmp_path / "reverie.sqlite3"))
+    monkeypatch.setattr(storage_module, "storage", storage)
+    monkeypatch.setattr(conversation_manager, "conversation_stats",
+                        StatsAccumulator(storage.apply_conversation_stats, flush_every=2))
+    monkeypatch.setattr(conversation_manager, "count_tokens", lambda text: len(text.split()))  # No tiktoken download
+    monkeypatch.setattr(memory_index, "memory_index", BM25Index())
+    yield storage
+    storage.close()
+
+def test_append_message_async_stores_indexes_and_counts(storage):
+    conversation_data = dict(generate_conversation_data("discord:1"), message_count=1, token_usage_total=2)
+    conversation_id = storage.create_conversation(conversation_data, generate_message_data(None, "system", "Be kind.", 2))
+    window = ContextWindow("Be kind.", system_tokens=2)
+
+    async def turn():
+        await append_message_async(conversation_id, window, "user", "My cat Miso loves boxes.")
+        await append_message_async(conversation_id, window, "assistant", "Miso sounds lovely.")
+
+    asyncio.run(turn())
+
+    assert [m["content"] for m in storage.get_conversation_messages(conversation_id)] == [
+        "My cat Miso loves boxes.", "Miso sounds lovely."
+    ]
+    assert [m["content"] for m in window.messages()[1:]] == ["My cat Miso loves boxes.", "Miso sounds lovely."]
+    assert memory_index.memory_index.search("Miso boxes")[0]["content"] == "My cat Miso loves boxes."
+    # Two messages fill the accumulator, so the counters are already written
+    assert storage.get_conversation_stats(conversation_id) == storage.recompute_conversation_stats(conversation_id)
+
+
+def test_build_prompt_async_searches_off_the_event_loop(monkeypatch):
+    index = BM25Index()
+    index.add("earlier", "user", "My cat Miso loves cardboard boxes.")
+    monkeypatch.setattr(memory_index, "memory_index", index)
+    search_threads = []
+    search_memory = conversation_manager.search_memory
+
+    def recording_search(*args, **kwargs):
+        search_threads.append(threading.current_thread())
+        return search_memory(*args, **kwargs)
+
+    monkeypatch.setattr(conversation_manager, "search_memory", recording_search)
+    window = ContextWindow("Be kind.", system_tokens=3)
+    window.add("user", "How is Miso?", token_count=4)
+
+    prompt = asyncio.run(build_prompt_async("current", window, "How is Miso?"))
+
+    assert search_threads and search_threads[0] is not threading.main_thread()
+    assert [message["role"] for message in prompt] == ["system", "system", "user"]
+    assert "cardboard boxes" in prompt[1]["content"]
@@ -0,0 +1,82 @@
+from datetime import datetime, timedelta, timezone
+
+from reverie.conversation_stats import StatsAccumulator
+
+
+class StatsTable:
+    """
+    Applies stats rows the way apply_conversation_stats does, to rows kept in a dictionary.
+    """
+
+    def __init__(self, fail=False):
+        self.rows = {}
+        self.batches = 0
+        self.fail = fail
+
+    def apply(self, rows):
+        if self.fail:
+            raise RuntimeError("database unavailable")
+        self.batches += 1
+        for conversation_id, messages, user_tokens, assistant_tokens, total_tokens, end_time in rows:
+            row = self.rows.setdefault(conversation_id, {"message_count": 0, "token_usage_user": 0,
+                                                         "token_usage_assistant": 0, "token_usage_total": 0,
+                                                         "end_time": None})
+            row["message_count"] += messages
+            row["token_usage_user"] += user_tokens
+            row["token_usage_assistant"] += assistant_tokens
+            row["token_usage_total"] += total_tokens
+            row["end_time"] = end_time or row["end_time"]
+
+def recompute(messages, conversation_id):
+    mine = [(role, tokens) for cid, role, tokens in messages if cid == conversation_id]
+    return {
+        "message_count": len(mine),
+        "token_usage_user": sum(tokens for role, tokens in mine if role == "user"),
+        "token_usage_assistant": sum(tokens for role, tokens in mine if role == "assistant"),
+        "token_usage_total": sum(tokens for _, tokens in mine),
+    }
+
+def test_batched_increments_match_a_recomputation():
+    table = StatsTable()
+    stats = StatsAccumulator(table.apply, flush_every=7)
+    messages = [(f"c{i % 3}", ("user", "assistant", "system")[i % 5 % 3], i % 11) for i in range(100)]
+
+    for conversation_id, role, tokens in messages:
+        if stats.record(conversation_id, role, tokens):
+            stats.flush()
+    for conversation_id in ("c0", "c1", "c2"):
+        stats.finalize(conversation_id)
+
+    assert table.batches == 100 // 7 + 3
+    for conversation_id in ("c0", "c1", "c2"):
+        row = dict(table.rows[conversation_id])
+        assert row.pop("end_time") is not None
+        assert row == recompute(messages, conversation_id)
+
+def test_finalize_stamps_the_last_message_time_even_after_a_flush():
+    table = StatsTable()
+    stats = StatsAccumulator(table.apply)
+    last = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+    stats.record("c", "user", 3, last - timedelta(minutes=5))
+    stats.record("c", "assistant", 4, last)
+    stats.flush()
+
+    stats.finalize("c")
+
+    assert table.rows["c"]["end_time"] == last
+    assert table.rows["c"]["message_count"] == 2
+
+def test_failed_writes_are_kept_for_the_next_flush(capsys):
+    table = StatsTable(fail=True)
+    stats = StatsAccumulator(table.apply)
+    stats.record("c", "user", 5)
+
+    assert not stats.flush()
+    stats.record("c", "assistant", 2)
+    table.fail = False
+    assert stats.flush()
+
+    assert table.rows["c"]["message_count"] == 2
+    assert table.rows["c"]["token_usage_total"] == 7
+    assert stats.pending("c") is None
+    assert "database unavailable" in capsys.readouterr().out
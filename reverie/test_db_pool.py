@@ -0,0 +1,100 @@
+import threading
+import time
+
+import pytest
+
+from reverie.db_pool import ConnectionPool, PoolTimeout
+
+
+class FakeCursor:
+    def __init__(self, connection):
+        self.connection = connection
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def execute(self, query, params=None):
+        if self.connection.broken:
+            self.connection.closed = 2
+            raise ConnectionError("server closed the connection unexpectedly")
+        self.connection.queries.append(query)
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = 0
+        self.broken = False
+        self.queries = []
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+def test_checkout_reuses_connections_and_returns_them_on_error():
+    pool = ConnectionPool(FakeConnection, min_connections=1, max_connections=2)
+
+    with pytest.raises(RuntimeError):
+        with pool.connection() as first:
+            raise RuntimeError("query failed")
+    with pool.connection() as second:
+        pass
+
+    assert first is second
+    assert first.rollbacks == 2  # Each return rolls back whatever the caller left open
+    assert pool.stats()["checkouts"] == 2
+    assert pool.stats()["in_use"] == 0
+
+def test_checkout_waits_for_a_free_connection_then_times_out():
+    pool = ConnectionPool(FakeConnection, min_connections=0, max_connections=1, checkout_timeout=0.05)
+    held = pool.getconn()
+
+    with pytest.raises(PoolTimeout):
+        pool.getconn()
+
+    threading.Timer(0.02, pool.putconn, args=(held,)).start()
+    assert pool.getconn(timeout=1.0) is held
+    stats = pool.stats()
+    assert stats["timeouts"] == 1
+    assert stats["max_wait_ms"] >= 15
+
+def test_stale_connections_are_replaced():
+    pool = ConnectionPool(FakeConnection, min_connections=1, max_connections=1, validate_after=0.0)
+    with pool.connection() as connection:
+        connection.broken = True
+
+    time.sleep(0.001)
+    with pool.connection() as replacement:
+        assert replacement is not connection
+
+    assert connection.closed
+    assert pool.stats()["reconnects"] == 1
+    assert pool.stats()["open"] == 1
+
+def test_pool_never_exceeds_max_connections_under_contention():
+    pool = ConnectionPool(FakeConnection, min_connections=0, max_connections=3)
+
+    def worker():
+        for _ in range(50):
+            with pool.connection():
+                time.sleep(0.0005)
+
+    threads = [threading.Thread(target=worker) for _ in range(12)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    stats = pool.stats()
+    assert stats["checkouts"] == 600
+    assert stats["connections_opened"] == 3
+    assert stats["in_use_high_water"] == 3
+    # Returned connections go to the longest waiter, so no thread waits much longer than a round of the others
+    assert stats["max_wait_ms"] < 200
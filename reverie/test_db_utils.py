@@ -0,0 +1,79 @@
+import pytest
+
+from reverie import db_utils
+from reverie.db_pool import ConnectionPool
+
+
+class RecordingConnection:
+    def __init__(self):
+        self.closed = 0
+        self.autocommit = False
+        self.statements = []  # (query, params, autocommit)
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self, name=None):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                pass
+
+            def execute(self, query, params=None):
+                connection.statements.append((query, params, connection.autocommit))
+
+            def fetchone(self):
+                return ("new-conversation-id",)
+
+        return Cursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = 1
+
+@pytest.fixture
+def connection(monkeypatch):
+    connection = RecordingConnection()
+    monkeypatch.setattr(db_utils, "connection_pool", ConnectionPool(lambda: connection, max_connections=1))
+    return connection
+
+def test_create_conversation_is_one_autocommitted_statement(connection):
+    conversation_id = db_utils.create_conversation(
+        db_utils.generate_conversation_data("cli"),
+        db_utils.generate_message_data(None, "system", "You are Makiyo.", 5)
+    )
+
+    assert conversation_id == "new-conversation-id"
+    assert len(connection.statements) == 1
+    query, params, autocommit = connection.statements[0]
+    assert autocommit
+    assert query.startswith("WITH new_conversation AS (INSERT INTO Conversations")
+    assert "SELECT conversation_id, %(m_role)s" in query
+    assert params["c_interface"] == "cli" and params["m_content"] == "You are Makiyo."
+    assert "m_conversation_id" not in params
+    assert not connection.autocommit  # Restored before the connection went back to the pool
+
+def test_insert_into_table_returns_the_requested_column(connection):
+    new_id = db_utils.insert_into_table("Conversations", {"user_id": "Rewind"}, returning="conversation_id")
+
+    assert new_id == "new-conversation-id"
+    assert connection.statements[0][0].endswith("RETURNING conversation_id")
+
+def test_transaction_commits_or_rolls_back(connection):
+    with db_utils.transaction() as cursor:
+        cursor.execute("UPDATE Conversations SET summary = 'a'")
+    with pytest.raises(RuntimeError):
+        with db_utils.transaction() as cursor:
+            cursor.execute("UPDATE Conversations SET summary = 'b'")
+            raise RuntimeError("second statement failed")
+
+    assert connection.commits == 1
+    assert connection.rollbacks >= 1
@@ -0,0 +1,74 @@
+import asyncio
+import types
+
+import discord
+
+from reverie import discord_client
+from reverie.discord_client import EDIT_INTERVAL, FALLBACK_REPLY, ReverieClient, stream_reply
+from reverie.sessions import Session, SessionRegistry
+
+
+class FakeMessage:
+    def __init__(self, content):
+        self.edits = [content]
+
+    async def edit(self, content):
+        self.edits.append(content)
+
+class FakeChannel:
+    def __init__(self):
+        self.sent = []
+
+    async def send(self, content):
+        self.sent.append(FakeMessage(content))
+        return self.sent[-1]
+
+def timed_deltas(monkeypatch, pieces):
+    """
+    Yields each (seconds, text) piece with the reply's clock set to `seconds`.
+    """
+    clock = types.SimpleNamespace(now=0.0)
+    monkeypatch.setattr(discord_client, "time", types.SimpleNamespace(monotonic=lambda: clock.now))
+
+    async def deltas():
+        for seconds, text in pieces:
+            clock.now = seconds
+            yield text
+    return deltas()
+
+def test_stream_reply_throttles_edits(monkeypatch):
+    channel = FakeChannel()
+    pieces = [(0.0, " "), (0.1, "Hello"), (0.2, " there"), (0.2 + EDIT_INTERVAL, ","), (0.3 + EDIT_INTERVAL, " friend")]
+
+    text = asyncio.run(stream_reply(channel, timed_deltas(monkeypatch, pieces)))
+
+    assert text == " Hello there, friend"
+    assert len(channel.sent) == 1
+    # Sent on the first visible text, edited once the interval passed, then once more with the rest
+    assert channel.sent[0].edits == [" Hello", " Hello there,", " Hello there, friend"]
+
+def test_stream_reply_falls_back_when_nothing_arrives(monkeypatch):
+    channel = FakeChannel()
+
+    text = asyncio.run(stream_reply(channel, timed_deltas(monkeypatch, [])))
+
+    assert text == ""
+    assert [message.edits for message in channel.sent] == [[FALLBACK_REPLY]]
+
+def test_closing_the_client_finalizes_every_session(monkeypatch):
+    finalized = []
+
+    async def load(key):
+        return Session(key, f"conversation-{key}", None)
+
+    registry = SessionRegistry(load, on_evict=lambda session: finalized.append(session.conversation_id))
+    monkeypatch.setattr(discord_client, "sessions", registry)
+
+    async def run():
+        await registry.get("discord:1")
+        await registry.get("discord:2")
+        await ReverieClient(intents=discord.Intents.none()).close()
+
+    asyncio.run(run())
+
+    assert sorted(finalized) == ["conversation-discord:1", "conversation-discord:2"]
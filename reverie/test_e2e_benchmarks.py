@@ -0,0 +1,45 @@
+from reverie import db_utils
+from reverie.db_pool import ConnectionPool
+from reverie.e2e_benchmarks import MemoryDatabase, compare_results
+
+
+def test_compare_results_flags_only_changes_beyond_the_tolerance():
+    baseline = {"scenarios": {"cli": {"p95_ms": 100.0, "throughput_per_s": 10.0, "max_rss_mb": 80.0},
+                              "voice": {"p50_ms": 50.0}}}
+    results = {"scenarios": {"cli": {"p95_ms": 130.0, "throughput_per_s": 7.0, "max_rss_mb": 85.0},
+                             "tagging": {"p50_ms": 500.0}}}
+
+    regressions = compare_results(results, baseline, tolerance=0.2)
+
+    assert [(r["scenario"], r["metric"]) for r in regressions] == [("cli", "p95_ms"), ("cli", "throughput_per_s")]
+    assert round(regressions[0]["change"], 2) == 0.3
+
+def test_memory_database_serves_the_backfill_through_db_utils(monkeypatch):
+    database = MemoryDatabase(round_trip=0)
+    monkeypatch.setattr(db_utils, "connection_pool", ConnectionPool(database.connect, max_connections=2))
+    conversation_id = db_utils.create_conversation(db_utils.generate_conversation_data(),
+                                                   db_utils.generate_message_data(None, "system", "Be kind.", 3))
+    db_utils.insert_many_into_table("Messages", [db_utils.generate_message_data(conversation_id, "user", f"hi {n}", 2)
+                                                 for n in range(2)])
+    assert db_utils.get_untagged_conversation_ids() == [conversation_id]
+
+    messages = db_utils.get_all_untagged_messages_in_conversation(conversation_id)
+    db_utils.bulk_update_table_column_by_id("Messages", "tags", "message_id",
+                                            {message_id: '["tide pools"]' for message_id in messages},
+                                            id_cast="uuid", value_cast="jsonb")
+
+    assert len(messages) == 3  # The system prompt has no tags either
+    assert db_utils.get_all_untagged_messages_in_conversation(conversation_id) == {}
+    assert database.unhandled == 0
+
+def test_memory_database_stores_batched_inserts(monkeypatch):
+    database = MemoryDatabase(round_trip=0)
+    monkeypatch.setattr(db_utils, "connection_pool", ConnectionPool(database.connect, max_connections=2))
+    conversation_id = db_utils.create_conversation(db_utils.generate_conversation_data("cli"),
+                                                   db_utils.generate_message_data(None, "system", "Be kind.", 3))
+
+    db_utils.insert_many_into_table("Messages", [db_utils.generate_message_data(conversation_id, "user", f"hi {n}", 2)
+                                                 for n in range(3)])
+
+    assert [message["content"] for message in db_utils.iter_all_messages()] == ["hi 0", "hi 1", "hi 2"]
+    assert db_utils.get_latest_conversation_for_interface("cli") == (conversation_id, None)
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+import time
+
+import openai
+import pytest
+
+from reverie import gpt_utils
+
+REPLY = "Streaming replies arrive piece by piece."
+
+
+@pytest.fixture
+def server(fake_server):
+    return fake_server(reply=lambda body: REPLY)
+
+def test_stream_gpt_yields_the_reply_in_pieces(server):
+    deltas = list(gpt_utils.stream_gpt([{"role": "user", "content": "Hi"}]))
+
+    assert len(deltas) > 1
+    assert "".join(deltas) == REPLY
+
+def test_stream_gpt_async_yields_the_reply_in_pieces(server):
+    async def collect():
+        deltas = [delta async for delta in gpt_utils.stream_gpt_async([{"role": "user", "content": "Hi"}])]
+        await gpt_utils.get_async_client().close()
+        return deltas
+
+    assert "".join(asyncio.run(collect())) == REPLY
+
+def test_query_gpt_async_leaves_the_event_loop_running(fake_server):
+    fake_server(reply=lambda body: REPLY, latency=0.3)
+
+    async def turn():
+        ticks = 0
+        reply = asyncio.create_task(gpt_utils.query_gpt_async([{"role": "user", "content": "Hi"}]))
+        while not reply.done():
+            await asyncio.sleep(0.01)  # Stands in for the gateway heartbeat and other channels
+            ticks += 1
+        await gpt_utils.get_async_client().close()
+        return reply.result(), ticks
+
+    reply, ticks = asyncio.run(turn())
+
+    assert reply == REPLY
+    assert ticks >= 10  # The loop kept running through the server's 0.3s latency
+
+def test_async_client_follows_the_openai_settings(monkeypatch):
+    monkeypatch.setattr(openai, "api_key", "first-key")
+    monkeypatch.setattr(openai, "base_url", "http://127.0.0.1:1/v1/")
+    first = gpt_utils.get_async_client()
+    assert gpt_utils.get_async_client() is first
+
+    monkeypatch.setattr(openai, "base_url", "http://127.0.0.1:2/v1/")
+    second = gpt_utils.get_async_client()
+    assert second is not first and str(second.base_url) == "http://127.0.0.1:2/v1/"
+
+def test_deterministic_completions_are_cached(server):
+    first = gpt_utils.query_gpt_binary("Is water wet?")
+    second = gpt_utils.query_gpt_binary("Is water wet?")
+
+    assert first == second == REPLY
+    assert server.request_count == 1
+    stats = gpt_utils.completion_cache_stats()
+    assert stats["memory_hits"] == 1 and stats["entries"] == 1 and stats["saved_seconds"] > 0
+
+def test_cache_is_opt_in_above_the_temperature_threshold(server):
+    messages = [{"role": "user", "content": "Hi"}]
+    gpt_utils.query_gpt(messages, temperature=0.7)
+    gpt_utils.query_gpt(messages, temperature=0.7)
+    gpt_utils.query_gpt(messages, temperature=0.7, cache=True)
+    gpt_utils.query_gpt(messages, temperature=0.7, cache=True)
+    gpt_utils.query_gpt(messages, temperature=0.0, cache=False)
+
+    assert server.request_count == 4
+
+def test_scheduler_and_client_are_created_once_across_threads(monkeypatch):
+    monkeypatch.setattr(gpt_utils, "scheduler", None)
+    monkeypatch.setattr(gpt_utils, "client", None)
+    monkeypatch.setattr(openai, "api_key", "fake-key")
+    start = threading.Barrier(8)
+    created = []
+
+    def get_both():
+        start.wait()
+        created.append((gpt_utils.get_scheduler(), gpt_utils.get_client()))
+
+    threads = [threading.Thread(target=get_both) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(created) == 8 and len(set(created)) == 1
+
+def test_completion_cache_is_opened_once_across_threads(tmp_path, monkeypatch):
+    monkeypatch.setattr(gpt_utils, "completion_cache", None)
+    monkeypatch.setattr(gpt_utils, "COMPLETION_CACHE_PATH", str(tmp_path / "completion_cache.sqlite3"))
+    start = threading.Barrier(8)
+    caches = []
+
+    def open_cache():
+        start.wait()
+        caches.append(gpt_utils.get_completion_cache())
+
+    threads = [threading.Thread(target=open_cache) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(caches) == 8 and all(cache is caches[0] for cache in caches)
+
+def test_completion_cache_key_is_canonical():
+    messages = [{"role": "user", "content": "Hi"}]
+    reordered = [{"content": "Hi", "role": "user"}]
+    key = gpt_utils.completion_cache_key(messages, "gpt-4o-mini", 0, 20, {"seed": 1, "top_p": 1})
+
+    assert key == gpt_utils.completion_cache_key(reordered, "gpt-4o-mini", 0.0, 20, {"top_p": 1, "seed": 1})
+    assert key != gpt_utils.completion_cache_key(messages, "gpt-4o-mini", 0.0, 21, {"top_p": 1, "seed": 1})
+    assert key != gpt_utils.completion_cache_key(messages, "gpt-4o", 0.0, 20, {"top_p": 1, "seed": 1})
+
+def test_rate_limiter_reserve_holds_back_capacity():
+    limiter = gpt_utils.RateLimiter(requests_per_minute=100, tokens_per_minute=1_000_000)
+
+    admitted = 0
+    while not limiter.try_acquire(reserve=0.2):
+        admitted += 1
+    assert admitted == 80  # A fifth of the bucket is left for requests without a reserve
+    assert limiter.try_acquire() == 0
+
+def test_interactive_requests_overtake_queued_batch_work():
+    scheduler = gpt_utils.RequestScheduler(requests_per_minute=1200, tokens_per_minute=1_000_000, batch_reserve=0)
+    scheduler.limiter._requests_available = 0  # Empty bucket: one admission every 50ms
+    order = []
+
+    def send(lane, name):
+        scheduler.acquire(lane)
+        order.append(name)
+
+    batch = [threading.Thread(target=send, args=(gpt_utils.BATCH, f"batch-{i}")) for i in range(6)]
+    for thread in batch:
+        thread.start()
+    time.sleep(0.02)
+    interactive = threading.Thread(target=send, args=(gpt_utils.INTERACTIVE, "interactive"))
+    interactive.start()
+    for thread in batch + [interactive]:
+        thread.join()
+
+    assert order.index("interactive") <= 1
+    stats = scheduler.stats()
+    assert stats[gpt_utils.BATCH]["max_waiting"] == 6 and stats[gpt_utils.BATCH]["waiting"] == 0
+
+def test_scheduler_retries_rate_limited_requests(server, monkeypatch):
+    server.rate_limited_requests = 2
+    scheduler = gpt_utils.RequestScheduler(base_delay=0.01)
+    monkeypatch.setattr(gpt_utils, "scheduler", scheduler)
+
+    reply = gpt_utils.query_gpt([{"role": "user", "content": "Hi"}], raise_errors=True, lane=gpt_utils.BATCH)
+
+    assert reply == REPLY
+    batch = scheduler.stats()[gpt_utils.BATCH]
+    assert (batch["requests"], batch["retries"], batch["rate_limited"], batch["failures"]) == (1, 2, 2, 0)
+    assert scheduler.stats()[gpt_utils.INTERACTIVE]["requests"] == 0
+
+def test_parse_batch_tags_rejects_missing_and_malformed_responses():
+    messages = {"a": "first", "b": "second"}
+
+    assert gpt_utils.parse_batch_tags(messages, '{"1": ["moon", " "], "2": []}') == {"a": ["moon"], "b": []}
+    for response in (None, "", "not json", "[]", '{"1": ["moon"]}'):
+        with pytest.raises(ValueError):
+            gpt_utils.parse_batch_tags(messages, response)
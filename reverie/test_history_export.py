@@ -0,0 +1,90 @@
+import gzip
+import io
+from datetime import datetime, timezone
+
+import pytest
+
+from reverie import history_export
+from reverie.history_export import (
+    CONVERSATION_COLUMNS, MESSAGE_COLUMNS, copy_chunks, copy_row, read_export, write_export
+)
+
+START = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def conversation_row(conversation_id, summary=None):
+    row = dict.fromkeys(CONVERSATION_COLUMNS)
+    row.update(conversation_id=conversation_id, user_id="Rewind", start_time=START, summary=summary, message_count=2)
+    return tuple(row[column] for column in CONVERSATION_COLUMNS)
+
+def message_row(message_id, conversation_id, content, tags=None):
+    row = dict.fromkeys(MESSAGE_COLUMNS)
+    row.update(message_id=message_id, conversation_id=conversation_id, role="user", content=content,
+               timestamp=START, token_count=3, tags=tags)
+    return tuple(row[column] for column in MESSAGE_COLUMNS)
+
+def export_text(conversations, messages):
+    fileobj = io.StringIO()
+    counts = write_export(fileobj, conversations, messages)
+    return fileobj.getvalue(), counts
+
+def test_round_trip_keeps_rows_and_framing():
+    text, counts = export_text(
+        [conversation_row("a", summary="first"), conversation_row("b")],
+        [message_row("m1", "a", "hi\tthere\n", tags=["greeting"]), message_row("m2", "a", "back\\slash"),
+         message_row("m3", "b", "bye")],
+    )
+
+    events = list(read_export(io.StringIO(text)))
+
+    assert counts == {"conversations": 2, "messages": 3, "orphaned_messages": 0}
+    assert [(kind, row.get("message_id", row["conversation_id"])) for kind, row in events] == [
+        ("conversation", "a"), ("message", "m1"), ("message", "m2"), ("conversation", "b"), ("message", "m3")
+    ]
+    assert events[1][1]["conversation_id"] == "a" and events[1][1]["tags"] == ["greeting"]
+    assert events[0][1]["start_time"] == START.isoformat()
+    assert '"conversation_id"' not in text.splitlines()[2]  # Implied by the frame
+
+def test_messages_without_a_conversation_are_skipped():
+    _, counts = export_text([conversation_row("b")], [message_row("m0", "a", "orphan"), message_row("m1", "b", "ok"),
+                                                      message_row("m2", "c", "orphan")])
+
+    assert counts == {"conversations": 1, "messages": 1, "orphaned_messages": 2}
+
+def test_truncated_export_is_rejected():
+    text, _ = export_text([conversation_row("a")], [message_row("m1", "a", "hi")])
+
+    with pytest.raises(ValueError, match="ended early"):
+        list(read_export(io.StringIO("".join(text.splitlines(keepends=True)[:-1]))))
+    with pytest.raises(ValueError, match="Not a reverie-history"):
+        list(read_export(io.StringIO('{"format": "something-else"}\n')))
+
+def test_copy_rows_escape_text_and_encode_json():
+    row = {"message_id": "m1", "conversation_id": "a", "role": "user", "content": "a\tb\nc\\d",
+           "token_count": 3, "custom_metrics": {"k": 1}, "tags": None}
+
+    line = copy_row(MESSAGE_COLUMNS, row)
+
+    assert line.rstrip("\n").split("\t") == ["m1", "a", "user", "a\\tb\\nc\\\\d", "\\N", "3", "\\N", '{"k": 1}', "\\N"]
+
+def test_copy_chunks_with_new_ids_keep_messages_with_their_conversation():
+    text, _ = export_text(
+        [conversation_row("a"), conversation_row("b")],
+        [message_row("m1", "a", "one"), message_row("m2", "a", "two"), message_row("m3", "b", "three")],
+    )
+
+    chunks = list(copy_chunks(read_export(io.StringIO(text)), chunk_rows=2, new_ids=True))
+
+    conversation_ids = [line.split("\t")[0] for lines, _ in chunks for line in lines]
+    message_links = [line.split("\t")[1] for _, lines in chunks for line in lines]
+    assert len(chunks) == 3
+    assert "a" not in conversation_ids and len(set(conversation_ids)) == 2
+    assert message_links == [conversation_ids[0], conversation_ids[0], conversation_ids[1]]
+
+def test_gzip_file_round_trip(tmp_path):
+    path = tmp_path / "history.jsonl.gz"
+    with gzip.open(path, "wt", encoding="utf-8") as fileobj:
+        history_export.write_export(fileobj, [conversation_row("a")], [message_row("m1", "a", "hi")])
+
+    with gzip.open(path, "rt", encoding="utf-8") as fileobj:
+        assert [kind for kind, _ in read_export(fileobj)] == ["conversation", "message"]
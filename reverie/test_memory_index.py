@@ -0,0 +1,110 @@
+import threading
+from datetime import datetime, timedelta, timezone
+
+from reverie import memory_index
+from reverie.memory_index import BM25Index, index_message, search_memory, start_memory_index
+from reverie.storage import SQLiteStorage, generate_conversation_data, generate_message_data
+
+
+def build_index():
+    index = BM25Index()
+    index.add("c1", "user", "My cat Miso loves sitting in cardboard boxes.")
+    index.add("c1", "assistant", "Cats often like boxes because they feel safe.")
+    index.add("c2", "user", "I started learning the cello last month.")
+    index.add("c3", "user", "What should I cook for dinner tonight?")
+    return index
+
+def test_returns_most_relevant_messages_first():
+    results = build_index().search("any news about Miso and the cardboard boxes?", k=2)
+
+    assert [result["content"] for result in results] == [
+        "My cat Miso loves sitting in cardboard boxes.",
+        "Cats often like boxes because they feel safe.",
+    ]
+    assert results[0]["score"] > results[1]["score"]
+
+def test_new_messages_are_searchable_immediately():
+    index = build_index()
+    assert index.search("violin") == []
+
+    index.add("c4", "user", "I switched from cello to violin.")
+    assert index.search("violin")[0]["conversation_id"] == "c4"
+
+def test_can_exclude_the_current_conversation():
+    results = build_index().search("cello", exclude_conversation_id="c2")
+    assert results == []
+
+def store_messages(storage, contents, conversation_id=None, at=None):
+    conversation_id = conversation_id or storage.create_conversation(
+        generate_conversation_data(), generate_message_data(None, "system", "Be kind.", 3))
+    at = at or datetime.now(timezone.utc) - timedelta(minutes=1)
+    storage.insert_many_into_table("Messages", [
+        dict(generate_message_data(conversation_id, "user", content, 5), timestamp=at + timedelta(milliseconds=n))
+        for n, content in enumerate(contents)
+    ])
+    return conversation_id
+
+def test_background_build_resumes_from_its_snapshot(tmp_path, monkeypatch, capsys):
+    monkeypatch.setattr(memory_index, "memory_index", None)
+    storage = SQLiteStorage(str(tmp_path / "reverie.sqlite3"))
+    snapshot = str(tmp_path / "memory_index.pickle")
+    conversation_id = store_messages(storage, ["My cat Miso loves boxes.", "I play the cello."])
+
+    start_memory_index(storage, snapshot).join()
+    assert search_memory("cello")[0]["content"] == "I play the cello."
+
+    # Later rows, plus one committed late with a timestamp before the snapshot's newest message
+    store_messages(storage, ["I switched to violin."], conversation_id)
+    store_messages(storage, ["Miso hid under the bed."], conversation_id, at=datetime.now(timezone.utc) - timedelta(minutes=3))
+    start_memory_index(storage, snapshot).join()
+    storage.close()
+
+    assert "2 messages from the snapshot, 2 caught up" in capsys.readouterr().out
+    assert len(memory_index.memory_index) == 4  # Nothing indexed twice
+    assert search_memory("violin")[0]["content"] == "I switched to violin."
+    assert search_memory("bed")[0]["content"] == "Miso hid under the bed."
+
+def test_messages_added_during_the_build_are_kept(tmp_path, monkeypatch):
+    monkeypatch.setattr(memory_index, "memory_index", None)
+    release = threading.Event()
+
+    class SlowStorage:
+        name, location = "test", "slow"
+
+        def iter_all_messages(self, since=None, until=None):
+            release.wait(5)
+            return iter([])
+
+    thread = start_memory_index(SlowStorage(), path="")
+    assert search_memory("violin") == []  # Not ready yet; turns go ahead without recall
+    index_message("c1", "user", "I switched from cello to violin.")
+    release.set()
+    thread.join()
+
+    assert search_memory("violin")[0]["conversation_id"] == "c1"
+
+def test_search_is_safe_while_other_threads_index(monkeypatch):
+    monkeypatch.setattr(memory_index, "memory_index", build_index())
+    errors = []
+    done = threading.Event()
+
+    def index_messages():
+        try:
+            for n in range(5000):
+                index_message(f"c{n}", "user", f"Miso found another cardboard box, number {n}.")
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    writer = threading.Thread(target=index_messages)
+    writer.start()
+    try:
+        while not done.is_set():
+            assert search_memory("Miso cardboard box", k=3)
+    except Exception as e:
+        errors.append(e)
+    writer.join()
+
+    assert errors == []
+    assert len(memory_index.memory_index) == 5004
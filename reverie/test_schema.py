@@ -0,0 +1,66 @@
+import ast
+import inspect
+
+from reverie import db_utils, schema
+
+
+class MigratingConnection:
+    def __init__(self, version):
+        self.version = version
+        self.statements = []
+        self.commits = 0
+
+    def cursor(self):
+        connection = self
+
+        class Cursor:
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                pass
+
+            def execute(self, query, params=None):
+                connection.statements.append((query, params))
+
+            def fetchone(self):
+                return (connection.version,)
+
+        return Cursor()
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+def test_hot_queries_match_db_utils_verbatim():
+    # Adjacent string literals are folded into one constant, so multi-line queries compare whole
+    constants = {node.value for node in ast.walk(ast.parse(inspect.getsource(db_utils)))
+                 if isinstance(node, ast.Constant) and isinstance(node.value, str)}
+
+    for query in schema.HOT_QUERIES:
+        assert query["sql"] in constants, query["name"]
+        assert query["sql"].count("%s") == len(query["params"]), query["name"]
+
+def test_migrations_are_numbered_in_order():
+    versions = [version for version, _, _ in schema.MIGRATIONS]
+    assert versions == list(range(1, len(versions) + 1))
+
+def test_migrate_applies_only_pending_versions():
+    connection = MigratingConnection(version=1)
+
+    assert schema.migrate(connection) == [2, 3, 4, 5]
+    executed = [query for query, _ in connection.statements]
+    assert not any("CREATE TABLE IF NOT EXISTS conversations" in query for query in executed)
+    assert any("messages_untagged_idx" in query for query in executed)
+    assert connection.statements[-1][1] == (5, schema.MIGRATIONS[4][1])
+
+def test_plan_walkers_find_nested_seq_scans_and_sorts():
+    plan = {"Node Type": "Limit", "Plans": [
+        {"Node Type": "Sort", "Plans": [{"Node Type": "Seq Scan", "Relation Name": "messages"}]},
+    ]}
+
+    assert schema.plan_seq_scans(plan) == ["messages"]
+    assert schema.plan_sorts(plan) == 1
+    assert schema.plan_seq_scans({"Node Type": "Index Scan", "Relation Name": "messages"}) == []
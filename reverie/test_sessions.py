@@ -0,0 +1,54 @@
+import asyncio
+
+from reverie.context_window import ContextWindow
+from reverie.sessions import Session, SessionRegistry
+
+
+def make_registry(loads, evicted, **registry_args):
+    async def load_session(key):
+        loads.append(key)
+        await asyncio.sleep(0)
+        return Session(key, f"conversation-for-{key}", ContextWindow("system", 1))
+
+    return SessionRegistry(load_session, on_evict=lambda session: evicted.append(session.key), **registry_args)
+
+def test_least_recently_used_session_is_evicted():
+    loads, evicted = [], []
+    registry = make_registry(loads, evicted, max_sessions=2)
+
+    async def scenario():
+        await registry.get("a")
+        await registry.get("b")
+        await registry.get("a")
+        await registry.get("c")  # "b" is now the least recently used
+        return await registry.get("b")
+
+    session = asyncio.run(scenario())
+    assert session.conversation_id == "conversation-for-b"
+    assert loads == ["a", "b", "c", "b"]
+    assert evicted == ["b", "a"]
+    assert list(registry.sessions) == ["c", "b"]
+
+def test_idle_sessions_are_evicted():
+    loads, evicted = [], []
+    registry = make_registry(loads, evicted, idle_timeout=0.01)
+
+    async def scenario():
+        await registry.get("a")
+        await asyncio.sleep(0.02)
+        await registry.get("b")
+
+    asyncio.run(scenario())
+    assert evicted == ["a"]
+    assert list(registry.sessions) == ["b"]
+
+def test_concurrent_misses_share_one_load():
+    loads, evicted = [], []
+    registry = make_registry(loads, evicted)
+
+    async def scenario():
+        return await asyncio.gather(*(registry.get("a") for _ in range(5)))
+
+    sessions = asyncio.run(scenario())
+    assert loads == ["a"]
+    assert all(session is sessions[0] for session in sessions)
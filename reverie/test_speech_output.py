@@ -0,0 +1,75 @@
+import threading
+import time
+
+from reverie import gpt_utils
+from reverie.speech_output import SentenceSpeaker, split_sentences
+
+REPLY = "The lighthouse is still there. It was repainted last spring! Would you like to visit it again?"
+
+
+class FakeSink:
+    def __init__(self, seconds_per_sentence: float = 0.0):
+        self.seconds_per_sentence = seconds_per_sentence
+        self.spoken = []
+        self.stopped = threading.Event()
+
+    def say(self, text):
+        self.spoken.append((time.monotonic(), text))
+        self.stopped.wait(self.seconds_per_sentence)
+
+    def stop(self):
+        self.stopped.set()
+
+def test_split_sentences_keeps_the_unfinished_remainder():
+    sentences, remainder = split_sentences('He said "hi." Then left!\nOkay. Version 3.5 is')
+
+    assert sentences == ['He said "hi."', "Then left!", "Okay."]
+    assert remainder == "Version 3.5 is"
+
+def test_first_sentence_plays_before_generation_finishes(fake_server):
+    fake_server(reply=lambda body: REPLY, token_interval=0.02)
+    sink = FakeSink()
+    speaker = SentenceSpeaker(sink)
+
+    reply = speaker.speak_stream(gpt_utils.stream_gpt([{"role": "user", "content": "Hi"}]))
+    generation_done = time.monotonic()
+    speaker.wait()
+    speaker.close()
+
+    assert reply == REPLY
+    assert [text for _, text in sink.spoken] == [
+        "The lighthouse is still there.", "It was repainted last spring!", "Would you like to visit it again?"
+    ]
+    assert sink.spoken[0][0] < generation_done
+    assert len(speaker.first_audio_latencies) == 1
+
+def test_cancel_discards_queued_sentences():
+    sink = FakeSink(seconds_per_sentence=5.0)
+    speaker = SentenceSpeaker(sink)
+
+    speaker.speak_stream(iter(["One. ", "Two. ", "Three."]))
+    while not sink.spoken:
+        time.sleep(0.001)
+    speaker.cancel()
+    speaker.wait()
+    speaker.close()
+
+    assert [text for _, text in sink.spoken] == ["One."]
+    assert speaker.sentences_cancelled == 2
+
+def test_is_playing_only_while_a_sentence_is_spoken():
+    sink = FakeSink(seconds_per_sentence=5.0)
+    speaker = SentenceSpeaker(sink)
+    assert not speaker.is_playing()
+
+    speaker.speak("A long sentence.")
+    deadline = time.monotonic() + 5
+    while not sink.spoken and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert speaker.is_playing()
+
+    speaker.cancel()
+    speaker.wait()
+    assert not speaker.is_playing()
+    assert speaker.is_playing(tail=60)  # Still within the echo tail
+    speaker.close()
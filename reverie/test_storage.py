@@ -0,0 +1,128 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from reverie import storage as storage_module
+from reverie.storage import SQLiteStorage, generate_conversation_data, generate_message_data
+
+START = datetime(2024, 5, 1, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = SQLiteStorage(str(tmp_path / "reverie.sqlite3"))
+    yield storage
+    storage.close()
+
+def message(conversation_id, role, content, token_count, seconds):
+    return dict(generate_message_data(conversation_id, role, content, token_count), timestamp=START + timedelta(seconds=seconds))
+
+def conversation(storage, interface=None, seconds=0):
+    return storage.create_conversation(dict(generate_conversation_data(interface), start_time=START + timedelta(seconds=seconds)),
+                                       message(None, "system", "Be kind.", 3, seconds))
+
+def test_create_conversation_and_inserts(storage):
+    conversation_id = conversation(storage, "cli")
+    message_id = storage.insert_into_table("Messages", message(conversation_id, "user", "hi", 1, 1), returning="message_id")
+    storage.insert_many_into_table("Messages", [message(conversation_id, "assistant", f"reply {n}", 2, 2 + n)
+                                                for n in range(3)])
+
+    assert storage.stats()["journal_mode"] == "wal"
+    assert storage.get_latest_conversation_id() == conversation_id
+    assert storage.get_latest_conversation_for_interface("cli") == (conversation_id, None)
+    assert storage.get_latest_conversation_for_interface("discord:1") is None
+    assert list(storage.get_all_messages_in_conversation(conversation_id).values())[:2] == ["Be kind.", "hi"]
+    assert message_id in storage.get_all_messages_in_conversation(conversation_id)
+    assert [m["content"] for m in storage.get_conversation_messages(conversation_id)] == ["hi", "reply 0", "reply 1", "reply 2"]
+
+def test_failed_batch_insert_rolls_back(storage):
+    conversation_id = conversation(storage)
+    rows = [message(conversation_id, "user", "kept?", 1, 1), message("no such conversation", "user", "orphan", 1, 2)]
+
+    with pytest.raises(Exception):
+        storage.insert_many_into_table("Messages", rows)
+
+    assert storage.get_conversation_messages(conversation_id) == []
+
+def test_recent_conversation_messages_stay_within_the_token_budget(storage):
+    conversation_id = conversation(storage)
+    storage.insert_many_into_table("Messages", [message(conversation_id, "user", f"m{n}", 10, n + 1) for n in range(12)])
+
+    recent = storage.get_recent_conversation_messages(conversation_id, token_budget=45, page_size=2)
+
+    assert [m["content"] for m in recent] == ["m11", "m10", "m9", "m8"]
+    assert storage.get_recent_conversation_messages(conversation_id, token_budget=5)[0]["content"] == "m11"
+    assert [m["content"] for m in storage.get_recent_messages(2)] == ["m10", "m11"]
+
+def test_recent_conversation_messages_keep_timestamp_ties_across_pages(storage):
+    conversation_id = conversation(storage)
+    storage.insert_many_into_table("Messages", [message(conversation_id, "user", f"m{n}", 1, 1 + n // 3) for n in range(6)])
+
+    recent = storage.get_recent_conversation_messages(conversation_id, token_budget=100, page_size=2)
+
+    # Three messages share each timestamp, so every page boundary falls inside a tie
+    assert len(recent) == 6
+    assert {m["content"] for m in recent[:3]} == {"m3", "m4", "m5"}
+    assert {m["content"] for m in recent[3:]} == {"m0", "m1", "m2"}
+
+def test_tagging_lookups_and_bulk_update(storage):
+    tagged, untagged = conversation(storage, seconds=0), conversation(storage, seconds=1)
+    storage.bulk_update_table_column_by_id("Messages", "tags", "message_id",
+                                           {message_id: '["kindness"]' for message_id
+                                            in storage.get_all_untagged_messages_in_conversation(tagged)},
+                                           id_cast="uuid", value_cast="jsonb")
+    storage.insert_many_into_table("Messages", [message(untagged, "user", f"q{n}", 1, 2 + n) for n in range(2)])
+
+    messages = storage.get_all_untagged_messages_in_conversation(untagged)
+    storage.bulk_update_table_column_by_id("Messages", "tags", "message_id",
+                                           {message_id: '["moon"]' for message_id in list(messages)[:2]},
+                                           id_cast="uuid", value_cast="jsonb")
+
+    assert storage.get_untagged_conversation_ids() == [untagged]
+    assert len(messages) == 3
+    assert list(storage.get_all_untagged_messages_in_conversation(untagged).values()) == ["q1"]
+    storage.update_table_column_by_id("Messages", "tags", "message_id",
+                                      next(iter(storage.get_all_untagged_messages_in_conversation(untagged))), '["sky"]')
+    assert storage.get_untagged_conversation_ids() == []  # Nothing left for the next backfill
+
+def test_applied_stats_match_a_recount(storage):
+    conversation_id = conversation(storage)
+    storage.insert_many_into_table("Messages", [message(conversation_id, "user", "hi", 4, 1),
+                                                message(conversation_id, "assistant", "hello", 6, 2)])
+
+    storage.apply_conversation_stats([(conversation_id, 2, 4, 6, 10, None),
+                                      (conversation_id, 1, 0, 0, 3, START + timedelta(minutes=2))])
+    end_time, duration_seconds = storage._query("SELECT end_time, duration_seconds FROM conversations "
+                                                "WHERE conversation_id = ?", (conversation_id,))[0]
+
+    assert storage.get_conversation_stats(conversation_id) == storage.recompute_conversation_stats(conversation_id) == \
+        {"message_count": 3, "token_usage_user": 4, "token_usage_assistant": 6, "token_usage_total": 13}
+    assert end_time.startswith("2024-05-01T12:02:00")
+    assert duration_seconds == pytest.approx(120, abs=0.01)
+
+def test_unsummarized_closed_conversations(storage):
+    closed, stale, open_ = conversation(storage, seconds=0), conversation(storage, seconds=1), \
+        conversation(storage, seconds=7200)
+    storage.apply_conversation_stats([(closed, 0, 0, 0, 0, START + timedelta(seconds=30))])
+    summarized = conversation(storage, seconds=2)
+    storage.update_table_column_by_id("Conversations", "summary", "conversation_id", summarized, "A chat.")
+
+    assert storage.get_unsummarized_closed_conversation_ids(START + timedelta(hours=1)) == [closed, stale]
+    assert open_ not in storage.get_unsummarized_closed_conversation_ids(START)
+
+def test_iter_all_messages_pages_in_order(storage):
+    first, second = conversation(storage, seconds=0), conversation(storage, seconds=1)
+    storage.insert_many_into_table("Messages", [message(first if n % 2 else second, "user", f"m{n}", 1, n + 2)
+                                                for n in range(7)])
+
+    assert [m["content"] for m in storage.iter_all_messages(batch_size=3)] == [f"m{n}" for n in range(7)]
+
+def test_run_in_executor_and_backend_selection(storage, monkeypatch):
+    conversation_id = asyncio.run(storage.run_in_executor(conversation, storage, "cli"))
+    assert storage.get_latest_conversation_for_interface("cli") == (conversation_id, None)
+
+    monkeypatch.setattr(storage_module, "storage", None)
+    monkeypatch.setattr(storage_module, "DB_BACKEND", "mysql")
+    with pytest.raises(ValueError):
+        storage_module.get_storage()
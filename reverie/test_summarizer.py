@@ -0,0 +1,84 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from reverie import summarizer, storage as storage_module
+from reverie.context_window import ContextWindow
+from reverie.storage import SQLiteStorage, generate_conversation_data, generate_message_data
+from reverie.summarizer import (
+    summarize_conversation, update_rolling_summary, update_rolling_summary_async, update_rolling_summary_in_background
+)
+
+
+def summary_reply(body):
+    """
+    Answers a summary request with the previous summary plus the contents it was asked to fold in.
+    """
+    prompt = body["messages"][-1]["content"]
+    previous, transcript = prompt.split("\n\nNew transcript:\n")
+    previous = previous.removeprefix("Existing summary:\n")
+    contents = [line.split(": ", 1)[1] for line in transcript.splitlines()]
+    return " ".join(([] if previous == "(none)" else [previous]) + contents)
+
+@pytest.fixture
+def server(fake_server, monkeypatch):
+    monkeypatch.setattr(summarizer, "count_tokens", lambda text: len(text.split()))  # No tiktoken download
+    return fake_server(reply=summary_reply)
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    storage = SQLiteStorage(str(tmp_path / "reverie.sqlite3"))
+    monkeypatch.setattr(storage_module, "storage", storage)
+    yield storage
+    storage.close()
+
+def window_with_evicted_turns(count):
+    window = ContextWindow("system prompt", system_tokens=10, token_budget=10 + 24 + 4, keep_evicted=True)
+    for n in range(count + 1):
+        window.add("user", f"turn{n}", token_count=20)
+    return window
+
+def stored_summary(storage, conversation_id):
+    return storage._query("SELECT summary FROM conversations WHERE conversation_id = ?", (conversation_id,))[0][0]
+
+def test_summarize_conversation_folds_chunks_in_order(server, storage):
+    conversation_id = storage.create_conversation(generate_conversation_data(),
+                                                  generate_message_data(None, "system", "Be kind.", 3))
+    storage.insert_many_into_table("Messages", [generate_message_data(conversation_id, "user", f"m{n}", 10)
+                                                for n in range(5)])
+
+    summary = summarize_conversation(conversation_id, chunk_tokens=20)
+
+    assert server.request_count == 3  # Chunks of two, two and one messages
+    assert summary == "m0 m1 m2 m3 m4"
+
+def test_rolling_summary_waits_for_the_threshold(server, storage):
+    conversation_id = storage.create_conversation(generate_conversation_data(),
+                                                  generate_message_data(None, "system", "Be kind.", 3))
+    window = window_with_evicted_turns(2)
+
+    assert not update_rolling_summary(conversation_id, window, threshold=100)
+    assert update_rolling_summary(conversation_id, window, threshold=40)
+
+    assert server.request_count == 1
+    assert window.summary == "turn0 turn1"
+    assert window.evicted == []
+    assert stored_summary(storage, conversation_id) == "turn0 turn1"
+
+def test_async_and_background_rolling_summaries(server, storage):
+    conversation_id = storage.create_conversation(generate_conversation_data(),
+                                                  generate_message_data(None, "system", "Be kind.", 3))
+    window = window_with_evicted_turns(2)
+    assert asyncio.run(update_rolling_summary_async(conversation_id, window, threshold=40))
+
+    window.add("user", "turn3", token_count=20)
+    window.add("user", "turn4", token_count=20)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = update_rolling_summary_in_background(conversation_id, window, executor, threshold=40)
+        assert update_rolling_summary_in_background(conversation_id, window, executor, threshold=40) is None
+        assert future.result(timeout=10)
+
+    assert not window.summarizing
+    assert stored_summary(storage, conversation_id) == "turn0 turn1 turn2 turn3"
+    assert window.messages()[1]["content"].endswith("turn0 turn1 turn2 turn3")
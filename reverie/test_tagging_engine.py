@@ -0,0 +1,112 @@
+import time
+
+from reverie.cache_utils import PersistentLRUCache
+from reverie.fake_openai import tagging_reply
+from reverie.gpt_utils import RateLimiter
+from reverie.tagging_engine import TaggingEngine, pack_tag_batches
+
+
+def approximate_tokens(text):
+    return len(text) // 4 + 1
+
+def conversations(count: int, messages_each: int):
+    for c in range(count):
+        yield f"conversation-{c}", {f"message-{c}-{m}": f"Hello number {m}" for m in range(messages_each)}
+
+def test_tags_every_message_with_one_write_per_conversation(fake_server):
+    server = fake_server(reply=tagging_reply, latency=0.01)
+    writes = []
+    engine = TaggingEngine(lambda conversation_id, tags: writes.append((conversation_id, tags)),
+                           concurrency=4, report_interval=60)
+
+    progress = engine.run(conversations(5, 6))
+
+    assert progress.messages_tagged == 30
+    assert progress.conversations_written == 5
+    assert sorted(conversation_id for conversation_id, _ in writes) == [f"conversation-{c}" for c in range(5)]
+    assert all(len(tags) == 6 and all(t == ["greeting", "small talk"] for t in tags.values()) for _, tags in writes)
+    assert server.max_in_flight <= 4
+
+def test_retries_rate_limited_requests(fake_server):
+    server = fake_server(reply=tagging_reply, rate_limited_requests=3)
+    writes = {}
+    engine = TaggingEngine(writes.__setitem__, concurrency=2, report_interval=60)
+    engine.run(conversations(1, 4))
+
+    assert server.rate_limited_count == 3
+    assert engine.progress.messages_tagged == 4
+    assert engine.progress.messages_failed == 0
+    assert all(tags == ["greeting", "small talk"] for tags in writes["conversation-0"].values())
+
+def test_batched_tagging_sends_fewer_requests(fake_server):
+    server = fake_server(reply=tagging_reply)
+    writes = {}
+    engine = TaggingEngine(writes.__setitem__, concurrency=4, report_interval=60,
+                           batch_token_budget=2000, count_tokens=approximate_tokens)
+    engine.run(conversations(3, 20))
+
+    assert engine.progress.messages_tagged == 60
+    assert server.request_count == 3
+    assert all(tags == ["greeting", "small talk"] for conversation in writes.values() for tags in conversation.values())
+
+def test_unparseable_batch_is_split_and_retried(fake_server):
+    responses = iter(["not json"])
+
+    def flaky_tags(body):
+        if "response_format" in body:
+            return next(responses, None) or tagging_reply(body)
+        return tagging_reply(body)
+
+    server = fake_server(reply=flaky_tags)
+    writes = {}
+    engine = TaggingEngine(writes.__setitem__, concurrency=1, report_interval=60,
+                           batch_token_budget=2000, count_tokens=approximate_tokens)
+    engine.run(conversations(1, 8))
+
+    assert engine.progress.messages_tagged == 8
+    assert server.request_count == 3  # The failed batch of 8, then two halves of 4
+    assert len(writes["conversation-0"]) == 8
+
+def test_cached_content_costs_no_requests(fake_server):
+    server = fake_server(reply=tagging_reply)
+    cache = PersistentLRUCache(":memory:")
+    writes = {}
+
+    TaggingEngine(writes.__setitem__, concurrency=2, report_interval=60, cache=cache).run(conversations(2, 3))
+    first_run_requests = server.request_count
+    engine = TaggingEngine(writes.__setitem__, concurrency=2, report_interval=60, cache=cache)
+    engine.run(conversations(4, 3))
+
+    assert first_run_requests == 6
+    assert server.request_count == first_run_requests  # Every message repeats content seen in the first run
+    assert engine.progress.messages_cached == 12
+    assert len(writes) == 4
+
+def test_cached_tags_are_only_reused_for_the_same_prompt(fake_server):
+    server = fake_server(reply=tagging_reply)
+    cache = PersistentLRUCache(":memory:")
+    batched = dict(batch_token_budget=2000, count_tokens=approximate_tokens, report_interval=60, cache=cache)
+
+    TaggingEngine(lambda *args: None, **batched).run(conversations(1, 3))
+    assert server.request_count == 1
+    TaggingEngine(lambda *args: None, **batched).run(conversations(1, 3))
+    assert server.request_count == 1  # Same prompt: served from the cache
+
+    TaggingEngine(lambda *args: None, report_interval=60, cache=cache).run(conversations(1, 3))
+    assert server.request_count == 4  # The single-message prompt doesn't reuse batch tags
+
+def test_pack_tag_batches_respects_budget():
+    messages = {f"m{n}": "word " * 40 for n in range(10)}
+    batches = pack_tag_batches(messages, token_budget=300, count_tokens=approximate_tokens)
+
+    assert [message_id for batch in batches for message_id in batch] == list(messages)
+    assert all(len(batch) == 2 for batch in batches)
+
+def test_rate_limiter_spaces_requests():
+    limiter = RateLimiter(requests_per_minute=600, tokens_per_minute=1_000_000)
+    limiter._requests_available = 0  # Start from an empty bucket: one request every 0.1s
+
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.25
@@ -0,0 +1,83 @@
+import asyncio
+import json
+
+import pytest
+
+from reverie import tracing
+from reverie.tracing import Histogram, Tracer, new_turn, span, traced
+
+
+@pytest.fixture
+def tracer(monkeypatch, tmp_path):
+    tracer = Tracer(enabled=True, trace_file=str(tmp_path / "trace.jsonl"), metrics_file=str(tmp_path / "metrics.prom"))
+    monkeypatch.setattr(tracing, "tracer", tracer)
+    return tracer
+
+def test_disabled_tracing_records_nothing(monkeypatch, tmp_path):
+    tracer = Tracer(enabled=False, trace_file=str(tmp_path / "trace.jsonl"))
+    monkeypatch.setattr(tracing, "tracer", tracer)
+
+    with span("db.insert") as current:
+        current.set(rows=3)
+
+    assert span("db.insert") is tracing.NULL_SPAN
+    assert tracer.histograms == {}
+    tracer.flush()
+    assert not (tmp_path / "trace.jsonl").exists()
+
+def test_spans_carry_the_turn_id_and_errors(tracer, tmp_path):
+    turn = new_turn()
+    with span("gpt.completion", model="gpt-4o-mini"):
+        pass
+    with pytest.raises(ValueError):
+        with span("db.insert"):
+            raise ValueError("boom")
+    tracer.flush()
+
+    lines = [json.loads(line) for line in (tmp_path / "trace.jsonl").read_text().splitlines()]
+    assert [line["span"] for line in lines] == ["gpt.completion", "db.insert"]
+    assert {line["turn"] for line in lines} == {turn}
+    assert lines[0]["model"] == "gpt-4o-mini"
+    assert lines[1]["error"] == "ValueError"
+    assert tracer.summary()["db.insert"]["errors"] == 1
+
+def test_traced_times_sync_and_async_functions(tracer):
+    @traced("stage.sync")
+    def add(a, b):
+        return a + b
+
+    @traced()
+    async def fetch():
+        await asyncio.sleep(0)
+        return "done"
+
+    assert add(1, 2) == 3
+    assert asyncio.run(fetch()) == "done"
+    assert add.__name__ == "add"
+    assert tracer.histograms["stage.sync"].count == 1
+    assert tracer.histograms["test_tracing.fetch"].count == 1
+
+def test_histogram_buckets_and_quantiles():
+    histogram = Histogram()
+    for _ in range(90):
+        histogram.observe(0.002)  # (0.001, 0.0025]
+    for _ in range(10):
+        histogram.observe(0.3)  # (0.25, 0.5]
+
+    assert histogram.count == 100
+    assert 0.001 < histogram.quantile(0.5) <= 0.0025
+    assert 0.25 < histogram.quantile(0.99) <= 0.5
+    histogram.observe(120.0)
+    assert histogram.counts[-1] == 1
+
+def test_prometheus_text_has_cumulative_buckets(tracer, tmp_path):
+    tracer.record("stt.transcribe", 0.2)
+    tracer.record("stt.transcribe", 3.0)
+    tracer.flush()
+
+    text = (tmp_path / "metrics.prom").read_text()
+    assert "# TYPE reverie_stage_seconds histogram" in text
+    assert 'reverie_stage_seconds_bucket{stage="stt.transcribe",le="0.25"} 1' in text
+    assert 'reverie_stage_seconds_bucket{stage="stt.transcribe",le="5.0"} 2' in text
+    assert 'reverie_stage_seconds_bucket{stage="stt.transcribe",le="+Inf"} 2' in text
+    assert 'reverie_stage_seconds_count{stage="stt.transcribe"} 2' in text
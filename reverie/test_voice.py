@@ -0,0 +1,63 @@
+import subprocess
+import sys
+import threading
+
+import numpy as np
+
+from reverie import voice
+
+
+def test_importing_voice_keeps_the_sigint_handler():
+    # In a fresh interpreter: this one has imported voice already
+    check = ("import signal; handler = signal.getsignal(signal.SIGINT); import reverie.voice, reverie.synthetic_audio; "
+             "assert signal.getsignal(signal.SIGINT) is handler")
+    subprocess.run([sys.executable, "-c", check], check=True)
+
+def test_build_wav_bytes_matches_save_wav(tmp_path):
+    frames = [bytes([n]) * 320 for n in range(50)]
+    path = tmp_path / "speech.wav"
+    voice.save_wav(str(path), frames, sample_rate=16000, channels=1)
+
+    assert voice.build_wav_bytes(frames, sample_rate=16000, channels=1) == path.read_bytes()
+
+def test_transcribe_audio_uploads_in_memory_wav(fake_server):
+    uploads = []
+    fake_server(transcript=lambda upload: uploads.append(upload) or "hello reverie")
+    wav_bytes = voice.build_wav_bytes([b"\x01\x02" * 160] * 10)
+
+    assert voice.transcribe_audio(wav_bytes) == "hello reverie"
+    assert wav_bytes in uploads[0]
+
+class PlayingSpeaker:
+    def __init__(self, playing):
+        self.playing = playing
+
+    def is_playing(self, tail=0.0):
+        return self.playing
+
+def test_own_voice_does_not_count_as_speech_while_playing():
+    quiet, loud = np.full(160, 800, dtype="<i2").tobytes(), np.full(160, 6000, dtype="<i2").tobytes()
+    speaker = PlayingSpeaker(playing=True)
+    is_speech = voice.gate_echo(lambda frame: True, speaker, threshold=2000)
+
+    assert not is_speech(quiet)  # Echo of the reply
+    assert is_speech(loud)  # The user talking over it
+    speaker.playing = False
+    assert is_speech(quiet)
+
+def test_pyttsx3_stop_is_applied_on_the_tts_thread():
+    class FakeEngine:
+        stopped_on = None
+
+        def stop(self):
+            self.stopped_on = threading.current_thread()
+
+    sink = voice.Pyttsx3Sink()
+    sink.engine = FakeEngine()
+    caller = threading.Thread(target=sink.stop)
+    caller.start()
+    caller.join()
+    assert sink.engine.stopped_on is None  # Only requested from the other thread
+
+    sink._on_word("utterance", 0, 5)  # pyttsx3 calls this on the thread running runAndWait()
+    assert sink.engine.stopped_on is threading.current_thread()
@@ -0,0 +1,30 @@
+import numpy as np
+
+from reverie.synthetic_audio import SYNTHETIC_WAKE_PHRASE, synthetic_speech
+from reverie.wake_word import FeatureExtractor, WakePhraseDetector, dtw_distance
+
+
+def test_dtw_distance_tolerates_a_slower_match():
+    template = np.random.default_rng(0).standard_normal((20, 12)).astype(np.float32)
+    slower = np.repeat(template, 2, axis=0)[:36]
+    shifted = np.vstack([np.random.default_rng(1).standard_normal((10, 12)), np.repeat(template, 2, axis=0)])
+
+    assert dtw_distance(template, template, max_start=5) < 1e-5
+    assert dtw_distance(template, shifted.astype(np.float32), max_start=15) < 0.1
+    assert dtw_distance(template, slower, max_start=5) < dtw_distance(template[::-1], slower, max_start=5)
+
+def test_detector_accepts_the_phrase_and_rejects_other_speech():
+    rng = np.random.default_rng(0)
+    detector = WakePhraseDetector([synthetic_speech(SYNTHETIC_WAKE_PHRASE, rng) for _ in range(2)], threshold=0.3)
+
+    phrase = synthetic_speech(SYNTHETIC_WAKE_PHRASE, rng, stretch=1.1)
+    other = synthetic_speech([(0, 150), (6, 150), (3, 120), (7, 180)], rng)
+
+    assert detector.matches(memoryview(phrase.tobytes()))
+    assert not detector.matches(other.tobytes())
+
+def test_features_ignore_loudness():
+    samples = synthetic_speech(SYNTHETIC_WAKE_PHRASE, np.random.default_rng(0)).astype(np.float32)
+    extract = FeatureExtractor()
+
+    assert np.allclose(extract(samples), extract(samples * 0.25), atol=1e-3)
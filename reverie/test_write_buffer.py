@@ -0,0 +1,104 @@
+import gc
+import os
+import subprocess
+import sys
+import time
+import weakref
+
+from reverie.write_buffer import WriteBehindBuffer
+
+PACKAGE_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_flushes_on_size_in_order():
+    batches = []
+    buffer = WriteBehindBuffer(batches.append, max_rows=10, max_age=60)
+    futures = [buffer.enqueue({"n": i}) for i in range(25)]
+
+    futures[19].result(timeout=5)  # Written on size, long before max_age
+    buffer.close()
+
+    assert len(batches[0]) >= 10
+    assert [row["n"] for batch in batches for row in batch] == list(range(25))
+    assert all(future.done() and future.exception() is None for future in futures)
+
+def test_flushes_on_age():
+    batches = []
+    buffer = WriteBehindBuffer(batches.append, max_rows=1000, max_age=0.05)
+    buffer.enqueue({"n": 1}).result(timeout=5)
+
+    assert batches == [[{"n": 1}]]
+    buffer.close()
+
+def test_failed_write_is_reported_to_futures():
+    attempts = []
+
+    def failing_write(rows):
+        attempts.append(rows)
+        raise RuntimeError("database unavailable")
+
+    buffer = WriteBehindBuffer(failing_write, max_rows=2, max_age=60, max_retries=2, retry_delay=0.001)
+    first, second = buffer.enqueue({"n": 1}), buffer.enqueue({"n": 2})
+    buffer.close()
+
+    assert isinstance(first.exception(), RuntimeError)
+    assert isinstance(second.exception(), RuntimeError)
+    assert len(attempts) == 3
+    assert buffer.rows_failed == 2
+
+def test_transient_write_failure_is_retried_in_order():
+    failures = iter([RuntimeError("connection reset")])
+    written = []
+
+    def flaky_write(rows):
+        error = next(failures, None)
+        if error:
+            raise error
+        written.extend(row["n"] for row in rows)
+
+    buffer = WriteBehindBuffer(flaky_write, max_rows=3, max_age=60, retry_delay=0.01)
+    futures = [buffer.enqueue({"n": n}) for n in range(7)]
+    buffer.close()
+
+    assert written == list(range(7))
+    assert all(future.exception() is None for future in futures)
+    assert buffer.write_retries == 1
+    assert buffer.rows_failed == 0
+
+def test_enqueue_does_not_wait_for_write():
+    def slow_write(rows):
+        time.sleep(0.2)
+
+    buffer = WriteBehindBuffer(slow_write, max_rows=1, max_age=60)
+    start = time.perf_counter()
+    buffer.enqueue({"n": 1})
+    buffer.enqueue({"n": 2})
+    elapsed = time.perf_counter() - start
+    buffer.close()
+
+    assert elapsed < 0.1
+    assert buffer.rows_written == 2
+
+def test_closed_buffer_is_not_kept_alive_by_atexit():
+    buffer = WriteBehindBuffer(lambda rows: None)
+    buffer.close()
+    collected = weakref.ref(buffer)
+    del buffer
+    gc.collect()
+
+    assert collected() is None
+
+def test_no_rows_lost_on_clean_exit(tmp_path):
+    output_path = tmp_path / "rows.txt"
+    script = (
+        "from reverie.write_buffer import WriteBehindBuffer\n"
+        f"out = open({str(output_path)!r}, 'w')\n"
+        "def write(rows):\n"
+        "    out.writelines(f\"{row['n']}\\n\" for row in rows)\n"
+        "    out.flush()\n"
+        "buffer = WriteBehindBuffer(write, max_rows=64, max_age=60)\n"
+        "for n in range(1000):\n"
+        "    buffer.enqueue({'n': n})\n"
+    )
+    subprocess.run([sys.executable, "-c", script], cwd=PACKAGE_ROOT, check=True)
+
+    assert output_path.read_text().split() == [str(n) for n in range(1000)]
@@ -0,0 +1,268 @@
+# reverie/tracing.py
+"""
+Lightweight per-stage latency tracing. Wrap a hot path in `with span("db.checkout"):`
+or decorate it with `@traced("gpt.query")`. Each span's duration is added to a
+histogram for its stage and, if a trace file is configured, written as one JSONL line
+tagged with the current turn's correlation id (see new_turn()).
+
+Tracing is off unless REVERIE_TRACING is set. When it is off, span() hands back a shared
+do-nothing context manager, so instrumented code pays well under a microsecond per span.
+Histograms can be exported in Prometheus text format with prometheus_text(), or written
+to REVERIE_METRICS_FILE at exit.
+"""
+
+import atexit
+import bisect
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+TRACING_ENABLED = os.getenv("REVERIE_TRACING", "").lower() in ("1", "true", "yes")
+TRACE_FILE = os.getenv("REVERIE_TRACE_FILE")  # JSONL, one line per span
+METRICS_FILE = os.getenv("REVERIE_METRICS_FILE")  # Prometheus text format, rewritten on flush
+
+# Upper bounds in seconds, from sub-millisecond tokenizer calls to slow completions
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+           10.0, 30.0, 60.0)
+
+_turn_id = contextvars.ContextVar("reverie_turn_id", default=None)
+
+
+def new_turn(turn_id: Optional[str] = None) -> str:
+    """
+    Starts a new turn in the current thread or task; spans recorded from here on carry its id.
+    """
+    turn_id = turn_id or uuid.uuid4().hex[:16]
+    _turn_id.set(turn_id)
+    return turn_id
+
+def current_turn() -> Optional[str]:
+    return _turn_id.get()
+
+class Histogram:
+    """
+    Counts of observations per bucket plus their sum, like a Prometheus histogram.
+    """
+
+    __slots__ = ("counts", "total", "count", "_lock")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # The last bucket is +Inf
+        self.total = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimated q-quantile in seconds, interpolating linearly within the bucket it falls in.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[index - 1] if index else 0.0
+                upper = BUCKETS[index] if index < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class _Span:
+    __slots__ = ("tracer", "name", "attributes", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, attributes: Dict):
+        self.tracer = tracer
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.tracer.record(self.name, time.perf_counter() - self.start, self.attributes,
+                           exc_type.__name__ if exc_type else None)
+        return False
+
+    def set(self, **attributes):
+        """
+        Adds attributes (e.g. a row count or the lane) to the span's trace line.
+        """
+        self.attributes.update(attributes)
+
+class Tracer:
+    """
+    Per-stage histograms and an optional JSONL span log. Trace lines are buffered and
+    appended to `trace_file` every `buffer_lines` spans, on flush() and at exit.
+    """
+
+    def __init__(self, enabled: bool = TRACING_ENABLED, trace_file: Optional[str] = TRACE_FILE,
+                 metrics_file: Optional[str] = METRICS_FILE, buffer_lines: int = 256):
+        self.enabled = enabled
+        self.trace_file = trace_file
+        self.metrics_file = metrics_file
+        self.buffer_lines = buffer_lines
+        self.histograms: Dict[str, Histogram] = {}
+        self.errors: Dict[str, int] = {}
+        self._buffer: List[str] = []
+        self._lock = threading.Lock()
+
+    def span(self, name: str, **attributes):
+        if not self.enabled:
+            return NULL_SPAN
+        return _Span(self, name, attributes)
+
+    def record(self, name: str, seconds: float, attributes: Optional[Dict] = None, error: Optional[str] = None):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, Histogram())
+        histogram.observe(seconds)
+        if error:
+            with self._lock:
+                self.errors[name] = self.errors.get(name, 0) + 1
+        if self.trace_file:
+            line = {"ts": time.time(), "turn": _turn_id.get(), "span": name, "ms": round(seconds * 1000, 3)}
+            if error:
+                line["error"] = error
+            if attributes:
+                line.update(attributes)
+            with self._lock:
+                self._buffer.append(json.dumps(line, default=str))
+                full = len(self._buffer) >= self.buffer_lines
+            if full:
+                self.flush()
+
+    def flush(self):
+        """
+        Appends buffered trace lines to the trace file and rewrites the metrics file.
+        """
+        with self._lock:
+            lines, self._buffer = self._buffer, []
+        if lines and self.trace_file:
+            try:
+                with open(self.trace_file, "a", encoding="utf-8") as trace:
+                    trace.write("\n".join(lines) + "\n")
+            except OSError as e:
+                print(f"Error writing trace file: {e}")
+        if self.metrics_file and self.histograms:
+            try:
+                with open(self.metrics_file, "w", encoding="utf-8") as metrics:
+                    metrics.write(self.prometheus_text())
+            except OSError as e:
+                print(f"Error writing metrics file: {e}")
+
+    def summary(self) -> Dict[str, Dict]:
+        """
+        Count, mean and estimated p50/p95/p99 in milliseconds per stage.
+        """
+        return {
+            name: {
+                "count": histogram.count,
+                "mean_ms": histogram.total / histogram.count * 1000 if histogram.count else 0.0,
+                "p50_ms": histogram.quantile(0.5) * 1000,
+                "p95_ms": histogram.quantile(0.95) * 1000,
+                "p99_ms": histogram.quantile(0.99) * 1000,
+                "errors": self.errors.get(name, 0),
+            }
+            for name, histogram in sorted(self.histograms.items())
+        }
+
+    def prometheus_text(self) -> str:
+        lines = [
+            "# HELP reverie_stage_seconds Time spent in each instrumented stage of a turn.",
+            "# TYPE reverie_stage_seconds histogram",
+        ]
+        for name, histogram in sorted(self.histograms.items()):
+            cumulative = 0
+            for bound, count in zip(BUCKETS + (float("inf"),), histogram.counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f'reverie_stage_seconds_bucket{{stage="{name}",le="{le}"}} {cumulative}')
+            lines.append(f'reverie_stage_seconds_sum{{stage="{name}"}} {histogram.total!r}')
+            lines.append(f'reverie_stage_seconds_count{{stage="{name}"}} {histogram.count}')
+        if self.errors:
+            lines.append("# HELP reverie_stage_errors_total Spans that ended with an exception.")
+            lines.append("# TYPE reverie_stage_errors_total counter")
+            for name, count in sorted(self.errors.items()):
+                lines.append(f'reverie_stage_errors_total{{stage="{name}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def reset(self):
+        with self._lock:
+            self.histograms = {}
+            self.errors = {}
+            self._buffer = []
+
+tracer = Tracer()
+atexit.register(lambda: tracer.flush())
+
+def span(name: str, **attributes):
+    """
+    with span("stage.name", key=value): ...  — times the block (a no-op while tracing is off).
+    """
+    if not tracer.enabled:  # Checked here rather than in Tracer.span() to save a call on the no-op path
+        return NULL_SPAN
+    return _Span(tracer, name, attributes)
+
+def record(name: str, seconds: float, **attributes):
+    """
+    Records a duration measured by the caller, e.g. time to the first streamed token.
+    """
+    if tracer.enabled:
+        tracer.record(name, seconds, attributes)
+
+def traced(name: Optional[str] = None) -> Callable:
+    """
+    Decorator timing every call of a function (sync or async) as a span named `name`,
+    by default "<module>.<function>".
+    """
+    def decorate(func: Callable) -> Callable:
+        stage = name or f"{func.__module__.rsplit('.', 1)[-1]}.{func.__name__}"
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not tracer.enabled:
+                    return await func(*args, **kwargs)
+                with tracer.span(stage):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+    return decorate
@@ -1,33 +1,98 @@
-import pyaudio
-import webrtcvad
 import signal
+import struct
 import sys
+import threading
 import wave
 import time  # to timestamp filenames
 import os
+from concurrent.futures import ThreadPoolExecutor
 import openai
-import pyttsx3
-from reverie.gpt_utils import query_gpt
+from reverie.audio_pipeline import AudioPipeline, energy_vad
+from reverie.gpt_utils import INTERACTIVE, get_client, get_scheduler, stream_gpt
+from reverie.speech_output import SentenceSpeaker
+from reverie.tracing import new_turn, span, traced
+from reverie.wake_word import load_wake_detector
 
 from dotenv import load_dotenv
 load_dotenv()
 
 openai.api_key = os.getenv("OPENAI_API_KEY")
 
-tts_engine = pyttsx3.init()
+speaker = None  # SentenceSpeaker, created on first use by get_speaker()
 
 conversation_state = "IDLE"
 last_interaction_time = None
 CONVERSATION_TIMEOUT = 30
 
+# Local wake-phrase gate (see reverie.wake_word), loaded by main(); None uploads every IDLE utterance
+wake_detector = None
+segments_gated = 0  # IDLE utterances dropped locally instead of being sent to Whisper
+
+# Set REVERIE_ARCHIVE_RECORDINGS=1 to keep a copy of every utterance in recordings/.
+# Archiving happens on a background thread, off the capture-to-reply path.
+ARCHIVE_RECORDINGS = os.getenv("REVERIE_ARCHIVE_RECORDINGS", "").lower() in ("1", "true", "yes")
+RECORDINGS_DIR = "recordings"
+archive_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="recording-archive")
+
+# Without echo cancellation the microphone also hears Reverie's own voice. While it is
+# speaking (and for BARGE_IN_ECHO_TAIL seconds after), only frames louder than
+# BARGE_IN_RMS count as speech, so its replies are cut off by the user talking over
+# them, not by their own echo.
+BARGE_IN_RMS = float(os.getenv("REVERIE_BARGE_IN_RMS", "2000"))
+BARGE_IN_ECHO_TAIL = 0.3
+
+class Pyttsx3Sink:
+    """
+    Speaks text with pyttsx3. The engine is created on the first say(), so it belongs to
+    the TTS thread that uses it. pyttsx3 isn't thread-safe, so stop() only sets a flag;
+    the engine's started-word callback, which runs on the TTS thread inside runAndWait(),
+    stops it at the next word.
+    """
+
+    def __init__(self):
+        self.engine = None
+        self._stop_requested = threading.Event()
+
+    def say(self, text: str):
+        if self.engine is None:
+            import pyttsx3
+            self.engine = pyttsx3.init()
+            self.engine.connect("started-word", self._on_word)
+        self._stop_requested.clear()
+        self.engine.say(text)
+        self.engine.runAndWait()
+
+    def _on_word(self, name, location, length):
+        if self._stop_requested.is_set():
+            self.engine.stop()
+
+    def stop(self):
+        self._stop_requested.set()
+
+def gate_echo(is_speech, speaker: SentenceSpeaker, threshold: float = BARGE_IN_RMS, tail: float = BARGE_IN_ECHO_TAIL):
+    """
+    Wraps a VAD so that, while `speaker` is playing, only frames louder than `threshold` are speech.
+    """
+    loud = energy_vad(threshold)
+
+    def is_speech_gated(frame: bytes) -> bool:
+        return is_speech(frame) and (not speaker.is_playing(tail) or loud(frame))
+
+    return is_speech_gated
+
+def get_speaker() -> SentenceSpeaker:
+    global speaker
+    if speaker is None:
+        speaker = SentenceSpeaker(Pyttsx3Sink())
+    return speaker
+
 def speak(text: str):
     """
-    Speaks the provided text out loud using the pyttsx3 engine.
+    Queues the provided text to be spoken out loud on the TTS thread.
     """
     if not text:
         return  # skip empty strings
-    tts_engine.say(text)
-    tts_engine.runAndWait()
+    get_speaker().speak(text)
 
 def save_wav(filepath, audio_frames, sample_rate=16000, channels=1):
     """
@@ -39,36 +104,92 @@ def save_wav(filepath, audio_frames, sample_rate=16000, channels=1):
         wf.setframerate(sample_rate)
         wf.writeframes(b''.join(audio_frames))
 
-def transcribe_audio(file_path: str) -> str:
+def wav_header(data_length: int, sample_rate=16000, channels=1, sample_width=2) -> bytes:
+    """
+    The 44-byte RIFF header of a PCM WAV file holding `data_length` bytes of audio.
+    """
+    byte_rate = sample_rate * channels * sample_width
+    return struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_length, b"WAVE",
+        b"fmt ", 16, 1, channels, sample_rate, byte_rate, channels * sample_width, sample_width * 8,
+        b"data", data_length
+    )
+
+def build_wav_bytes(audio_frames, sample_rate=16000, channels=1) -> bytes:
+    """
+    Builds a complete WAV file in memory from raw 16-bit frames. The frames are copied
+    exactly once, straight into the result, which can be uploaded as-is.
+    """
+    data_length = sum(len(frame) for frame in audio_frames)
+    return b"".join([wav_header(data_length, sample_rate, channels), *audio_frames])
+
+def archive_recording(wav_bytes: bytes):
+    """
+    Writes an utterance to recordings/ on the archive thread, without blocking the caller.
+    """
+    def write():
+        os.makedirs(RECORDINGS_DIR, exist_ok=True)
+        filename = os.path.join(RECORDINGS_DIR, f"speech_{time.time_ns()}.wav")
+        with open(filename, "wb") as recording:
+            recording.write(wav_bytes)
+        print(f"Archived WAV file: {filename}")
+
+    return archive_executor.submit(write)
+
+@traced("stt.transcribe")
+def transcribe_audio(audio) -> str:
+    """
+    Transcribes a WAV file with Whisper. `audio` is either the file's bytes (as built by
+    build_wav_bytes) or a path to a WAV file on disk. Sent on the scheduler's interactive lane.
+    """
     try:
-        with open(file_path, "rb") as audio_file:
-            response = openai.audio.transcriptions.create(
-                file=audio_file,
-                model="whisper-1",
-                # Optionally specify language="en" or other args if desired
-            )
+        if not isinstance(audio, (bytes, bytearray, memoryview)):
+            with open(audio, "rb") as audio_file:
+                audio = audio_file.read()  # Read once so a retried upload sends the whole file again
+        response = get_scheduler().call(
+            INTERACTIVE,
+            0,  # Whisper is billed by audio length, not tokens
+            get_client().audio.transcriptions.create,
+            file=("speech.wav", audio, "audio/wav"),
+            model="whisper-1",
+            # Optionally specify language="en" or other args if desired
+        )
         # The response is a dict with a "text" key
         return response.text
     except Exception as e:
         print(f"Error transcribing audio: {e}")
         return ""
 
-def handle_speech_segment(speech_frames, sample_rate=16000, channels=1):
+def handle_speech_segment(speech_audio, sample_rate=16000, channels=1):
     """
-    Handles the entire pipeline for a finalized speech segment:
-    1. Save the WAV file
+    Handles the entire pipeline for a finalized speech segment (16-bit PCM, e.g. a
+    memoryview from the segmenter; it is not kept after this returns):
+    1. Build the WAV in memory (and optionally archive it in the background)
     2. Transcribe via Whisper
-    3. Query GPT
-    4. Speak the response
+    3. Stream the GPT reply, speaking each sentence as soon as it is complete
     """
-    global conversation_state, last_interaction_time
-
-    # 1. Save WAV
-    filename = f"recordings/speech_{int(time.time())}.wav"
-    save_wav(filename, speech_frames, sample_rate=sample_rate, channels=channels)
-    print(f"Saved WAV file: {filename}")
-
-    text = transcribe_audio(filename)
+    global conversation_state, last_interaction_time, segments_gated
+    started_at = time.monotonic()  # Time to first audio is measured from the end of the utterance
+    new_turn()  # Spans from here on (STT, model, TTS) share this utterance's turn id
+
+    if conversation_state == "CONVERSING" and time.time() - last_interaction_time > CONVERSATION_TIMEOUT:
+        print("No query for 30 seconds, returning to IDLE.")
+        conversation_state = "IDLE"
+
+    # While IDLE, only utterances that sound like the wake phrase are worth transcribing
+    if conversation_state == "IDLE" and wake_detector is not None and not wake_detector.matches(speech_audio):
+        segments_gated += 1
+        print("No wake phrase detected; not transcribing.")
+        return
+
+    # 1. Build WAV
+    with span("voice.build_wav"):
+        wav_bytes = build_wav_bytes([speech_audio], sample_rate=sample_rate, channels=channels)
+    if ARCHIVE_RECORDINGS:
+        archive_recording(wav_bytes)
+
+    text = transcribe_audio(wav_bytes)
     print("Transcription:", text)
 
     # 2. Decide logic based on state
@@ -78,6 +199,7 @@ def handle_speech_segment(speech_frames, sample_rate=16000, channels=1):
             speak("How may I assist you?")
             # Now we wait for the next speech to pass to GPT
             conversation_state = "CONVERSING"
+            last_interaction_time = time.time()
         else:
             # In IDLE mode, we ignore everything else
             print("No action taken; ignoring.")
@@ -95,101 +217,96 @@ def handle_speech_segment(speech_frames, sample_rate=16000, channels=1):
             return
 
         # This utterance is what we send to GPT
-        gpt_response = query_gpt(text)
+        conversation = [{"role": "user", "content": text}]
+        gpt_response = get_speaker().speak_stream(stream_gpt(conversation), started_at=started_at)
         print("GPT-4o mini Response:", gpt_response)
-        speak(gpt_response)
 
         # After responding, revert to IDLE
         last_interaction_time = time.time()
 
-def record_audio_with_vad():
+class MicrophoneSource:
+    """
+    Reads fixed-size 16-bit frames from the default input device with PyAudio.
     """
-    Continuously listens via PyAudio + WebRTC VAD.
-    When a speech segment ends, we call handle_speech_segment() to process it.
-    """
-    vad = webrtcvad.Vad()
-    vad.set_mode(3)  # More aggressive
-
-    RATE = 16000
-    CHUNK_DURATION_MS = 10
-    CHUNK_SIZE = int(RATE * CHUNK_DURATION_MS / 1000)
-    FORMAT = pyaudio.paInt16
-    CHANNELS = 1
-
-    p = pyaudio.PyAudio()
-    stream = p.open(
-        format=FORMAT,
-        channels=CHANNELS,
-        rate=RATE,
-        input=True,
-        frames_per_buffer=CHUNK_SIZE
-    )
-
-    speech_frames = []
-    is_speaking = False
-    # Adjust min frames to your environment—these are just example values
-    min_speech_frames = 30   # frames of speech to confirm "speech start"
-    min_silence_frames = 60  # frames of silence to confirm "speech end"
 
-    speech_counter = 0
-    silence_counter = 0
+    def __init__(self, sample_rate=16000, channels=1, frame_ms=10):
+        import pyaudio
+
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.chunk_size = int(sample_rate * frame_ms / 1000)
+        self.frame_bytes = self.chunk_size * channels * 2
+        self.audio = pyaudio.PyAudio()
+        self.stream = self.audio.open(
+            format=pyaudio.paInt16,
+            channels=channels,
+            rate=sample_rate,
+            input=True,
+            frames_per_buffer=self.chunk_size
+        )
+
+    def read(self):
+        # The capture thread does nothing else, so overflow here means the device itself stalled
+        return self.stream.read(self.chunk_size, exception_on_overflow=False)
+
+    def close(self):
+        self.stream.stop_stream()
+        self.stream.close()
+        self.audio.terminate()
+
+def record_audio_with_vad(source=None, is_speech=None):
+    """
+    Continuously listens via PyAudio + WebRTC VAD.
+    Capture, segmentation and handle_speech_segment() run on separate threads (see
+    reverie.audio_pipeline), so the microphone keeps being read while a reply is produced.
+    Pass a `source` (e.g. audio_pipeline.WavFileSource) and `is_speech` to run offline.
+    """
+    if source is None:
+        source = MicrophoneSource()
+    if is_speech is None:
+        import webrtcvad
+
+        vad = webrtcvad.Vad()
+        vad.set_mode(3)  # More aggressive
+        is_speech = lambda frame: vad.is_speech(frame, sample_rate=source.sample_rate)
+    is_speech = gate_echo(is_speech, get_speaker())  # Reverie's own voice mustn't trigger barge-in
+
+    # Adjust window sizes to your environment—these are just example values
+    pipeline = AudioPipeline(
+        source,
+        is_speech,
+        handle_speech_segment,
+        start_frames=30,     # window in which mostly speech confirms "speech start"
+        end_frames=60,       # window in which mostly silence confirms "speech end"
+        pre_roll_frames=20,  # audio kept from before the start window, so onsets aren't clipped
+        on_speech_start=get_speaker().cancel  # Barge-in: stop talking when the user starts
+    ).start()
 
     print("Listening for speech. Press Ctrl+C to stop.")
 
     try:
-        while True:
-            audio_data = stream.read(CHUNK_SIZE, exception_on_overflow=False)
-            is_speech = vad.is_speech(audio_data, sample_rate=RATE)
-
-            if is_speech:
-                speech_counter += 1
-                silence_counter = 0
-                speech_frames.append(audio_data)
-
-                if not is_speaking and speech_counter >= min_speech_frames:
-                    is_speaking = True
-                    print("Speech started...")
-            else:
-                if is_speaking:
-                    silence_counter += 1
-                    speech_frames.append(audio_data)
-
-                    if silence_counter >= min_silence_frames:
-                        is_speaking = False
-                        print("Speech ended.")
-
-                        # Delegate the heavy lifting to another function
-                        handle_speech_segment(speech_frames, RATE, CHANNELS)
-
-                        # Reset counters and clear frames
-                        speech_frames = []
-                        speech_counter = 0
-                        silence_counter = 0
-
-            if conversation_state == "CONVERSING":
-                now = time.time()
-                if (now - last_interaction_time) > CONVERSATION_TIMEOUT:
-                    print("No query for 30 seconds, returning to IDLE.")
-                    conversation_state = "IDLE"
-
+        # Join in short steps so Ctrl+C is still handled on the main thread
+        while not pipeline.wait(timeout=0.5):
+            pass
     finally:
-        # Clean up
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
+        pipeline.stop(timeout=5.0)
+        print(f"Audio pipeline stats: {pipeline.stats()}")
+        print(f"Speech output stats: {get_speaker().stats()}")
+        print(f"IDLE utterances skipped by the wake phrase gate: {segments_gated}")
+
+def signal_handler(sig, frame):
+    print("Exiting on Ctrl+C")
+    sys.exit(0)
 
 def main():
     """
     The main entry point for Reverie.
     """
+    global wake_detector
+    signal.signal(signal.SIGINT, signal_handler)  # Installed here, not on import, so importers keep their Ctrl+C
+    wake_detector = load_wake_detector()
     print("DEBUG: TTS, openai, and environment loaded. Now starting VAD loop.")
     record_audio_with_vad()
 
-def signal_handler(sig, frame):
-    print("Exiting on Ctrl+C")
-    sys.exit(0)
-
-signal.signal(signal.SIGINT, signal_handler)
-
 if __name__ == "__main__":
     main()
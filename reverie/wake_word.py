@@ -0,0 +1,173 @@
+# reverie/wake_word.py
+
+import glob
+import os
+import wave
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+FRAME_MS = 25
+HOP_MS = 10
+MEL_FILTERS = 26
+CEPSTRA = 13
+# Segments are scored on their first few seconds; the wake phrase must start within MAX_START_MS of the segment
+MAX_START_MS = 500
+
+# A directory of WAV recordings of the wake phrase enables the gate in voice.py
+WAKE_TEMPLATES_DIR = os.getenv("REVERIE_WAKE_TEMPLATES")
+WAKE_THRESHOLD = float(os.getenv("REVERIE_WAKE_THRESHOLD", "0.35"))
+
+
+def mel_filterbank(sample_rate: int, n_fft: int, n_filters: int = MEL_FILTERS) -> np.ndarray:
+    """
+    Triangular filters evenly spaced on the mel scale, shape (n_filters, n_fft // 2 + 1).
+    """
+    def to_mel(hz):
+        return 2595 * np.log10(1 + hz / 700)
+
+    def to_hz(mel):
+        return 700 * (10 ** (mel / 2595) - 1)
+
+    edges = to_hz(np.linspace(to_mel(0), to_mel(sample_rate / 2), n_filters + 2))
+    bins = np.fft.rfftfreq(n_fft, 1 / sample_rate)
+    lower, center, upper = edges[:-2, None], edges[1:-1, None], edges[2:, None]
+    rising = (bins - lower) / (center - lower)
+    falling = (upper - bins) / (upper - center)
+    return np.maximum(0, np.minimum(rising, falling)).astype(np.float32)
+
+def dct_matrix(n_inputs: int, n_outputs: int) -> np.ndarray:
+    """
+    Orthonormal DCT-II basis, shape (n_outputs, n_inputs).
+    """
+    k = np.arange(n_outputs)[:, None]
+    n = np.arange(n_inputs)[None, :]
+    basis = np.cos(np.pi * k * (2 * n + 1) / (2 * n_inputs)) * np.sqrt(2 / n_inputs)
+    basis[0] /= np.sqrt(2)
+    return basis.astype(np.float32)
+
+class FeatureExtractor:
+    """
+    MFCCs (without c0, so loudness doesn't matter) with per-utterance mean and variance
+    normalization. Filterbank and window are built once per sample rate.
+    """
+
+    def __init__(self, sample_rate: int = 16000):
+        self.sample_rate = sample_rate
+        self.frame_length = sample_rate * FRAME_MS // 1000
+        self.hop_length = sample_rate * HOP_MS // 1000
+        self.n_fft = 1 << (self.frame_length - 1).bit_length()
+        self.window = np.hanning(self.frame_length).astype(np.float32)
+        self.filterbank = mel_filterbank(sample_rate, self.n_fft)
+        self.dct = dct_matrix(MEL_FILTERS, CEPSTRA)[1:]
+
+    def __call__(self, samples: np.ndarray) -> np.ndarray:
+        """
+        Returns one feature row per 10ms hop, shape (frames, CEPSTRA - 1).
+        """
+        if len(samples) < self.frame_length:
+            return np.empty((0, CEPSTRA - 1), dtype=np.float32)
+        frames = np.lib.stride_tricks.sliding_window_view(samples, self.frame_length)[::self.hop_length]
+        power = np.abs(np.fft.rfft(frames * self.window, n=self.n_fft)) ** 2
+        cepstra = np.log(power @ self.filterbank.T + 1e-6) @ self.dct.T
+        cepstra -= cepstra.mean(axis=0)
+        cepstra /= cepstra.std(axis=0) + 1e-6
+        return cepstra.astype(np.float32)
+
+def pcm_samples(pcm) -> np.ndarray:
+    return np.frombuffer(pcm, dtype="<i2").astype(np.float32)
+
+def read_wav_samples(path: str):
+    """
+    Returns (samples, sample_rate) for a 16-bit mono WAV file.
+    """
+    with wave.open(path, "rb") as wav:
+        if wav.getnchannels() != 1 or wav.getsampwidth() != 2:
+            raise ValueError(f"{path}: wake phrase audio must be 16-bit mono")
+        return pcm_samples(wav.readframes(wav.getnframes())), wav.getframerate()
+
+def dtw_distance(template: np.ndarray, features: np.ndarray, max_start: int) -> float:
+    """
+    Average cosine distance along the best alignment of the whole `template` to a stretch
+    of `features` that starts within its first `max_start` frames.
+
+    The steps (1,1), (1,2) and (2,1) let the match run between half and twice the
+    template's speed, and depend only on the previous two template rows, so each row is
+    computed in one vectorized pass over the segment.
+    """
+    if not len(features):
+        return np.inf
+    template = template / (np.linalg.norm(template, axis=1, keepdims=True) + 1e-6)
+    features = features / (np.linalg.norm(features, axis=1, keepdims=True) + 1e-6)
+    distance = 1 - template @ features.T  # (template frames, segment frames)
+
+    inf = np.float32(np.inf)
+    previous = np.where(np.arange(distance.shape[1]) < max_start, distance[0], inf)
+    before_previous = np.full_like(previous, inf)
+    for i in range(1, len(template)):
+        best = np.full_like(previous, inf)
+        best[1:] = previous[:-1]                                               # (1, 1)
+        best[2:] = np.minimum(best[2:], previous[:-2])                         # (1, 2)
+        best[1:] = np.minimum(best[1:], before_previous[:-1] + distance[i - 1, 1:])  # (2, 1)
+        before_previous, previous = previous, distance[i] + best
+    return float(previous.min() / len(template))
+
+class WakePhraseDetector:
+    """
+    Spots the wake phrase locally by matching a segment's opening against a few recorded
+    examples (templates) of it. A segment matches when its DTW distance to the closest
+    template is at most `threshold`: lower thresholds reject more audio.
+
+    The gate only saves uploads; anything it lets through is still checked against the
+    transcript, so the default threshold leans towards accepting.
+    """
+
+    def __init__(self, templates: List[np.ndarray], threshold: float = WAKE_THRESHOLD, sample_rate: int = 16000):
+        if not templates:
+            raise ValueError("At least one wake phrase template is required")
+        self.extract = FeatureExtractor(sample_rate)
+        self.templates = [self.extract(samples) for samples in templates]
+        self.threshold = threshold
+        self.sample_rate = sample_rate
+        self.max_start = MAX_START_MS // HOP_MS
+        longest = max(len(template) for template in self.templates)
+        # Enough audio for the slowest allowed match of the longest template
+        self.head_samples = (self.max_start + 2 * longest) * self.extract.hop_length + self.extract.frame_length
+
+    @classmethod
+    def from_wav_files(cls, paths: Iterable[str], threshold: float = WAKE_THRESHOLD) -> "WakePhraseDetector":
+        templates, sample_rates = [], set()
+        for path in paths:
+            samples, sample_rate = read_wav_samples(path)
+            templates.append(samples)
+            sample_rates.add(sample_rate)
+        if len(sample_rates) > 1:
+            raise ValueError("Wake phrase templates must share one sample rate")
+        return cls(templates, threshold, sample_rates.pop() if sample_rates else 16000)
+
+    def score(self, samples: np.ndarray) -> float:
+        """
+        Distance from the segment's opening to the closest template (lower is closer).
+        """
+        features = self.extract(samples[:self.head_samples])
+        return min(dtw_distance(template, features, self.max_start) for template in self.templates)
+
+    def matches(self, pcm) -> bool:
+        """
+        Checks a segment of 16-bit PCM (bytes or a memoryview); only its opening is read.
+        """
+        return self.score(pcm_samples(pcm[:self.head_samples * 2])) <= self.threshold
+
+def load_wake_detector(templates_dir: Optional[str] = WAKE_TEMPLATES_DIR,
+                       threshold: float = WAKE_THRESHOLD) -> Optional[WakePhraseDetector]:
+    """
+    Builds a detector from every WAV in `templates_dir`, or returns None (gate disabled)
+    if no directory is configured or it holds no recordings.
+    """
+    if not templates_dir:
+        return None
+    paths = sorted(glob.glob(os.path.join(templates_dir, "*.wav")))
+    if not paths:
+        print(f"No wake phrase templates in {templates_dir}; every IDLE utterance will be transcribed.")
+        return None
+    return WakePhraseDetector.from_wav_files(paths, threshold)
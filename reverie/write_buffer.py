@@ -0,0 +1,139 @@
+# reverie/write_buffer.py
+
+import atexit
+import threading
+import time
+from concurrent.futures import Future, wait
+from typing import Callable, Dict, List, Optional
+
+
+class WriteBehindBuffer:
+    """
+    Queues rows in memory and writes them in bulk from a background thread.
+
+    A flush is triggered when `max_rows` rows are pending, when the oldest
+    pending row is `max_age` seconds old, or when the buffer is closed (which
+    also happens automatically at interpreter exit). A single writer thread
+    keeps rows in the order they were queued, and the Future returned by
+    `enqueue` resolves only after that row's batch has been written, so
+    acknowledgements come back in the same order as the inserts.
+
+    A batch whose write fails is kept and retried with exponential backoff (rows
+    queued meanwhile wait behind it); only after `max_retries` retries are its rows
+    dropped, reported and their futures failed.
+    """
+
+    def __init__(self, write_rows: Callable[[List[Dict]], None], max_rows: int = 50, max_age: float = 1.0,
+                 max_retries: int = 5, retry_delay: float = 0.5, max_retry_delay: float = 30.0):
+        self._write_rows = write_rows
+        self.max_rows = max_rows
+        self.max_age = max_age
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self._pending = []  # (row, future) pairs, oldest first
+        self._oldest_time = None
+        self._last_future: Optional[Future] = None
+        self._flush_requested = False
+        self._closed = False
+        self._condition = threading.Condition()
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.rows_failed = 0
+        self.write_retries = 0
+
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def enqueue(self, row: Dict) -> Future:
+        """
+        Queues a row for writing and returns a Future that resolves once it is stored.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError("Cannot enqueue rows on a closed write-behind buffer")
+            if not self._pending:
+                self._oldest_time = time.monotonic()
+            self._pending.append((row, future))
+            self._last_future = future
+            self._condition.notify()
+        return future
+
+    def flush(self, timeout: Optional[float] = None):
+        """
+        Writes everything queued so far and blocks until it has been stored.
+        """
+        with self._condition:
+            last_future = self._last_future
+            self._flush_requested = True
+            self._condition.notify()
+        if last_future is not None:
+            wait([last_future], timeout=timeout)
+
+    def close(self):
+        """
+        Flushes the remaining rows and stops the writer thread. Safe to call more than once.
+        """
+        atexit.unregister(self.close)
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join()
+
+    def pending_count(self) -> int:
+        with self._condition:
+            return len(self._pending)
+
+    def _next_batch(self):
+        with self._condition:
+            while True:
+                if self._closed or self._flush_requested:
+                    break
+                if self._pending:
+                    remaining = self.max_age - (time.monotonic() - self._oldest_time)
+                    if len(self._pending) >= self.max_rows or remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                else:
+                    self._condition.wait()
+
+            batch, self._pending = self._pending, []
+            self._flush_requested = False
+            return batch, self._closed
+
+    def _run(self):
+        while True:
+            batch, closing = self._next_batch()
+            if batch:
+                self._write_batch(batch)
+            if closing:
+                return
+
+    def _write_batch(self, batch):
+        rows = [row for row, _ in batch]
+        for attempt in range(self.max_retries + 1):
+            try:
+                self._write_rows(rows)
+                break
+            except Exception as e:
+                if attempt == self.max_retries:
+                    print(f"ERROR: giving up on {len(rows)} buffered rows after {attempt + 1} failed writes; "
+                          f"they were NOT stored: {e}")
+                    self.rows_failed += len(rows)
+                    for _, future in batch:
+                        future.set_exception(e)
+                    return
+                delay = min(self.max_retry_delay, self.retry_delay * 2 ** attempt)
+                print(f"Error writing {len(rows)} buffered rows, retrying in {delay:.1f}s: {e}")
+                self.write_retries += 1
+                time.sleep(delay)
+
+        self.rows_written += len(rows)
+        self.batches_written += 1
+        for _, future in batch:
+            future.set_result(None)